@@ -1,15 +1,47 @@
-import requests
+"""
+A/B Benchmark: RAG vs Vanilla.
+
+- Case đọc từ file (JSON list hoặc JSONL: {"id", "description"}), mặc định dùng TEST_CASES bên dưới.
+- Các arm (RAG / Vanilla) và case chạy song song (--concurrency), mỗi case lặp lại --repeats lần
+  để có độ lệch chuẩn + khoảng tin cậy 95% của điểm, kèm latency p50/p90/p95.
+- HTTP Session dùng chung connection pool cho mỗi worker thread, có timeout + retry (lỗi kết nối / 429).
+- --stub: chỉ giả lập LLM (server OpenAI-compatible + Gemini giả, không cần API key) rồi tự chạy API thật
+  trỏ vào đó -> retrieval, pre-evaluation, parse JSON... vẫn là pipeline thật, smoke-test được offline.
+
+    uv run python benchmark_ab.py --cases data/ab_cases.jsonl --repeats 3 --concurrency 4
+    uv run python benchmark_ab.py --stub --repeats 5
+"""
+
+import argparse
 import json
-import pandas as pd
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
 from tabulate import tabulate
+from urllib3.util.retry import Retry
 
 # Config
-API_URL_GENERATE = "http://127.0.0.1:8000/generate-srs"
-API_URL_EVALUATE = "http://127.0.0.1:8000/evaluate-srs"
+API_URL = "http://127.0.0.1:8000"
 HEADERS = {"Content-Type": "application/json"}
+ARMS = {"RAG": True, "Vanilla": False}
+RESULTS_FILE = "benchmark_results.csv"
+SUMMARY_FILE = "benchmark_ab_summary.json"
+STUB_API_STARTUP_TIMEOUT = 300  # API thật nạp embedding / reranker model lúc khởi động
 
-# Test Cases: Các kịch bản cần so sánh
+# Test Cases mặc định: Các kịch bản cần so sánh
 TEST_CASES = [
     {
         "id": "TC01",
@@ -21,103 +53,311 @@ TEST_CASES = [
     }
 ]
 
-def call_generate(project_desc, use_rag):
-    try:
-        start = time.time()
-        payload = {"project_description": project_desc, "use_rag": use_rag}
-        resp = requests.post(API_URL_GENERATE, json=payload, headers=HEADERS)
+# Student t (2 phía, 95%) theo bậc tự do: repeats nhỏ thì 1.96 đánh giá thấp độ bất định
+_T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+        10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 30: 2.042}
+
+# Quality Score: chỉ 4 tiêu chí chung (bỏ Faithfulness) -> so sánh công bằng RAG vs Vanilla
+SHARED_CRITERIA = ("completeness", "consistency", "accuracy", "format_tone")
+SHARED_WEIGHT = 0.8  # 0.25 + 0.2 + 0.2 + 0.15
+
+
+def load_cases(path: Optional[str]) -> List[Dict[str, str]]:
+    if not path:
+        return TEST_CASES
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            cases = [json.loads(line) for line in f if line.strip()]
+        else:
+            cases = json.load(f)
+    for i, case in enumerate(cases):
+        case.setdefault("id", f"TC{i + 1:02d}")
+    return cases
+
+
+class ApiClient:
+    """
+    Mỗi thread 1 requests.Session (Session không thread-safe) với connection pool + Retry.
+    Chỉ retry khi request chắc chắn chưa được xử lý (lỗi kết nối, 429): mỗi POST là 1 lượt gọi LLM,
+    5xx / timeout đọc có thể đã sinh xong ở server -> retry sẽ gọi LLM lần nữa và làm lệch latency.
+    """
+
+    def __init__(self, base_url: str, timeout: float, retries: int, pool_size: int):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            retry = Retry(total=self.retries, read=0, backoff_factor=1.0, status_forcelist=(429,),
+                          allowed_methods=frozenset({"POST"}), respect_retry_after_header=True,
+                          raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+            session = self._local.session = requests.Session()
+            session.headers.update(HEADERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+    def post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        resp = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
         resp.raise_for_status()
-        data = resp.json()
-        duration = time.time() - start
-        return data.get("srs_content"), data.get("rag_context"), duration
-    except Exception as e:
-        print(f"Error Generate (RAG={use_rag}): {e}")
-        return None, None, 0
+        return resp.json()
+
 
-def call_evaluate(srs_content, rag_context=None):
+def quality_score(evaluation: Dict[str, Any]) -> float:
+    score = evaluation.get("score", {})
+    return sum((score.get(c) or {}).get("weighted", 0) for c in SHARED_CRITERIA) / SHARED_WEIGHT
+
+
+def run_once(client: ApiClient, case: Dict[str, str], arm: str, repeat: int) -> Dict[str, Any]:
+    """1 lần chạy: generate -> evaluate (bắt buộc chấm LLM, bỏ qua pre-evaluation gate)."""
+    row = {"Case ID": case["id"], "Mode": arm, "Repeat": repeat, "Error": None}
     try:
-        payload = {"srs_content": srs_content, "rag_context": rag_context}
-        resp = requests.post(API_URL_EVALUATE, json=payload, headers=HEADERS)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("evaluation_result", {})
-    except Exception as e:
-        print(f"Error Evaluate: {e}")
-        return {}
-
-def run_benchmark():
-    print("🚀 Starting A/B Testing: RAG vs. Vanilla Mode...\n")
-    results = []
-
-    for case in TEST_CASES:
-        desc = case["description"]
-        cid = case["id"]
-        print(f"🧪 Processing Case [{cid}]: {desc[:50]}...")
-
-        # 1. Run RAG
-        print(f"   ► Running RAG Mode...")
-        srs_rag, ctx_rag, time_rag = call_generate(desc, True)
-        eval_rag = call_evaluate(srs_rag, ctx_rag)
-        
-        # 2. Run Vanilla (No RAG)
-        print(f"   ► Running Vanilla Mode...")
-        srs_van, _, time_van = call_generate(desc, False)
-        eval_van = call_evaluate(srs_van, None)
-
-        # Helper to extract raw scores
-        def get_raw(data, key): return data.get("score", {}).get(key, {}).get("raw", 0)
-        
-        # Calculate Quality Score (Normalized on 4 shared criteria: Completeness, Consistency, Accuracy, Format)
-        # Weights normalized: 0.25+0.2+0.2+0.15 = 0.8
-        # Quality = (Comp*0.25 + Cons*0.2 + Acc*0.2 + Fmt*0.15) / 0.8
-        def calc_quality(data):
-            score_obj = data.get("score", {})
-            raw_sum = (
-                score_obj.get("completeness", {}).get("weighted", 0) + 
-                score_obj.get("consistency", {}).get("weighted", 0) +
-                score_obj.get("accuracy", {}).get("weighted", 0) +
-                score_obj.get("format_tone", {}).get("weighted", 0)
-            )
-            return raw_sum / 0.8
-
-        qual_rag = calc_quality(eval_rag)
-        qual_van = calc_quality(eval_van)
-        total_rag = eval_rag.get("score", {}).get("total_weighted_score", 0)
-        total_van = eval_van.get("score", {}).get("total_weighted_score", 0)
-
-        # 3. Log Result
-        print(f"   🏁 Result: RAG (Quality={qual_rag:.2f}, Total={total_rag:.2f}) | Vanilla (Quality={qual_van:.2f}, Total={total_van:.2f})")
-        print("-" * 60)
-
-        results.append({
-            "Case ID": cid,
-            "Mode": "RAG",
-            "Time (s)": round(time_rag, 2),
-            "Total Score": total_rag,
-            "Quality Score (Shared)": round(qual_rag, 2),
-            "Faithfulness": get_raw(eval_rag, "faithfulness"),
-            "Accuracy": get_raw(eval_rag, "accuracy"),
-            "Completeness": get_raw(eval_rag, "completeness")
+        start = time.perf_counter()
+        generated = client.post("/generate-srs", {"project_description": case["description"], "use_rag": ARMS[arm]})
+        row["Time (s)"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        evaluated = client.post("/evaluate-srs", {
+            "srs_content": generated.get("srs_content"),
+            "rag_context": generated.get("rag_context") if ARMS[arm] else None,
+            "force_evaluation": True,
         })
-        results.append({
-            "Case ID": cid,
-            "Mode": "Vanilla",
-            "Time (s)": round(time_van, 2),
-            "Total Score": total_van,
-            "Quality Score (Shared)": round(qual_van, 2),
-            "Faithfulness": "N/A (Def 8.0)",
-            "Accuracy": get_raw(eval_van, "accuracy"),
-            "Completeness": get_raw(eval_van, "completeness")
+        row["Eval Time (s)"] = round(time.perf_counter() - start, 3)
+    except Exception as e:
+        row["Error"] = str(e)
+        return row
+
+    evaluation = evaluated.get("evaluation_result") or {}
+    score = evaluation.get("score", {})
+    row.update({
+        "Total Score": score.get("total_weighted_score"),
+        "Quality Score (Shared)": round(quality_score(evaluation), 2),
+        "Faithfulness": (score.get("faithfulness") or {}).get("raw") if ARMS[arm] else None,
+        "Accuracy": (score.get("accuracy") or {}).get("raw"),
+        "Completeness": (score.get("completeness") or {}).get("raw"),
+    })
+    return row
+
+
+def mean_ci(values: List[float]) -> Dict[str, Optional[float]]:
+    """Mean, độ lệch chuẩn mẫu và nửa độ rộng khoảng tin cậy 95% (Student t)."""
+    arr = np.asarray([v for v in values if v is not None and not pd.isna(v)], dtype=float)
+    if arr.size == 0:
+        return {"mean": None, "std": None, "ci95": None, "n": 0}
+    if arr.size == 1:
+        return {"mean": float(arr[0]), "std": None, "ci95": None, "n": 1}
+    df = arr.size - 1
+    t = _T95[max(k for k in _T95 if k <= df)]
+    std = float(arr.std(ddof=1))
+    return {"mean": float(arr.mean()), "std": std, "ci95": t * std / np.sqrt(arr.size), "n": int(arr.size)}
+
+
+def latency_percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    arr = np.asarray([v for v in values if v is not None and not pd.isna(v)], dtype=float)
+    if arr.size == 0:
+        return {"p50": None, "p90": None, "p95": None, "max": None}
+    p50, p90, p95 = np.percentile(arr, [50, 90, 95])
+    return {"p50": float(p50), "p90": float(p90), "p95": float(p95), "max": float(arr.max())}
+
+
+def summarize(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Gộp theo (case, arm) và theo arm (case = "ALL")."""
+    groups = [(cid, arm, g) for (cid, arm), g in df.groupby(["Case ID", "Mode"], sort=True)]
+    groups += [("ALL", arm, g) for arm, g in df.groupby("Mode", sort=True)]
+    summary = []
+    for cid, arm, g in groups:
+        ok = g[g["Error"].isna()]
+        summary.append({
+            "case": cid,
+            "arm": arm,
+            "runs": int(len(g)),
+            "errors": int(g["Error"].notna().sum()),
+            "total_score": mean_ci(ok["Total Score"].tolist()),
+            "quality_score": mean_ci(ok["Quality Score (Shared)"].tolist()),
+            "generate_latency": latency_percentiles(ok["Time (s)"].tolist()),
+            "evaluate_latency": latency_percentiles(ok["Eval Time (s)"].tolist()),
         })
+    return summary
+
+
+def _fmt(stat: Dict[str, Optional[float]]) -> str:
+    if stat["mean"] is None:
+        return "-"
+    return f"{stat['mean']:.2f}" + (f" ± {stat['ci95']:.2f}" if stat["ci95"] is not None else "")
+
+
+def _fmt_latency(stat: Dict[str, Optional[float]]) -> str:
+    return "-" if stat["p50"] is None else f"{stat['p50']:.2f} / {stat['p95']:.2f}"
+
+
+# ---- Stub LLM: giả lập OpenAI chat completions (generate) + Gemini generateContent (evaluate) ----
+
+def _stub_evaluation(use_rag: bool, rng: random.Random) -> Dict[str, Any]:
+    weights = {"completeness": 0.25, "consistency": 0.2, "accuracy": 0.2, "format_tone": 0.15, "faithfulness": 0.2}
+    base = 7.5 if use_rag else 6.5
+    score = {}
+    for criterion, weight in weights.items():
+        raw = 8.0 if criterion == "faithfulness" and not use_rag else round(min(10.0, rng.gauss(base, 0.6)), 1)
+        score[criterion] = {"raw": raw, "weight": weight, "weighted": round(raw * weight, 3)}
+    score["total_weighted_score"] = round(sum(item["weighted"] for item in score.values()), 2)
+    return {"score": score, "group": "Tốt", "comment": {"summary": "stub", "strengths": [], "issues": [], "quick_fixes": []}}
+
+
+def _stub_srs(prompt: str) -> str:
+    return (f"# SRS (stub)\n\n## 1. Giới thiệu\n{prompt}\n\n## 2. Mô tả tổng quan\n"
+            "```mermaid\ngraph TD\n  A[Nhập kho] --> B[Putaway]\n```\n")
+
+
+def start_stub_llm(latency: float, seed: int = 0) -> ThreadingHTTPServer:
+    """Server LLM giả: API thật gọi vào qua LLM_BASE_URL (`{url}/v1`) và GEMINI_API_ENDPOINT (`{url}`)."""
+    rng, lock = random.Random(seed), threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with lock:
+                jitter = rng.uniform(0.5, 1.5)
+                if self.path.endswith("/chat/completions"):
+                    messages = payload.get("messages") or [{}]
+                    body = {"id": "stub", "object": "chat.completion", "created": int(time.time()),
+                            "model": payload.get("model", "stub"),
+                            "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                                "role": "assistant", "content": _stub_srs(messages[-1].get("content", ""))}}],
+                            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}
+                elif re.search(r"/models/[^/]+:generateContent$", self.path):
+                    prompt = " ".join(part.get("text", "") for content in payload.get("contents", [])
+                                      for part in content.get("parts", []))
+                    # Context RAG có dạng [DOCUMENT i] (xem SRSGenerator); Vanilla không có
+                    text = json.dumps(_stub_evaluation("[DOCUMENT" in prompt, rng), ensure_ascii=False)
+                    body = {"candidates": [{"index": 0, "finishReason": "STOP",
+                                            "content": {"role": "model", "parts": [{"text": text}]}}]}
+                else:
+                    body = None
+            if body is None:
+                self.send_error(404)
+                return
+            time.sleep(latency * jitter)  # LLM giả: latency dao động quanh `latency`
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_api(llm_url: str) -> tuple:
+    """Chạy API thật (uvicorn, process con) với LLM trỏ sang `llm_url`. Trả về (process, base_url) khi /health OK."""
+    port = _free_port()
+    env = dict(os.environ, LLM_BASE_URL=f"{llm_url}/v1", GEMINI_API_ENDPOINT=llm_url, EVAL_MODE="full", EVAL_CACHE_PATH="")
+    env.setdefault("HF_TOKEN", "stub")
+    env.setdefault("GEMINI_API_KEY", "stub")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"),
+                                                      env.get("PYTHONPATH")]))
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                             "--port", str(port), "--log-level", "warning"], env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + STUB_API_STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API server exited with code {proc.returncode} during startup")
+        try:
+            if requests.get(f"{base_url}/health", timeout=2).ok:
+                return proc, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError(f"API server not ready after {STUB_API_STARTUP_TIMEOUT}s")
+
+
+def run_benchmark(args):
+    cases = load_cases(args.cases)
+    wanted = {x.strip().lower() for x in args.arms.split(",")}
+    arms = [arm for arm in ARMS if arm.lower() in wanted]
+    base_url, server, api_proc = args.api, None, None
+    if args.stub:
+        server = start_stub_llm(args.stub_latency)
+        api_proc, base_url = start_stub_api(f"http://127.0.0.1:{server.server_address[1]}")
+
+    jobs = [(case, arm, r) for r in range(args.repeats) for case in cases for arm in arms]
+    print(f"🚀 Starting A/B Testing: {' vs. '.join(arms)} | {len(cases)} cases x {args.repeats} repeats "
+          f"= {len(jobs)} runs, concurrency={args.concurrency}{' (stub)' if args.stub else ''}\n")
+
+    client = ApiClient(base_url, timeout=args.timeout, retries=args.retries, pool_size=args.concurrency)
+    rows = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_once, client, case, arm, r) for case, arm, r in jobs]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            status = f"error: {row['Error']}" if row["Error"] else \
+                f"Total={row['Total Score']}, Quality={row['Quality Score (Shared)']}, {row['Time (s)']}s"
+            print(f"   ► [{row['Case ID']}] {row['Mode']} #{row['Repeat']}: {status}")
+    wall = time.perf_counter() - start
+    if api_proc:
+        api_proc.terminate()
+        api_proc.wait()
+    if server:
+        server.shutdown()
+
+    columns = ["Case ID", "Mode", "Repeat", "Time (s)", "Eval Time (s)", "Total Score", "Quality Score (Shared)",
+               "Faithfulness", "Accuracy", "Completeness", "Error"]
+    df = pd.DataFrame(rows).reindex(columns=columns).sort_values(["Case ID", "Mode", "Repeat"])
+    summary = summarize(df)
+
+    table = [{
+        "Case": s["case"], "Mode": s["arm"], "Runs": s["runs"], "Errors": s["errors"],
+        "Total Score (95% CI)": _fmt(s["total_score"]),
+        "Quality (95% CI)": _fmt(s["quality_score"]),
+        "Gen p50/p95 (s)": _fmt_latency(s["generate_latency"]),
+        "Eval p50/p95 (s)": _fmt_latency(s["evaluate_latency"]),
+    } for s in summary]
+    print("\n📊 BENCHMARK SUMMARY (Quality Score = Apples-to-Apples comparison excluding Faithfulness):")
+    print(tabulate(table, headers="keys", tablefmt="grid"))
+    print(f"\n⏱️ Wall time: {wall:.1f}s for {len(jobs)} runs")
+
+    df.to_csv(args.output, index=False)
+    with open(args.summary, "w", encoding="utf-8") as f:
+        json.dump({"wall_seconds": wall, "concurrency": args.concurrency, "repeats": args.repeats,
+                   "stub": args.stub, "summary": summary}, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Results saved to '{args.output}' and '{args.summary}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent RAG vs Vanilla A/B benchmark")
+    parser.add_argument("--cases", default=os.getenv("AB_CASES_FILE"), help="JSON/JSONL file of {id, description}")
+    parser.add_argument("--api", default=API_URL)
+    parser.add_argument("--arms", default="rag,vanilla")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=600, help="Per-request timeout (seconds)")
+    parser.add_argument("--retries", type=int, default=2, help="Retries on connection errors / 429 (never on 5xx)")
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--summary", default=SUMMARY_FILE)
+    parser.add_argument("--stub", action="store_true", help="Start the API with a stub LLM (no API keys / LLM calls)")
+    parser.add_argument("--stub-latency", type=float, default=0.2, help="Mean stub LLM latency per call (seconds)")
+    run_benchmark(parser.parse_args())
 
-    # Output Summary
-    df = pd.DataFrame(results)
-    print("\n📊 BENCHMARK SUMMARY (Quality Score = Appples-to-Apples comparison excluding Faithfulness):")
-    print(tabulate(df, headers="keys", tablefmt="grid"))
-    
-    # Save to CSV
-    df.to_csv("benchmark_results.csv", index=False)
-    print("\n✅ Results saved to 'benchmark_results.csv'")
 
 if __name__ == "__main__":
-    run_benchmark()
+    main()
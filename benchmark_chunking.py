@@ -0,0 +1,135 @@
+"""
+So sánh các chiến lược chunking (token_chunking.STRATEGIES) trên Knowledge Base thật:
+số chunk, phân bố độ dài theo token (bao nhiêu chunk bị embedder cắt cụt ở 128 token), chi phí overlap,
+thời gian embed, kích thước index và chất lượng retrieval (vector-only, mức source vì chunk id khác nhau giữa các chiến lược).
+
+    uv run python benchmark_chunking.py --data-dir "./data/AI Knowledge Base WMS"
+    uv run python benchmark_chunking.py --no-embed      # chỉ thống kê chunk, không load model
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+from src.app.services.rag_indexer import iter_source_files
+from src.app.services.token_chunking import (
+    EMBEDDER_MAX_TOKENS, EMBEDDER_TEXT_TOKENS, RERANKER_MAX_TOKENS, STRATEGIES, ChunkingConfig, chunk_document,
+    load_token_counter,
+)
+
+DATA_DIR = "./data/AI Knowledge Base WMS"
+TESTSET_FILE = "./data/synthetic_testset.json"
+OUTPUT_FILE = "benchmark_chunking.json"
+EMBED_BATCH = 64
+
+
+def load_corpus(data_dir: str):
+    docs = []
+    for file_path, rel_name in iter_source_files(data_dir, include=["*.md", "*.txt"]):
+        with open(file_path, "r", encoding="utf-8") as f:
+            docs.append((f.read(), {"filename": rel_name, "path": file_path}))
+    return docs
+
+
+def chunk_stats(docs, config: ChunkingConfig, count) -> dict:
+    start = time.perf_counter()
+    chunks = [c for text, meta in docs for c in chunk_document(text, meta, config, count)]
+    chunk_s = time.perf_counter() - start
+    tokens = np.array([count(content) for content, _ in chunks])
+    corpus_tokens = sum(count(text) for text, _ in docs)
+    return {
+        "chunks": chunks,
+        "row": {
+            "strategy": config.strategy,
+            "chunks": len(chunks),
+            "chunk_s": round(chunk_s, 3),
+            "tokens_mean": round(float(tokens.mean()), 1) if len(tokens) else 0,
+            "tokens_p95": int(np.percentile(tokens, 95)) if len(tokens) else 0,
+            "tokens_max": int(tokens.max()) if len(tokens) else 0,
+            # Embedder chỉ đọc EMBEDDER_MAX_TOKENS token đầu (gồm [CLS]/[SEP]): phần còn lại không được embed
+            f"over_{EMBEDDER_MAX_TOKENS}_pct": round(100 * float((tokens > EMBEDDER_TEXT_TOKENS).mean()), 1) if len(tokens) else 0,
+            "truncated_tokens_pct": round(100 * float(np.clip(tokens - EMBEDDER_TEXT_TOKENS, 0, None).sum())
+                                          / max(int(tokens.sum()), 1), 1),
+            f"over_{RERANKER_MAX_TOKENS}": int((tokens > RERANKER_MAX_TOKENS).sum()),
+            # Token được embed nhiều lần do overlap
+            "overlap_overhead_pct": round(100 * (int(tokens.sum()) / max(corpus_tokens, 1) - 1), 1),
+        },
+    }
+
+
+def embed_all(embedding_fn, texts):
+    vectors = []
+    for i in range(0, len(texts), EMBED_BATCH):
+        vectors.extend(embedding_fn(texts[i:i + EMBED_BATCH]))
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def retrieval_quality(chunk_vectors, chunks, query_vectors, dataset, top_k: int) -> dict:
+    """Hit Rate / MRR mức source (vector-only, cosine trên toàn bộ chunk)."""
+    sources = [meta["source"] for _, meta in chunks]
+    top = np.argsort(-(query_vectors @ chunk_vectors.T), axis=1)[:, :top_k]
+    ranks = []
+    for item, row in zip(dataset, top):
+        rank = next((i + 1 for i, idx in enumerate(row) if item["ground_truth_source"] in sources[idx]), None)
+        ranks.append(1 / rank if rank else 0.0)
+    return {f"hit@{top_k}": round(float(np.mean(np.array(ranks) > 0)), 4), f"mrr@{top_k}": round(float(np.mean(ranks)), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh chiến lược chunking: kích thước index, thời gian embed, chất lượng.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=list(STRATEGIES))
+    parser.add_argument("--max-tokens", type=int, default=EMBEDDER_TEXT_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=16)
+    parser.add_argument("--testset", default=TESTSET_FILE)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--no-embed", action="store_true", help="Chỉ thống kê chunk (không load embedding model)")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    docs = load_corpus(args.data_dir)
+    if not docs:
+        print(f"❌ No documents found in {args.data_dir}")
+        return
+    count = load_token_counter()
+    print(f"🚀 Chunking benchmark | {len(docs)} files | strategies={args.strategies}")
+
+    embedding_fn, dataset, query_vectors = None, [], None
+    if not args.no_embed:
+        from src.app.services.rag_retriever import load_embedding_function
+        embedding_fn = load_embedding_function("cpu")
+        if os.path.exists(args.testset):
+            with open(args.testset, "r", encoding="utf-8") as f:
+                dataset = json.load(f)
+            query_vectors = embed_all(embedding_fn, [item["question"] for item in dataset])
+
+    rows = []
+    for strategy in args.strategies:
+        config = ChunkingConfig(strategy=strategy, max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens)
+        result = chunk_stats(docs, config, count)
+        row, chunks = result["row"], result["chunks"]
+        if embedding_fn is not None:
+            start = time.perf_counter()
+            vectors = embed_all(embedding_fn, [content for content, _ in chunks])
+            row["embed_s"] = round(time.perf_counter() - start, 2)
+            row["index_mb"] = round((vectors.nbytes + sum(len(c.encode("utf-8")) for c, _ in chunks)) / 2 ** 20, 2)
+            if dataset:
+                row.update(retrieval_quality(vectors, chunks, query_vectors, dataset, args.top_k))
+        rows.append(row)
+        print(f"   ✅ {strategy}: {row['chunks']} chunks")
+
+    print("\n📊 CHUNKING BENCHMARK SUMMARY:")
+    print(tabulate(rows, headers="keys", tablefmt="github"))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "data_dir": args.data_dir,
+                   "queries": len(dataset), "results": rows}, f, indent=2)
+    print(f"✅ Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import numpy as np
 import time
 from tqdm import tqdm
 from src.app.services.rag_retriever import RAGRetriever
+from src.app.services.retrieval_eval import check_chunk_targets, first_hit_rank, targets_for
 from src.app.utils.logger import logger
 
 # Config
@@ -12,42 +13,43 @@ TOP_K = 5
 def calculate_metrics(retriever, dataset):
     hits = 0
     reciprocal_ranks = []
+    chunk_reciprocal_ranks = [] # Chỉ với testset có ground_truth_chunk_ids (generate_testset.py mới)
     total_time = 0
     
     print(f"🔍 Benchmarking Retrieval Model with {len(dataset)} queries...")
     
     for item in tqdm(dataset, desc="Retrieving"):
         query = item['question']
-        target_source = item['ground_truth_source']
         
         start = time.time()
         # Retrieve results
         results = retriever.retrieve(query, top_k=TOP_K, rerank=True)
         total_time += (time.time() - start)
         
-        # Check for Hit
-        found = False
-        rank = 0
-        
-        for i, doc in enumerate(results):
-            # Check if source filename matches
-            # Note: doc['metadata']['source'] might be full path, need to check basename logic
-            retrieved_source = doc['metadata'].get('source', '')
-            if target_source in retrieved_source: # Loose match to handle paths
-                hits += 1
-                reciprocal_ranks.append(1 / (i + 1))
-                found = True
-                break
-        
-        if not found:
-            reciprocal_ranks.append(0)
+        # Check for Hit (so khớp source lỏng vì metadata source có thể là đường dẫn, xem retrieval_eval)
+        rank = first_hit_rank(results, item, "source")
+        if rank:
+            hits += 1
+        reciprocal_ranks.append(1 / rank if rank else 0)
+
+        # Chunk-level: đúng chunk chứa câu trả lời (chặt hơn đúng file)
+        if targets_for(item, 'chunk'):
+            rank = first_hit_rank(results, item, "chunk")
+            chunk_reciprocal_ranks.append(1 / rank if rank else 0)
 
     # Calculate final metrics
     hit_rate = hits / len(dataset)
     mrr = np.mean(reciprocal_ranks)
     avg_latency = total_time / len(dataset)
+    chunk_metrics = None
+    if chunk_reciprocal_ranks:
+        chunk_metrics = {
+            "chunk_hit_rate": float(np.mean(np.array(chunk_reciprocal_ranks) > 0)),
+            "chunk_mrr": float(np.mean(chunk_reciprocal_ranks)),
+            "chunk_queries": len(chunk_reciprocal_ranks),
+        }
     
-    return hit_rate, mrr, avg_latency
+    return hit_rate, mrr, avg_latency, chunk_metrics
 
 def main():
     # Load Testset
@@ -61,9 +63,14 @@ def main():
     # Init Retriever
     # Setting persist_path same as app default
     retriever = RAGRetriever(persist_path="./rag_db_test")
+    try:
+        check_chunk_targets(dataset, retriever.chunks.row_of)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
     
     # Run Benchmark
-    hit_rate, mrr, latency = calculate_metrics(retriever, dataset)
+    hit_rate, mrr, latency, chunk_metrics = calculate_metrics(retriever, dataset)
     
     print("\n" + "="*40)
     print("📊 RETRIEVAL BENCHMARK RESULTS")
@@ -74,6 +81,9 @@ def main():
     print(f"🎯 Hit Rate:       {hit_rate:.2%}")
     print(f"🥇 MRR:            {mrr:.4f}")
     print(f"⏱️ Avg Latency:    {latency:.4f}s")
+    if chunk_metrics:
+        print(f"🧩 Chunk Hit Rate: {chunk_metrics['chunk_hit_rate']:.2%}")
+        print(f"🧩 Chunk MRR:      {chunk_metrics['chunk_mrr']:.4f}")
     print("="*40)
     
     # Save results for Streamlit
@@ -83,6 +93,7 @@ def main():
         "avg_latency": latency,
         "total_queries": len(dataset),
         "top_k": TOP_K,
+        **(chunk_metrics or {}),
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
     }
     with open("benchmark_retrieval.json", "w") as f:
@@ -0,0 +1,133 @@
+"""
+Sweep tham số retrieval offline: thu thập ứng viên 1 lần (chậm), replay hàng trăm biến thể fusion/rerank bằng NumPy (nhanh).
+
+    uv run python benchmark_retrieval_sweep.py collect --depth 50 --level chunk
+    uv run python benchmark_retrieval_sweep.py sweep --methods rrf score convex --vector-weights 0.5 1 --rrf-ks 20 60
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+
+from tabulate import tabulate
+from tqdm import tqdm
+
+from src.app.services.retrieval_eval import (
+    DEFAULT_KS, CandidateSet, check_chunk_targets, collect_candidates, dataset_fingerprint, sweep, variant_grid,
+)
+
+TESTSET_FILE = "./data/synthetic_testset.json"
+CANDIDATES_FILE = "./data/retrieval_candidates.npz"
+OUTPUT_FILE = "benchmark_retrieval_sweep"
+
+
+def _str2bool(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def collect(args):
+    with open(args.testset, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+    if args.level == "chunk":
+        dataset = [item for item in dataset if item.get("ground_truth_chunk_ids")]
+        if not dataset:
+            print("❌ Testset has no ground_truth_chunk_ids. Re-run generate_testset.py or use --level source.")
+            return
+
+    from src.app.services.rag_retriever import RAGRetriever  # Load model chỉ khi collect
+    kwargs = {"collection_name": args.collection} if args.collection else {}
+    retriever = RAGRetriever(persist_path=args.db_path, **kwargs)
+    if args.level == "chunk":
+        try:
+            check_chunk_targets(dataset, retriever.chunks.row_of)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+
+    fingerprint = dataset_fingerprint(dataset, args.level, args.depth, extra=retriever.chunks.digest)
+    if os.path.exists(args.candidates) and not args.force:
+        cached = CandidateSet.load(args.candidates)
+        if cached.meta.get("fingerprint") == fingerprint:
+            print(f"✅ Candidates up to date ({cached.num_queries} queries): {args.candidates}")
+            return
+
+    start = time.perf_counter()
+    cands = collect_candidates(retriever, dataset, depth=args.depth, level=args.level,
+                               progress=lambda items: tqdm(items, desc="Collecting"))
+    cands.meta.update({"fingerprint": fingerprint, "collection": retriever.collection_name,
+                       "testset": args.testset, "created_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+    os.makedirs(os.path.dirname(os.path.abspath(args.candidates)), exist_ok=True)
+    cands.save(args.candidates)
+    print(f"✅ {cands.num_queries} queries x {cands.valid.shape[1]} candidate slots "
+          f"in {time.perf_counter() - start:.1f}s -> {args.candidates}")
+
+
+def run_sweep(args):
+    if not os.path.exists(args.candidates):
+        print(f"❌ {args.candidates} not found. Run the 'collect' subcommand first!")
+        return
+    cands = CandidateSet.load(args.candidates)
+    variants = variant_grid(args.methods, args.vector_weights, args.keyword_weights, args.rrf_ks,
+                            args.normalizations, args.pools, args.rerank)
+    top_k = max(args.ks)
+    if 2 * top_k > cands.meta["depth"]:
+        print(f"⚠️ top_k={top_k} needs depth >= {2 * top_k} per branch (collected: {cands.meta['depth']}).")
+
+    start = time.perf_counter()
+    rows = sweep(cands, variants, top_k=top_k, ks=args.ks)
+    elapsed = time.perf_counter() - start
+    rows.sort(key=lambda r: r.get(f"{args.sort_by}", 0.0), reverse=True)
+
+    metric_cols = [f"{m}@{k}" for k in args.ks for m in ("hit", "mrr", "ndcg", "recall")]
+    table = [{**{k: v for k, v in r.items() if k not in metric_cols},
+              **{c: f"{r[c]:.4f}" for c in metric_cols if c in r}} for r in rows[:args.show]]
+    print(f"\n📊 {len(rows)} variants x {cands.num_queries} queries ({cands.meta['level']} level) "
+          f"in {elapsed * 1000:.0f} ms, sorted by {args.sort_by}")
+    print(tabulate(table, headers="keys", tablefmt="github"))
+
+    with open(f"{args.output}.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(f"{args.output}.json", "w", encoding="utf-8") as f:
+        json.dump({"meta": {k: v for k, v in cands.meta.items() if k != "queries"},
+                   "elapsed_ms": round(elapsed * 1000, 2), "results": rows}, f, indent=2, ensure_ascii=False)
+    print(f"✅ Results saved to '{args.output}.csv' / '{args.output}.json'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval evaluation với tập ứng viên cache sẵn.")
+    parser.add_argument("--candidates", default=CANDIDATES_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_collect = sub.add_parser("collect", help="Chạy Vector + BM25 + Cross-Encoder 1 lần, lưu ứng viên ra .npz")
+    p_collect.add_argument("--testset", default=TESTSET_FILE)
+    p_collect.add_argument("--db-path", default="./rag_db_test")
+    p_collect.add_argument("--collection", default=None)
+    p_collect.add_argument("--depth", type=int, default=50, help="Số kết quả mỗi nhánh (>= 2 * top_k lớn nhất)")
+    p_collect.add_argument("--level", choices=["chunk", "source"], default="chunk")
+    p_collect.add_argument("--force", action="store_true", help="Thu thập lại kể cả khi cache còn khớp")
+    p_collect.set_defaults(func=collect)
+
+    p_sweep = sub.add_parser("sweep", help="Replay lưới tham số trên ứng viên đã cache")
+    p_sweep.add_argument("--methods", nargs="+", default=["rrf", "score", "convex"], choices=["rrf", "score", "convex"])
+    p_sweep.add_argument("--vector-weights", type=float, nargs="+", default=[1.0])
+    p_sweep.add_argument("--keyword-weights", type=float, nargs="+", default=[1.0])
+    p_sweep.add_argument("--rrf-ks", type=int, nargs="+", default=[60])
+    p_sweep.add_argument("--normalizations", nargs="+", default=["minmax", "zscore"], choices=["minmax", "zscore"])
+    p_sweep.add_argument("--pools", type=int, nargs="+", default=[None], help="Số ứng viên đưa vào rerank (mặc định 3 * top_k)")
+    p_sweep.add_argument("--rerank", type=_str2bool, nargs="+", default=[True, False])
+    p_sweep.add_argument("--ks", type=int, nargs="+", default=list(DEFAULT_KS))
+    p_sweep.add_argument("--sort-by", default="mrr@5")
+    p_sweep.add_argument("--show", type=int, default=20, help="Số dòng in ra màn hình")
+    p_sweep.add_argument("--output", default=OUTPUT_FILE)
+    p_sweep.set_defaults(func=run_sweep)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
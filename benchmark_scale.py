@@ -0,0 +1,236 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from queue import Empty
+
+import numpy as np
+from tabulate import tabulate
+
+# Config
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]  # Số chunk mục tiêu cho mỗi mức
+SECTIONS_PER_DOC = 20                          # Mỗi section "##" ~ 1 chunk (ngắn hơn chunk_size=1000)
+SECTION_CHARS = 700
+NUM_QUERIES = 50
+OUTPUT_FILE = "benchmark_scale.json"
+RESULT_POLL_S = 5                              # Chu kỳ kiểm tra process con còn sống khi chờ kết quả
+
+# Từ vựng "giống tiếng Việt" + thuật ngữ WMS để BM25/Embedding có dữ liệu thực tế
+SYLLABLES = [
+    "quản", "lý", "kho", "hàng", "nhập", "xuất", "phiếu", "mã", "sản", "phẩm", "quy", "tắc",
+    "trình", "kiểm", "kê", "vị", "trí", "lô", "hạn", "dùng", "người", "duyệt", "đơn", "vận",
+    "chuyển", "nhà", "cung", "cấp", "khách", "báo", "cáo", "tồn", "điều", "chỉnh", "hệ", "thống",
+    "dữ", "liệu", "bảo", "mật", "hiệu", "năng", "phân", "quyền", "trạng", "thái", "xác", "nhận",
+]
+DOMAIN_TERMS = ["SKU", "FIFO", "FEFO", "PO", "ASN", "Putaway", "Picking", "Packing", "GSP", "Barcode"]
+CATEGORIES = ["Inbound", "Outbound", "Inventory", "Master Data", "Report", "Security"]
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(SYLLABLES) for _ in range(rng.randint(8, 16))]
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), rng.choice(DOMAIN_TERMS))
+    if rng.random() < 0.1:
+        words.append(f"SKU-{rng.randint(0, 99999):05d}")
+    return " ".join(words).capitalize() + "."
+
+
+def _section(rng: random.Random, doc_no: int, sec_no: int) -> str:
+    category = rng.choice(CATEGORIES)
+    lines = [f"## {category} {doc_no}.{sec_no}: Quy tắc {rng.choice(SYLLABLES)} {rng.choice(SYLLABLES)}", ""]
+    body = []
+    while sum(len(s) + 1 for s in body) < SECTION_CHARS:
+        body.append(_sentence(rng))
+    lines.append(" ".join(body))
+    if rng.random() < 0.2:
+        lines += ["", "| Mã | Mô tả |", "|---|---|", f"| {category[:3].upper()}-BR-{sec_no:02d} | {_sentence(rng)} |"]
+    return "\n".join(lines)
+
+
+def generate_corpus(folder: str, target_chunks: int, seed: int = 42) -> int:
+    """Sinh tài liệu Markdown tổng hợp, trả về số file đã ghi."""
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    num_docs = max(1, target_chunks // SECTIONS_PER_DOC)
+    for doc_no in range(num_docs):
+        sections = [_section(rng, doc_no, s) for s in range(SECTIONS_PER_DOC)]
+        with open(os.path.join(folder, f"SYN_{doc_no:06d}.md"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(sections))
+    return num_docs
+
+
+def generate_queries(n: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n):
+        if i % 5 == 0:
+            queries.append(f"SKU-{rng.randint(0, 99999):05d}")  # Truy vấn mã chính xác
+        else:
+            queries.append(" ".join(rng.choice(SYLLABLES + DOMAIN_TERMS) for _ in range(rng.randint(3, 7))))
+    return queries
+
+
+def dir_size_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            fp = os.path.join(root, name)
+            if os.path.isfile(fp):
+                total += os.path.getsize(fp)
+    return total
+
+
+def peak_rss_mb() -> float:
+    # Linux trả về KB, macOS trả về bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles_ms(samples: list[float]) -> dict:
+    arr = np.asarray(samples) * 1000
+    return {f"p{p}": round(float(np.percentile(arr, p)), 2) for p in (50, 95, 99)}
+
+
+def run_size(target_chunks: int, workdir: str, num_queries: int, quiet: bool) -> dict:
+    """Chạy trọn 1 mức kích thước trong process riêng để đo peak RSS độc lập."""
+    from src.app.services.rag_indexer import RAGIndexer
+    from src.app.services.rag_retriever import RAGRetriever
+
+    docs_folder = os.path.join(workdir, f"kb_{target_chunks}")
+    db_path = os.path.join(workdir, f"db_{target_chunks}")
+    out = io.StringIO() if quiet else sys.stdout
+
+    start = time.perf_counter()
+    num_docs = generate_corpus(docs_folder, target_chunks)
+    gen_time = time.perf_counter() - start
+
+    with contextlib.redirect_stdout(out):
+        indexer = RAGIndexer(persist_path=db_path)
+        start = time.perf_counter()
+        indexer.build_index(docs_folder)
+        index_time = time.perf_counter() - start
+        num_chunks = indexer.collection.count()
+    rss_after_index = peak_rss_mb()
+    del indexer
+
+    start = time.perf_counter()
+    retriever = RAGRetriever(persist_path=db_path)
+    startup_time = time.perf_counter() - start
+
+    queries = generate_queries(num_queries)
+    retriever.retrieve(queries[0], top_k=5)  # Warm-up (model load lazy, CUDA init...)
+
+    latency = {}
+    for label, kwargs in [("hybrid", {"rerank": False}), ("hybrid_rerank", {"rerank": True})]:
+        samples = []
+        for q in queries:
+            t0 = time.perf_counter()
+            retriever.retrieve(q, top_k=5, **kwargs)
+            samples.append(time.perf_counter() - t0)
+        latency[label] = percentiles_ms(samples)
+
+    return {
+        "target_chunks": target_chunks,
+        "num_docs": num_docs,
+        "num_chunks": num_chunks,
+        "corpus_gen_s": round(gen_time, 2),
+        "index_s": round(index_time, 2),
+        "index_chunks_per_s": round(num_chunks / index_time, 1) if index_time else 0.0,
+        "disk_mb": round(dir_size_bytes(db_path) / (1024 * 1024), 1),
+        "peak_rss_index_mb": round(rss_after_index, 1),
+        "peak_rss_total_mb": round(peak_rss_mb(), 1),
+        "retriever_startup_s": round(startup_time, 2),
+        "query_latency_ms": latency,
+    }
+
+
+def _worker(queue, target_chunks, workdir, num_queries, quiet):
+    try:
+        queue.put(run_size(target_chunks, workdir, num_queries, quiet))
+    except Exception as e:
+        queue.put({"target_chunks": target_chunks, "error": str(e)})
+
+
+def _wait_result(queue, proc, target_chunks):
+    """Chờ kết quả của process con; con chết giữa chừng (vd: bị OOM kill) thì ghi 1 hàng lỗi thay vì treo."""
+    while True:
+        try:
+            result = queue.get(timeout=RESULT_POLL_S)
+            break
+        except Empty:
+            if not proc.is_alive():
+                try:  # Kết quả có thể vừa được put ngay trước khi process thoát
+                    result = queue.get(timeout=RESULT_POLL_S)
+                except Empty:
+                    result = {"target_chunks": target_chunks,
+                              "error": f"worker exited with code {proc.exitcode} without a result"}
+                break
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scale benchmark: indexing + retrieval trên corpus tổng hợp.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Số chunk mục tiêu")
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES, help="Số query đo latency mỗi mức")
+    parser.add_argument("--workdir", default=None, help="Thư mục làm việc (mặc định: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Giữ lại corpus và DB sau khi chạy")
+    parser.add_argument("--verbose", action="store_true", help="Hiện log của Indexer")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag_scale_")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"🚀 Scale benchmark | sizes={args.sizes} | workdir={workdir}")
+
+    ctx = mp.get_context("spawn")
+    results = []
+    try:
+        for size in args.sizes:
+            print(f"🧪 Running size={size:,} chunks...")
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_worker, args=(queue, size, workdir, args.queries, not args.verbose))
+            proc.start()
+            result = _wait_result(queue, proc, size)
+            results.append(result)
+            if "error" in result:
+                print(f"   ❌ Failed: {result['error']}")
+            else:
+                print(f"   ✅ {result['num_chunks']:,} chunks | index {result['index_s']}s | "
+                      f"startup {result['retriever_startup_s']}s | "
+                      f"p50 {result['query_latency_ms']['hybrid_rerank']['p50']}ms")
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    rows = [
+        {
+            "Chunks": r["num_chunks"],
+            "Index (s)": r["index_s"],
+            "Chunks/s": r["index_chunks_per_s"],
+            "Disk (MB)": r["disk_mb"],
+            "Peak RSS (MB)": r["peak_rss_total_mb"],
+            "Startup (s)": r["retriever_startup_s"],
+            "Hybrid p50/p95 (ms)": "{p50}/{p95}".format(**r["query_latency_ms"]["hybrid"]),
+            "Rerank p50/p95 (ms)": "{p50}/{p95}".format(**r["query_latency_ms"]["hybrid_rerank"]),
+        }
+        for r in results if "error" not in r
+    ]
+    print("\n📊 SCALE BENCHMARK SUMMARY:")
+    print(tabulate(rows, headers="keys", tablefmt="grid"))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}, f, indent=2)
+    print(f"✅ Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
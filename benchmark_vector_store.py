@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from tabulate import tabulate
+
+from src.app.services.chunk_table import ChunkTable
+from src.app.services.vector_store import IVFIndex, NumpyVectorStore, default_nlist, normalize_rows, quantize_int8
+
+# Config
+DEFAULT_SIZES = [10_000, 100_000]
+DIM = 384                 # = paraphrase-multilingual-MiniLM-L12-v2
+NUM_QUERIES = 200
+TOP_K = 10
+NPROBES = [4, 8, 16]
+DTYPES = ["float16", "int8"]
+OUTPUT_FILE = "benchmark_vector_store.json"
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Vector có cấu trúc cụm (giống embedding thật hơn nhiễu đều) để đo recall của IVF có ý nghĩa."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(10, n // 200), dim)).astype(np.float32)
+    labels = rng.integers(len(centers), size=n)
+    return normalize_rows(centers[labels] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32))
+
+
+def measure(search, queries: np.ndarray) -> tuple[list[list[int]], dict]:
+    results, samples = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(search(q))
+        samples.append(time.perf_counter() - t0)
+    arr = np.asarray(samples) * 1000
+    return results, {
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "qps": round(len(queries) / arr.sum() * 1000, 1),
+    }
+
+
+def recall(results: list[list[int]], truth: list[list[int]]) -> float:
+    return round(float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)])), 4)
+
+
+def run_size(n: int, num_queries: int, workdir: str, with_chroma: bool) -> list[dict]:
+    vectors = synthetic_vectors(n, DIM)
+    rng = np.random.default_rng(1)
+    queries = normalize_rows(vectors[rng.integers(n, size=num_queries)] + 0.1 * rng.normal(size=(num_queries, DIM)))
+
+    # Ma trận memmap như lúc chạy thật (NumpyVectorStore.open)
+    path = f"{workdir}/vectors_{n}.npy"
+    np.save(path, vectors)
+    matrix = np.load(path, mmap_mode="r")
+
+    rows = []
+    exact = NumpyVectorStore(matrix)
+    truth, latency = measure(lambda q: [r for r, _ in exact.search(q, TOP_K)], queries)
+    rows.append({"size": n, "backend": "numpy exact", "build_s": 0.0, "vectors_mb": mb(vectors.nbytes),
+                 "recall@10": 1.0, **latency})
+
+    # Bản nén: quét float16/int8, có và không chấm lại top ứng viên bằng float32
+    for dtype in DTYPES:
+        t0 = time.perf_counter()
+        codes, scales = quantize_int8(matrix) if dtype == "int8" else (vectors.astype(np.float16), None)
+        build_s = round(time.perf_counter() - t0, 2)
+        for rescore_factor in (1, 4):
+            store = NumpyVectorStore(matrix, codes=codes, scales=scales, rescore_factor=rescore_factor)
+            results, latency = measure(lambda q: [r for r, _ in store.search(q, TOP_K)], queries)
+            label = f"numpy {dtype}" + (f" rescore x{rescore_factor}" if rescore_factor > 1 else " (no rescore)")
+            rows.append({"size": n, "backend": label, "build_s": build_s, "vectors_mb": mb(codes.nbytes),
+                         "recall@10": recall(results, truth), **latency})
+
+    nlist = default_nlist(n)
+    t0 = time.perf_counter()
+    ivf_index = IVFIndex.train(matrix, nlist)
+    build_s = round(time.perf_counter() - t0, 2)
+    for nprobe in NPROBES:
+        store = NumpyVectorStore(matrix, ivf=ivf_index, nprobe=nprobe)
+        results, latency = measure(lambda q: [r for r, _ in store.search(q, TOP_K)], queries)
+        rows.append({"size": n, "backend": f"ivf nlist={nlist} nprobe={nprobe}", "build_s": build_s,
+                     "vectors_mb": mb(vectors.nbytes + ivf_index.memory_bytes),
+                     "recall@10": recall(results, truth), **latency})
+
+    if with_chroma:
+        import chromadb
+
+        client = chromadb.PersistentClient(path=f"{workdir}/chroma_{n}")
+        collection = client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+        t0 = time.perf_counter()
+        for start in range(0, n, 5000):
+            collection.add(ids=[str(i) for i in range(start, min(start + 5000, n))],
+                           embeddings=vectors[start:start + 5000].tolist())
+        build_s = round(time.perf_counter() - t0, 2)
+
+        def chroma_search(q):
+            res = collection.query(query_embeddings=[q.tolist()], n_results=TOP_K, include=["distances"])
+            return [int(i) for i in res["ids"][0]]
+
+        results, latency = measure(chroma_search, queries)
+        rows.append({"size": n, "backend": "chroma hnsw", "build_s": build_s, "vectors_mb": None,
+                     "recall@10": recall(results, truth), **latency})
+    return rows
+
+
+def mb(nbytes: int) -> float:
+    return round(nbytes / (1024 * 1024), 1)
+
+
+def corpus_memory(n: int, workdir: str) -> dict:
+    """RAM heap (tracemalloc) của corpus dạng list str/dict Python so với ChunkTable mmap."""
+    rng = np.random.default_rng(2)
+    words = np.array(["kho", "nhập", "xuất", "mã", "sản", "phẩm", "quy", "tắc", "SKU", "FIFO", "lô", "hạn"])
+
+    def make_corpus():
+        ids = [f"chunk-{i:08d}" for i in range(n)]
+        docs = [" ".join(words[rng.integers(len(words), size=120)]) for _ in range(n)]
+        metas = [{"source": f"doc_{i // 20}.md", "section": "General", "category": "rule", "chunk_index": i % 20}
+                 for i in range(n)]
+        return ids, docs, metas
+
+    tracemalloc.start()
+    corpus = make_corpus()
+    lists_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    ChunkTable.write(f"{workdir}/corpus_{n}.chunks", *corpus)
+    del corpus
+    tracemalloc.start()
+    table = ChunkTable.open(f"{workdir}/corpus_{n}.chunks")
+    _ = [table.texts[i] for i in range(0, n, max(1, n // 10))]
+    table_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {"size": n, "python_lists_mb": mb(lists_bytes), "chunk_table_heap_mb": mb(table_bytes),
+            "chunk_table_file_mb": mb(os.path.getsize(table.path))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh Vector Store backend: NumPy exact / IVF / Chroma.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--no-chroma", action="store_true", help="Bỏ qua Chroma (vd: chưa cài chromadb)")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    with_chroma = not args.no_chroma
+    if with_chroma:
+        try:
+            import chromadb  # noqa: F401
+        except ImportError:
+            print("⚠️ chromadb chưa được cài, bỏ qua backend Chroma.")
+            with_chroma = False
+
+    workdir = tempfile.mkdtemp(prefix="rag_vs_")
+    rows, corpus_rows = [], []
+    try:
+        for n in args.sizes:
+            print(f"🧪 Running size={n:,} vectors ({DIM}d)...")
+            rows.extend(run_size(n, args.queries, workdir, with_chroma))
+            corpus_rows.append(corpus_memory(n, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(tabulate(rows, headers="keys", tablefmt="github"))
+    print()
+    print(tabulate(corpus_rows, headers="keys", tablefmt="github"))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"vectors": rows, "corpus": corpus_rows}, f, indent=2)
+    print(f"💾 Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
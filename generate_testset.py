@@ -1,79 +1,254 @@
-import os
-import glob
+"""
+Sinh bộ test tổng hợp (question -> ground truth chunk) cho benchmark retrieval.
+
+- Chạy song song (worker pool giới hạn + rate limit theo RPM của Gemini), retry/backoff khi lỗi quota.
+- Checkpoint append-only JSONL: mỗi chunk xong là ghi 1 dòng -> crash giữa chừng chạy lại sẽ resume.
+- File có (digest, PROMPT_VERSION) đã sinh đủ câu hỏi được bỏ qua hoàn toàn.
+- Phủ toàn bộ tài liệu: chunk giống hệt Indexer rồi lấy mẫu câu hỏi theo chunk (không cắt 4000 ký tự đầu file).
+- Ground truth ghi cả chunk id (khớp id trong ChromaDB) để đánh giá retrieval ở mức chunk.
+
+    uv run python generate_testset.py --workers 4 --rpm 30
+    uv run python generate_testset.py --export-only      # chỉ xuất lại synthetic_testset.json từ checkpoint
+"""
+
+import argparse
+import hashlib
 import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+import backoff
 import google.generativeai as genai
 from dotenv import load_dotenv
 from tqdm import tqdm
 
+from src.app.services.chunking import chunk_hierarchical
+from src.app.services.rag_indexer import iter_source_files
+from src.app.services.token_chunking import STRATEGIES, ChunkingConfig, chunk_document
+from src.app.utils.json_repair import loads_lenient
+
 load_dotenv()
 
 # Config
 DATA_DIR = "./data/AI Knowledge Base WMS"
+CHECKPOINT_FILE = "./data/synthetic_testset.jsonl"
 OUTPUT_FILE = "./data/synthetic_testset.json"
-NUM_QUESTIONS_PER_FILE = 2
-
-# Init Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-flash-lite')
-
-def generate_questions(text, filename):
-    prompt = f"""
-    Bạn là một chuyên gia tạo dữ liệu kiểm thử.
-    Dựa trên văn bản sau (được trích từ file '{filename}'), hãy đặt {NUM_QUESTIONS_PER_FILE} câu hỏi cụ thể mà người dùng có thể hỏi.
-    
-    YÊU CẦU:
-    - Câu hỏi phải liên quan trực tiếp đến nội dung văn bản.
-    - Câu hỏi phải đóng vai là Business Analyst hoặc PM hỏi về nghiệp vụ.
-    - Output trả về dạng JSON List thuần túy: ["Câu hỏi 1", "Câu hỏi 2", ...]
-    
-    VĂN BẢN:
-    {text[:4000]} (cắt ngắn để vừa context)
-    """
-    try:
-        response = model.generate_content(prompt)
-        text_resp = response.text.replace("```json", "").replace("```", "").strip()
-        return json.loads(text_resp)
-    except Exception as e:
-        print(f"Error generating questions for {filename}: {e}")
-        return []
+# v2: chunk id khóa theo tên file tương đối (v1 theo đường dẫn -> không khớp index mới)
+PROMPT_VERSION = "chunk-v2"  # Đổi khi sửa prompt / cách tính chunk id -> sinh lại toàn bộ
+MODEL_NAME = "gemini-2.5-flash-lite"
+MIN_CHUNK_CHARS = 200        # Chunk quá ngắn (chỉ có tiêu đề) không đủ thông tin để đặt câu hỏi
+
+PROMPT_TEMPLATE = """
+Bạn là một chuyên gia tạo dữ liệu kiểm thử.
+Dựa trên đoạn văn bản sau (trích từ file '{filename}', mục '{section}'), hãy đặt {n} câu hỏi cụ thể mà người dùng có thể hỏi.
+
+YÊU CẦU:
+- Câu hỏi phải trả lời được bằng chính đoạn văn bản này (không hỏi thông tin nằm ngoài đoạn).
+- Câu hỏi phải đóng vai là Business Analyst hoặc PM hỏi về nghiệp vụ.
+- Không nhắc tới tên file hay "đoạn văn bản trên".
+- Output trả về dạng JSON List thuần túy: ["Câu hỏi 1", "Câu hỏi 2", ...]
+
+VĂN BẢN:
+{text}
+"""
+
+
+class RateLimiter:
+    """Giới hạn số request/phút dùng chung cho mọi worker (chia đều các slot, không burst)."""
+
+    def __init__(self, rpm: float):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def file_digest(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    """Đọc JSONL của PROMPT_VERSION hiện tại: {"chunks": {(digest, chunk_id): record}, "files": {digest đã xong}}."""
+    chunks, files = {}, set()
+    if not os.path.exists(path):
+        return {"chunks": chunks, "files": files}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Dòng cuối ghi dở khi crash
+            if record.get("prompt_version") != PROMPT_VERSION:
+                continue
+            if record["type"] == "file":
+                files.add(record["digest"])
+            else:
+                chunks[(record["digest"], record["chunk_id"])] = record
+    return {"chunks": chunks, "files": files}
+
+
+def sample_chunks(chunks: List[tuple], limit: int, rng: random.Random) -> List[tuple]:
+    """Lấy tối đa `limit` chunk rải đều toàn tài liệu (mỗi đoạn bằng nhau chọn ngẫu nhiên 1 chunk)."""
+    chunks = [c for c in chunks if len(c[0].strip()) >= MIN_CHUNK_CHARS] or chunks
+    if limit <= 0 or len(chunks) <= limit:
+        return chunks
+    step = len(chunks) / limit
+    return [chunks[int(i * step) + rng.randrange(max(int(step), 1))] for i in range(limit)]
+
+
+def make_generator(model, limiter: RateLimiter, questions_per_chunk: int):
+    @backoff.on_exception(backoff.expo, Exception, max_tries=4, jitter=backoff.full_jitter)
+    def generate(filename: str, section: str, text: str) -> List[str]:
+        limiter.acquire()
+        prompt = PROMPT_TEMPLATE.format(filename=filename, section=section, n=questions_per_chunk, text=text)
+        response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+        questions = loads_lenient(response.text)
+        if not isinstance(questions, list):
+            raise ValueError(f"Expected a JSON list, got {type(questions).__name__}")
+        return [q for q in questions if isinstance(q, str) and q.strip()][:questions_per_chunk]
+
+    return generate
+
+
+def export_dataset(checkpoint_path: str, output_path: str, data_dir: str) -> int:
+    """Xuất JSON cho benchmark_retrieval.py: chỉ giữ câu hỏi ứng với nội dung hiện tại của từng file."""
+    state = load_checkpoint(checkpoint_path)
+    current = {}
+    for file_path, rel_name in iter_source_files(data_dir, include=["*.md"]):
+        with open(file_path, "r", encoding="utf-8") as f:
+            current[file_digest(f.read())] = rel_name
 
-def main():
-    print(f"🚀 Starting Synthetic Testset Generation from {DATA_DIR}...")
     dataset = []
-    
-    # Get all .md files
-    files = glob.glob(os.path.join(DATA_DIR, "*.md"))
-    
+    for (digest, chunk_id), record in state["chunks"].items():
+        if digest not in current:
+            continue  # File đã đổi / bị xóa
+        for question in record["questions"]:
+            dataset.append({
+                "question": question,
+                "ground_truth_source": record["source"],
+                "ground_truth_chunk_ids": [chunk_id],
+                "ground_truth_section": record["section"],
+                "ground_truth_content_snippet": record["snippet"],
+            })
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(dataset, f, ensure_ascii=False, indent=2)
+    return len(dataset)
+
+
+def generate_all(args):
+    print(f"🚀 Starting Synthetic Testset Generation from {args.data_dir}...")
+    files = list(iter_source_files(args.data_dir, include=["*.md"]))
     if not files:
-        print(f"❌ No markdown files found in {DATA_DIR}")
+        print(f"❌ No markdown files found in {args.data_dir}")
         return
 
-    for filepath in tqdm(files, desc="Processing files"):
-        filename = os.path.basename(filepath)
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                content = f.read()
-                
-            if not content.strip():
+    os.makedirs(os.path.dirname(os.path.abspath(args.checkpoint)), exist_ok=True)
+    state = load_checkpoint(args.checkpoint)
+
+    # Lập danh sách task (file, chunk) còn thiếu
+    tasks, file_tasks = [], {}
+    for file_path, rel_name in files:
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        digest = file_digest(content)
+        if not content.strip() or digest in state["files"]:
+            continue
+        # Chunk id khóa theo rel_name như Indexer -> không phụ thuộc --data-dir tương đối / tuyệt đối
+        metadata = {"filename": rel_name, "path": file_path}
+        if args.hierarchical:
+            _, chunks = chunk_hierarchical(content, metadata)
+        else:
+            chunks = chunk_document(content, metadata, ChunkingConfig(
+                strategy=args.strategy, max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens,
+                chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+            ))
+        # Seed theo digest -> lần chạy resume lấy mẫu đúng các chunk như lần trước
+        rng = random.Random(f"{args.seed}:{digest}")
+        pending = [c for c in sample_chunks(chunks, args.chunks_per_file, rng)
+                   if (digest, c[1]["doc_id"]) not in state["chunks"]]
+        file_tasks[digest] = {"file": rel_name, "remaining": len(pending)}
+        tasks += [(digest, rel_name, text, meta) for text, meta in pending]
+
+    skipped = len(files) - len(file_tasks)
+    print(f"📄 {len(files)} files ({skipped} already done), {len(tasks)} chunks to generate")
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    generate = make_generator(genai.GenerativeModel(MODEL_NAME), RateLimiter(args.rpm), args.questions_per_chunk)
+
+    with open(args.checkpoint, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=args.workers) as pool:
+
+        def append(record: Dict[str, Any]):
+            out.write(json.dumps({**record, "prompt_version": PROMPT_VERSION}, ensure_ascii=False) + "\n")
+            out.flush()
+
+        # File không còn chunk nào phải sinh (vd. đã xong hết ở lần chạy trước nhưng chưa ghi marker)
+        for digest, info in file_tasks.items():
+            if info["remaining"] == 0:
+                append({"type": "file", "digest": digest, "file": info["file"]})
+
+        futures = {
+            pool.submit(generate, rel_name, meta["section"], text): (digest, rel_name, text, meta)
+            for digest, rel_name, text, meta in tasks
+        }
+        failed = 0
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Generating"):
+            digest, rel_name, text, meta = futures[future]
+            try:
+                questions = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Error generating questions for {rel_name} ({meta['doc_id'][:8]}): {e}")
                 continue
-                
-            questions = generate_questions(content, filename)
-            
-            for q in questions:
-                dataset.append({
-                    "question": q,
-                    "ground_truth_source": filename,
-                    "ground_truth_content_snippet": content[:200]
-                })
-                
-        except Exception as e:
-            print(f"Skipping {filename}: {e}")
-
-    # Save
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(dataset, f, ensure_ascii=False, indent=2)
-        
-    print(f"\n✅ Generated {len(dataset)} pairs. Saved to {OUTPUT_FILE}")
+            append({
+                "type": "chunk", "digest": digest, "chunk_id": meta["doc_id"], "source": meta["source"],
+                "section": meta["section"], "snippet": text[:200], "questions": questions,
+            })
+            file_tasks[digest]["remaining"] -= 1
+            if file_tasks[digest]["remaining"] == 0:
+                append({"type": "file", "digest": digest, "file": rel_name})
+
+    if failed:
+        print(f"⚠️ {failed} chunks failed, re-run to resume them.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a chunk-level synthetic retrieval testset")
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help="Knowledge base folder that was indexed (relative or absolute)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=30, help="Max Gemini requests per minute (0 = unlimited)")
+    parser.add_argument("--chunks-per-file", type=int, default=4, help="Chunks sampled per file (0 = all chunks)")
+    parser.add_argument("--questions-per-chunk", type=int, default=1)
+    parser.add_argument("--hierarchical", action="store_true", help="Match an index built with hierarchical chunking")
+    parser.add_argument("--strategy", choices=STRATEGIES, default=ChunkingConfig.strategy,
+                        help="Chunking strategy of the indexed collection")
+    parser.add_argument("--max-tokens", type=int, default=ChunkingConfig.max_tokens)
+    parser.add_argument("--overlap-tokens", type=int, default=ChunkingConfig.overlap_tokens)
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Only for --strategy chars")
+    parser.add_argument("--chunk-overlap", type=int, default=100, help="Only for --strategy chars")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--export-only", action="store_true")
+    args = parser.parse_args()
+
+    if not args.export_only:
+        generate_all(args)
+    total = export_dataset(args.checkpoint, args.output, args.data_dir)
+    print(f"\n✅ {total} question/chunk pairs saved to {args.output}")
+
 
 if __name__ == "__main__":
     main()
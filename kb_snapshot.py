@@ -0,0 +1,67 @@
+import argparse
+import os
+
+import chromadb
+
+from src.app.config import RAG_DB_PATH, DEFAULT_COLLECTION
+from src.app.services.rag_retriever import load_embedding_function
+from src.app.services.snapshot import SNAPSHOT_SUFFIX, export_snapshot, import_snapshot, load_snapshot, read_header
+
+
+def cmd_export(args):
+    client = chromadb.PersistentClient(path=args.db)
+    embedding_fn = load_embedding_function("cpu")
+    collection = client.get_collection(name=args.collection, embedding_function=embedding_fn)
+    output = args.output or os.path.join(".", args.collection + SNAPSHOT_SUFFIX)
+    header = export_snapshot(collection, output, embedding_fn, dtype=args.dtype)
+    print(f"Exported {header['count']} chunks ({header['dim']}d, {header['dtype']}) -> {output} "
+          f"({os.path.getsize(output) / (1024 * 1024):.1f} MB)")
+
+
+def cmd_import(args):
+    client = chromadb.PersistentClient(path=args.db)
+    embedding_fn = load_embedding_function("cpu")
+    # load_snapshot kiểm tra fingerprint: khác embedding model -> SnapshotMismatch, không import
+    snapshot = load_snapshot(args.snapshot, embedding_fn=embedding_fn)
+    collection = import_snapshot(snapshot, client, embedding_fn, collection_name=args.collection)
+    print(f"Imported {collection.count()} chunks into '{collection.name}' at '{args.db}'")
+
+
+def cmd_info(args):
+    header = read_header(args.snapshot)
+    fingerprint = header["model_fingerprint"]
+    print(f"Collection: {header['collection']}")
+    print(f"Created at: {header['created_at']}")
+    print(f"Chunks:     {header['count']} x {header['dim']}d ({header['dtype']})")
+    print(f"Model:      {fingerprint['model']}")
+    print(f"Signed:     {'yes (HMAC, KB_SNAPSHOT_KEY)' if header['integrity'].get('hmac_sha256') else 'no'}")
+    for name, section in header["sections"].items():
+        print(f"  {name:<8} {section['nbytes'] / (1024 * 1024):8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export/import Knowledge Base snapshots (.srskb)")
+    parser.add_argument("--db", default=RAG_DB_PATH, help="ChromaDB persist path")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="Export 1 collection thành file snapshot")
+    p_export.add_argument("--collection", default=DEFAULT_COLLECTION)
+    p_export.add_argument("--output", default=None, help=f"Mặc định: ./<collection>{SNAPSHOT_SUFFIX}")
+    p_export.add_argument("--dtype", choices=["float16", "float32"], default="float16")
+    p_export.set_defaults(func=cmd_export)
+
+    p_import = sub.add_parser("import", help="Nạp snapshot vào ChromaDB (không embed lại)")
+    p_import.add_argument("snapshot")
+    p_import.add_argument("--collection", default=None, help="Mặc định: tên collection trong snapshot")
+    p_import.set_defaults(func=cmd_import)
+
+    p_info = sub.add_parser("info", help="In header của snapshot")
+    p_info.add_argument("snapshot")
+    p_info.set_defaults(func=cmd_info)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
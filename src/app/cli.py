@@ -0,0 +1,396 @@
+"""
+CLI `srs-rag` (pyproject [project.scripts]): index / query / bench / serve / daemon.
+
+    srs-rag daemon start                       # giữ embedding model, Cross-Encoder, BM25 warm (foreground)
+    srs-rag index "./data/AI Knowledge Base WMS" --collection srs_knowledge_base
+    srs-rag query "quy tắc nhập kho" --top-k 5
+    srs-rag bench --testset ./data/synthetic_testset.json --repeats 2
+    srs-rag serve --port 8000
+
+index / query / bench gửi sang daemon nếu daemon của cùng RAG_DB_PATH đang chạy (socket trong thư mục DB),
+không thì tự nạp model trong process (`--local` để ép chạy local). Module này chỉ import nhẹ: model / Chroma
+chỉ được nạp khi thật sự chạy local hoặc trong daemon -> gọi qua daemon mất vài chục ms thay vì vài giây.
+"""
+
+import argparse
+import json
+import os
+import secrets
+import signal
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional
+
+from app.config import CLI_DAEMON_SOCKET, DEFAULT_COLLECTION, RAG_DB_PATH
+from app.models import FusionConfig, RetrievalFilter
+
+DAEMON_OPS = ("query", "index", "stats")
+
+
+class DaemonError(RuntimeError):
+    """Lỗi phía daemon (message gồm tên exception gốc)."""
+
+
+class Workspace:
+    """
+    Registry Knowledge Base + Indexer dùng chung model: chạy trong process CLI (--local) hoặc sống lâu trong daemon.
+    Các method nhận / trả kiểu đơn giản (dict, list) để gửi được qua socket của daemon.
+    """
+
+    def __init__(self, persist_path: str = RAG_DB_PATH):
+        from app.services.kb_registry import KnowledgeBaseRegistry
+
+        self.persist_path = persist_path
+        self.registry = KnowledgeBaseRegistry(persist_path)
+        self.started_at = time.time()
+
+    def warm(self, collections: List[str]):
+        """Nạp model + BM25 trước để request đầu tiên không phải chờ."""
+        from app.services.kb_registry import KnowledgeBaseNotFound
+        from app.utils.logger import logger
+
+        self.registry.embedding_function  # noqa: B018 - nạp embedding model, Cross-Encoder, batchers
+        for name in collections:
+            try:
+                self.registry.get(name)
+            except KnowledgeBaseNotFound:
+                logger.warning(f"[CLI] Knowledge base '{name}' not found, skip warm-up")
+
+    def query(self, query: str, collection: Optional[str] = None, top_k: int = 5, rerank: bool = True,
+              fusion: Optional[Dict[str, Any]] = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        retriever = self.registry.get(collection)
+        return retriever.retrieve(
+            query, top_k=top_k, rerank=rerank, fusion=FusionConfig(**fusion) if fusion else None,
+            filters=RetrievalFilter(**filters) if filters else None,
+        )
+
+    def index(self, folder: str, collection: Optional[str] = None, files: Optional[List[str]] = None,
+              include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+              strategy: Optional[str] = None, hierarchical: bool = False, dedup: Optional[bool] = None) -> Dict[str, Any]:
+        """Index cả thư mục (hoặc chỉ `files`) bằng model đã nạp, rồi nạp lại BM25 của collection nếu đang trong RAM."""
+        # Kiểm tra trước khi import Chroma / indexer: sai đường dẫn thì báo lỗi ngay thay vì index 0 file
+        if not os.path.isdir(folder):
+            raise FileNotFoundError(f"Knowledge base folder not found: {folder}")
+        missing = [f for f in files or [] if not os.path.isfile(f)]
+        if missing:
+            raise FileNotFoundError(f"Files not found: {', '.join(missing)}")
+
+        from app.services.rag_indexer import RAGIndexer
+        from app.services.token_chunking import ChunkingConfig
+
+        name = collection or DEFAULT_COLLECTION
+        start = time.perf_counter()
+        indexer = RAGIndexer(
+            persist_path=self.persist_path, collection_name=name, hierarchical=hierarchical,
+            client=self.registry.client, embedding_function=self.registry.embedding_function,
+            chunking=ChunkingConfig(strategy=strategy) if strategy else None, dedup=dedup,
+        )
+        if files:
+            for file_path in files:
+                indexer.index_file(file_path, folder)
+        else:
+            indexer.build_index(folder, include=include, exclude=exclude)
+        self.registry.reload(name)
+        return {"collection": name, "chunks": indexer.collection.count(),
+                "seconds": round(time.perf_counter() - start, 2)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.registry.stats(), "pid": os.getpid(), "persist_path": self.persist_path,
+                "uptime_s": round(time.time() - self.started_at, 1)}
+
+    def close(self):
+        self.registry.close()
+
+
+# ---- Daemon: multiprocessing.connection trên Unix socket, xác thực bằng key ngẫu nhiên (file 0600) ----
+
+def socket_path(persist_path: str) -> str:
+    return CLI_DAEMON_SOCKET or os.path.join(os.path.abspath(persist_path), "srs-rag.sock")
+
+
+def _key_path(address: str) -> str:
+    return address + ".key"
+
+
+class DaemonClient:
+    def __init__(self, address: str):
+        with open(_key_path(address), "rb") as f:
+            authkey = f.read()
+        self.conn = Client(address, family="AF_UNIX", authkey=authkey)
+
+    def call(self, op: str, **kwargs) -> Any:
+        self.conn.send((op, kwargs))
+        ok, payload = self.conn.recv()
+        if not ok:
+            raise DaemonError(payload)
+        return payload
+
+    def __getattr__(self, op: str):
+        # Cùng interface với Workspace: client.query(...), client.index(...), client.stats()
+        if op in DAEMON_OPS:
+            return lambda **kwargs: self.call(op, **kwargs)
+        raise AttributeError(op)
+
+    def close(self):
+        self.conn.close()
+
+
+def connect_daemon(address: str) -> Optional[DaemonClient]:
+    """Client tới daemon đang chạy; None nếu không có daemon (hoặc socket cũ còn sót lại)."""
+    if not os.path.exists(address) or not os.path.exists(_key_path(address)):
+        return None
+    try:
+        return DaemonClient(address)
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+
+def serve_daemon(workspace, address: str, ready: Optional[threading.Event] = None):
+    """Phục vụ workspace qua Unix socket tới khi nhận `shutdown` (hoặc SIGINT / SIGTERM). Mỗi kết nối 1 thread."""
+    if connect_daemon(address):
+        raise DaemonError(f"A daemon is already listening on {address}")
+    for path in (address, _key_path(address)):
+        if os.path.exists(path):
+            os.remove(path)  # Socket cũ của daemon đã chết
+
+    authkey = secrets.token_bytes(32)
+    fd = os.open(_key_path(address), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    stop = threading.Event()
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    op, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if op == "shutdown":
+                    conn.send((True, None))
+                    stop.set()
+                    Client(address, family="AF_UNIX", authkey=authkey).close()  # Đánh thức accept()
+                    return
+                try:
+                    if op not in DAEMON_OPS:
+                        raise ValueError(f"Unknown op '{op}'")
+                    conn.send((True, getattr(workspace, op)(**kwargs)))
+                except Exception as e:
+                    conn.send((False, f"{type(e).__name__}: {e}"))
+
+    try:
+        if ready:
+            ready.set()
+        while not stop.is_set():
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                continue
+            if stop.is_set():
+                conn.close()
+                break
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    finally:
+        listener.close()
+        for path in (address, _key_path(address)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# ---- Subcommands ----
+
+def _backend(args):
+    """Daemon nếu đang chạy (trừ khi --local), không thì Workspace trong process."""
+    if not args.local:
+        client = connect_daemon(socket_path(args.db_path))
+        if client:
+            print(f"⚡ Using warm daemon ({socket_path(args.db_path)})", file=sys.stderr)
+            return client
+    return Workspace(args.db_path)
+
+
+def _fusion(args) -> Optional[Dict[str, Any]]:
+    overrides = {"method": args.fusion, "vector_weight": args.vector_weight, "keyword_weight": args.keyword_weight}
+    overrides = {k: v for k, v in overrides.items() if v is not None}
+    return FusionConfig(**overrides).model_dump() if overrides else None
+
+
+def cmd_index(args):
+    backend = _backend(args)
+    # Daemon có cwd riêng: gửi đường dẫn tuyệt đối theo cwd của người gọi
+    files = [os.path.abspath(f) for f in args.files] if args.files else None
+    result = backend.index(
+        folder=os.path.abspath(args.folder), collection=args.collection, files=files, include=args.include,
+        exclude=args.exclude, strategy=args.strategy, hierarchical=args.hierarchical, dedup=args.dedup,
+    )
+    print(f"✅ Indexed '{result['collection']}': {result['chunks']} chunks in {result['seconds']}s")
+
+
+def cmd_query(args):
+    backend = _backend(args)
+    filters = {k: v for k, v in {"source": args.source, "section": args.section, "category": args.category}.items() if v}
+    start = time.perf_counter()
+    results = backend.query(query=args.query, collection=args.collection, top_k=args.top_k,
+                            rerank=not args.no_rerank, fusion=_fusion(args), filters=filters or None)
+    elapsed = time.perf_counter() - start
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2, default=float))
+        return
+    for i, doc in enumerate(results):
+        score = doc.get("rerank_score", doc.get("initial_score", 0))
+        print(f"#{i + 1} [{float(score):.4f}] {doc['metadata'].get('source', 'Unknown')}")
+        print("    " + " ".join(doc["content"].split())[:200])
+    print(f"({len(results)} results in {elapsed * 1000:.0f} ms)", file=sys.stderr)
+
+
+def cmd_bench(args):
+    import numpy as np
+    from tabulate import tabulate
+
+    from app.services.retrieval_eval import first_hit_rank, targets_for
+
+    with open(args.testset, "r", encoding="utf-8") as f:
+        dataset = json.load(f)[:args.limit or None]
+    backend = _backend(args)
+
+    rows = []
+    for repeat in range(1, args.repeats + 1):
+        latencies, source_rr, chunk_rr = [], [], []
+        for item in dataset:
+            start = time.perf_counter()
+            results = backend.query(query=item["question"], collection=args.collection, top_k=args.top_k,
+                                    rerank=not args.no_rerank, fusion=_fusion(args))
+            latencies.append(time.perf_counter() - start)
+            rank = first_hit_rank(results, item, "source")
+            source_rr.append(1 / rank if rank else 0.0)
+            if targets_for(item, "chunk"):
+                rank = first_hit_rank(results, item, "chunk")
+                chunk_rr.append(1 / rank if rank else 0.0)
+        ms = np.array(latencies) * 1000
+        row = {"run": repeat, "queries": len(dataset), "hit_rate": round(float(np.mean(np.array(source_rr) > 0)), 4),
+               "mrr": round(float(np.mean(source_rr)), 4), "p50_ms": round(float(np.percentile(ms, 50)), 1),
+               "p95_ms": round(float(np.percentile(ms, 95)), 1), "qps": round(len(dataset) / (ms.sum() / 1000), 2)}
+        if chunk_rr:
+            row.update({"chunk_hit_rate": round(float(np.mean(np.array(chunk_rr) > 0)), 4),
+                        "chunk_mrr": round(float(np.mean(chunk_rr)), 4)})
+        rows.append(row)
+        print(f"   ✅ run {repeat}: hit_rate={row['hit_rate']} mrr={row['mrr']} p50={row['p50_ms']} ms", file=sys.stderr)
+
+    print(tabulate(rows, headers="keys", tablefmt="github"))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "testset": args.testset,
+                       "top_k": args.top_k, "runs": rows}, f, indent=2)
+        print(f"✅ Results saved to '{args.output}'", file=sys.stderr)
+
+
+def cmd_serve(args):
+    import uvicorn
+
+    # API server đọc RAG_DB_PATH / các biến khác từ môi trường (.env) như khi chạy uvicorn trực tiếp
+    uvicorn.run("app.main:app", host=args.host, port=args.port, reload=args.reload)
+
+
+def cmd_daemon(args):
+    address = socket_path(args.db_path)
+    if args.action == "status":
+        client = connect_daemon(address)
+        if not client:
+            print(f"No daemon running on {address}")
+            sys.exit(1)
+        print(json.dumps(client.stats(), indent=2, ensure_ascii=False))
+    elif args.action == "stop":
+        client = connect_daemon(address)
+        if not client:
+            print(f"No daemon running on {address}")
+            sys.exit(1)
+        client.call("shutdown")
+        print("🛑 Daemon stopped")
+    else:
+        workspace = Workspace(args.db_path)
+        print(f"🔥 Warming up models and {args.warm or '(no)'} collections...", file=sys.stderr)
+        workspace.warm(args.warm)
+        # SIGTERM -> SystemExit để serve_daemon dọn socket / key
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        print(f"✅ Daemon ready on {address} (pid {os.getpid()}). Stop with `srs-rag daemon stop`.", file=sys.stderr)
+        try:
+            serve_daemon(workspace, address)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            workspace.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="srs-rag", description="Index, query and benchmark the SRS knowledge bases.")
+    parser.add_argument("--db-path", default=RAG_DB_PATH, help="ChromaDB directory (default: RAG_DB_PATH)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def retrieval_options(p):
+        p.add_argument("--collection", default=None, help="Knowledge base (default: RAG_DEFAULT_COLLECTION)")
+        p.add_argument("--top-k", type=int, default=5)
+        p.add_argument("--no-rerank", action="store_true")
+        p.add_argument("--fusion", choices=["rrf", "score", "convex"], default=None)
+        p.add_argument("--vector-weight", type=float, default=None)
+        p.add_argument("--keyword-weight", type=float, default=None)
+        p.add_argument("--local", action="store_true", help="Load models in this process even if a daemon is running")
+
+    p_index = sub.add_parser("index", help="Index a knowledge base folder (or selected files)")
+    p_index.add_argument("folder")
+    p_index.add_argument("--collection", default=None)
+    p_index.add_argument("--files", nargs="+", default=None, help="Only (re)index these files (incremental)")
+    p_index.add_argument("--include", nargs="+", default=None, help='Glob filter, e.g. "rules/*.md"')
+    p_index.add_argument("--exclude", nargs="+", default=None)
+    p_index.add_argument("--strategy", choices=["chars", "header", "sentence_window", "structured"], default=None,
+                         help="Chunking strategy for a new collection (default: CHUNK_STRATEGY / recorded)")
+    p_index.add_argument("--hierarchical", action="store_true")
+    p_index.add_argument("--dedup", action=argparse.BooleanOptionalAction, default=None,
+                         help="Collapse near-duplicate chunks (default: DEDUP_ENABLED)")
+    p_index.add_argument("--local", action="store_true", help="Index in this process even if a daemon is running")
+    p_index.set_defaults(func=cmd_index)
+
+    p_query = sub.add_parser("query", help="Hybrid search + rerank over a knowledge base")
+    p_query.add_argument("query")
+    retrieval_options(p_query)
+    p_query.add_argument("--source", nargs="+", default=None)
+    p_query.add_argument("--section", nargs="+", default=None)
+    p_query.add_argument("--category", nargs="+", default=None)
+    p_query.add_argument("--json", action="store_true", help="Print raw results as JSON")
+    p_query.set_defaults(func=cmd_query)
+
+    p_bench = sub.add_parser("bench", help="End-to-end retrieval benchmark (Hit Rate, MRR, latency) on a testset")
+    p_bench.add_argument("--testset", default="./data/synthetic_testset.json")
+    retrieval_options(p_bench)
+    p_bench.add_argument("--limit", type=int, default=0, help="Only the first N questions (0 = all)")
+    p_bench.add_argument("--repeats", type=int, default=1)
+    p_bench.add_argument("--output", default=None, help="Save the summary as JSON")
+    p_bench.set_defaults(func=cmd_bench)
+
+    p_serve = sub.add_parser("serve", help="Run the FastAPI server (configured by env / .env, like uvicorn)")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8000)
+    p_serve.add_argument("--reload", action="store_true")
+    p_serve.set_defaults(func=cmd_serve)
+
+    p_daemon = sub.add_parser("daemon", help="Keep models and indexes warm for repeated CLI calls")
+    p_daemon.add_argument("action", choices=["start", "stop", "status"])
+    p_daemon.add_argument("--warm", nargs="*", default=[DEFAULT_COLLECTION], help="Collections to load on start")
+    p_daemon.set_defaults(func=cmd_daemon)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except DaemonError as e:
+        print(f"❌ Daemon error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
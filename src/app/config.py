@@ -0,0 +1,82 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Vector DB dùng chung cho Indexer và Retriever (trước đây lệch nhau: ./rag_db vs ./rag_db_test)
+RAG_DB_PATH = os.getenv("RAG_DB_PATH", "./rag_db_test")
+DEFAULT_COLLECTION = os.getenv("RAG_DEFAULT_COLLECTION", "srs_knowledge_base")
+
+# Models - Retriever phải dùng đúng embedding model của Indexer
+EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+RERANKER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+# Endpoint LLM: generate dùng API OpenAI-compatible, evaluator dùng Gemini (vd: trỏ sang LLM giả của benchmark_ab.py --stub)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://router.huggingface.co/v1")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")  # để trống = endpoint mặc định của SDK
+
+# Chunking mặc định cho collection mới: chars (theo ký tự, như cũ) | header | sentence_window | structured (theo token)
+# Chiến lược được ghi vào metadata collection lúc tạo, các lần index sau của collection đó dùng lại
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "chars")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "126"))  # = max_seq_length (128) của embedding model - [CLS]/[SEP]
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "16"))
+
+# Gộp chunk gần trùng lúc index (MinHash LSH): chỉ lưu 1 chunk canonical + danh sách source của các bản sao
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "false").lower() in ("1", "true", "yes")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))  # Jaccard (word 5-gram) tối thiểu để coi là trùng
+
+# Giới hạn RAM cho các Knowledge Base đang nạp (BM25, metadata bitmap, vector backend), LRU eviction khi vượt
+KB_MEMORY_CAP_MB = int(os.getenv("KB_MEMORY_CAP_MB", "1024"))
+
+# Watch mode: API server theo dõi thư mục KB và cập nhật index incremental (để trống = tắt)
+KB_WATCH_DIR = os.getenv("KB_WATCH_DIR", "")
+KB_WATCH_COLLECTION = os.getenv("KB_WATCH_COLLECTION", DEFAULT_COLLECTION)
+
+# Thư mục chứa snapshot (<collection>.srskb): replica tự import collection còn thiếu + dùng BM25 dựng sẵn
+KB_SNAPSHOT_DIR = os.getenv("KB_SNAPSHOT_DIR", "")
+# Khóa HMAC ký phần BM25 (pickle) của snapshot: đặt giống nhau ở máy export và replica -> snapshot bị sửa / không ký bị từ chối
+KB_SNAPSHOT_KEY = os.getenv("KB_SNAPSHOT_KEY", "")
+
+# Vector Search backend: "chroma" (HNSW), "numpy" (exact cosine, memmap), "ivf" (numpy + Inverted File)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Kiểu lưu vector để quét (numpy/ivf): float32 | float16 | int8 (top ứng viên luôn được chấm lại bằng float32)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+VECTOR_IVF_NLIST = int(os.getenv("VECTOR_IVF_NLIST", "0"))  # 0 = tự chọn ~4*sqrt(N)
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "8"))
+
+# Job Queue (generate / generate + evaluate chạy nền): SQLite lưu job, số worker, giới hạn job đang chờ
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "./jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+
+# Evaluator: structured output (Gemini response_schema = EvaluationResult) + số lần gọi lại LLM khi output không parse được
+EVAL_STRUCTURED_OUTPUT = os.getenv("EVAL_STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
+EVAL_PARSE_RETRIES = int(os.getenv("EVAL_PARSE_RETRIES", "1"))
+
+# Sectioned (map-reduce) evaluation: mode mặc định auto|full|sectioned, ngưỡng độ dài (ký tự) để auto chuyển sang sectioned
+EVAL_MODE = os.getenv("EVAL_MODE", "auto")
+EVAL_SECTIONED_MIN_CHARS = int(os.getenv("EVAL_SECTIONED_MIN_CHARS", "12000"))
+EVAL_MAX_WORKERS = int(os.getenv("EVAL_MAX_WORKERS", "4"))
+# Cache điểm từng mục (để trống = tắt): sinh lại 1 phần SRS thì chỉ chấm lại các mục đã đổi
+EVAL_CACHE_PATH = os.getenv("EVAL_CACHE_PATH", "./eval_cache.sqlite3")
+
+# Pre-evaluation gate: chỉ gọi LLM judge khi điểm heuristic local >= ngưỡng (0 = luôn gọi)
+EVAL_GATE_THRESHOLD = float(os.getenv("EVAL_GATE_THRESHOLD", "4.0"))
+
+# Micro-batching query embedding / Cross-Encoder giữa các request đồng thời: chờ tối đa N ms để gom batch (0 = tắt)
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+RERANK_BATCH_MAX_SIZE = int(os.getenv("RERANK_BATCH_MAX_SIZE", "128"))  # Tính theo cặp (query, passage)
+RERANK_BATCH_MAX_WAIT_MS = float(os.getenv("RERANK_BATCH_MAX_WAIT_MS", "5"))
+
+# Model worker pool: query embedding + Cross-Encoder chạy trong N process riêng, mỗi process ghim 1 lát core (0 = tắt)
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "0"))
+MODEL_WORKER_THREADS = int(os.getenv("MODEL_WORKER_THREADS", "0"))  # 0 = số core của lát được ghim
+
+# Profiling theo request (cProfile): thư mục lưu profile (để trống = tắt), lấy mẫu 1/N request (0 = chỉ khi được yêu cầu)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+
+# CLI daemon (`srs-rag daemon start`): Unix socket giữ model / index warm (để trống = <RAG_DB_PATH>/srs-rag.sock)
+CLI_DAEMON_SOCKET = os.getenv("CLI_DAEMON_SOCKET", "")
@@ -1,60 +1,326 @@
-from fastapi import FastAPI, HTTPException
-from app.models import SRSRequest, SRSResponse, EvaluationRequest, EvaluationResponse
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import time
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from app.config import (
+    KB_WATCH_DIR, KB_WATCH_COLLECTION, JOBS_DB_PATH, JOB_WORKERS, JOB_MAX_PENDING, EVAL_GATE_THRESHOLD,
+    PROFILE_DIR, PROFILE_SAMPLE_EVERY, PROFILE_KEEP,
+)
+from app.models import (
+    SRSRequest, SRSResponse, EvaluationRequest, EvaluationResponse, FusionConfig, RetrievalFilter,
+    JobRequest, JobStatus, PreEvaluationResult,
+)
+from app.services.job_queue import JobQueue, QueueFull, FINISHED
+from app.services.kb_registry import KnowledgeBaseNotFound
 from app.services.srs_generator import SRSGenerator
 from app.services.evaluator import Evaluator
+from app.services.pre_evaluator import pre_evaluate
+from app.utils.metrics import metrics
+from app.utils.profiling import RequestProfiler
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Watch mode (KB_WATCH_DIR): cập nhật index incremental khi tài liệu trong KB thay đổi."""
+    watcher = None
+    if KB_WATCH_DIR:
+        from app.services.kb_watcher import KnowledgeBaseWatcher
+        from app.services.rag_indexer import RAGIndexer
+
+        registry = srs_generator.kb_registry
+        # Chiến lược chunk / hierarchical lấy từ metadata collection (như lúc index ban đầu)
+        indexer = RAGIndexer(
+            persist_path=registry.persist_path, collection_name=KB_WATCH_COLLECTION,
+            client=registry.client, embedding_function=registry.embedding_function,
+        )
+        watcher = KnowledgeBaseWatcher(
+            indexer, KB_WATCH_DIR,
+            on_change=lambda upserted, removed: registry.apply_changes(KB_WATCH_COLLECTION, upserted, removed),
+        )
+        watcher.start()
+    job_queue.start()
+    yield
+    job_queue.stop()
+    if watcher:
+        watcher.stop()
+    srs_generator.kb_registry.close()
 
 app = FastAPI(
     title="SRS Generation API",
     description="API for generating Software Requirements Specification (SRS) documents using AI.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    metrics.observe("http_request_seconds", time.perf_counter() - start,
+                    method=request.method, path=path, status=response.status_code)
+    return response
+
 # Initialize the service
+STARTED_AT = time.monotonic()
 srs_generator = SRSGenerator()
 evaluator = Evaluator()
 
-from src.app.models import RAGRequest, SRSResponse, EvaluationRequest, EvaluationResponse
+# Per-request profiling (?profile=true / X-Profile: 1, or 1-in-PROFILE_SAMPLE_EVERY requests)
+profiler = RequestProfiler(PROFILE_DIR, sample_every=PROFILE_SAMPLE_EVERY, keep=PROFILE_KEEP)
+
+
+def _profile_requested(flag: bool, header: Optional[str]) -> bool:
+    return flag or (header or "").strip().lower() in ("1", "true", "yes")
+
+# Default Hybrid Fusion settings per endpoint (override per call via request body / query params)
+ENDPOINT_FUSION_DEFAULTS = {
+    "generate-srs": FusionConfig(),
+    "retrieve": FusionConfig(),
+}
+
+from app.models import RAGRequest, SRSResponse, EvaluationRequest, EvaluationResponse
+
+
+def _run_generate(payload: Dict[str, Any]) -> Dict[str, Any]:
+    request = RAGRequest(**payload)
+    srs_content, rag_context = srs_generator.generate_srs(
+        request.project_description, use_rag=request.use_rag,
+        fusion=request.fusion or ENDPOINT_FUSION_DEFAULTS["generate-srs"], filters=request.filters,
+        collection=request.collection,
+    )
+    return {"srs_content": srs_content, "rag_context": rag_context}
+
+
+def _run_generate_evaluate(payload: Dict[str, Any]) -> Dict[str, Any]:
+    result = _run_generate(payload)
+    result.update(evaluator.assess(
+        result["srs_content"], result["rag_context"], force=payload.get("force_evaluation", False)
+    ))
+    return result
+
+
+# Background jobs: client nhận job id ngay, poll / long-poll / SSE để lấy kết quả
+job_queue = JobQueue(
+    JOBS_DB_PATH,
+    handlers={"generate": _run_generate, "generate_evaluate": _run_generate_evaluate},
+    max_workers=JOB_WORKERS,
+    max_pending=JOB_MAX_PENDING,
+)
 
 # ... (Previous imports)
 
+# Endpoint gọi code blocking (LLM, model, SQLite) khai báo `def`: FastAPI chạy trong threadpool nên các request
+# đồng thời không chặn event loop (và request trùng nhau mới gộp được qua single-flight)
 @app.post("/generate-srs", response_model=SRSResponse)
-async def generate_srs(request: RAGRequest):
+def generate_srs(request: RAGRequest, response: Response, profile: bool = False,
+                 x_profile: Optional[str] = Header(None)):
     """
     Generate an SRS document based on the provided project description.
     Supports RAG mode (use_rag=True/False).
+    `?profile=true` or header `X-Profile: 1` captures a cProfile of this request (id in the `X-Profile-Id` header).
     """
     try:
-        srs_content, rag_context = srs_generator.generate_srs(request.project_description, use_rag=request.use_rag)
+        fusion = request.fusion or ENDPOINT_FUSION_DEFAULTS["generate-srs"]
+        with profiler.maybe_profile("generate-srs", _profile_requested(profile, x_profile),
+                                    use_rag=request.use_rag, collection=request.collection) as profile_id:
+            srs_content, rag_context = srs_generator.generate_srs(
+                request.project_description, use_rag=request.use_rag, fusion=fusion, filters=request.filters,
+                collection=request.collection,
+            )
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
         return SRSResponse(srs_content=srs_content, rag_context=rag_context)
+    except KnowledgeBaseNotFound as e:
+        raise HTTPException(status_code=404, detail=f"Knowledge base not found: {e.args[0]}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/evaluate-srs", response_model=EvaluationResponse)
-async def evaluate_srs(request: EvaluationRequest):
+def evaluate_srs(request: EvaluationRequest):
     """
     Evaluate an SRS document based on stringent criteria.
     Now supports RAG Faithfulness check if context is provided.
+    A local heuristic pre-evaluation runs first; the LLM judge is skipped (evaluation_result = null) when the
+    pre-score is below EVAL_GATE_THRESHOLD, unless force_evaluation is set.
     """
     try:
-        evaluation_result = evaluator.evaluate_srs(request.srs_content, request.rag_context)
-        return EvaluationResponse(evaluation_result=evaluation_result)
+        return EvaluationResponse(**evaluator.assess(
+            request.srs_content, request.rag_context, mode=request.mode, force=request.force_evaluation
+        ))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/pre-evaluate", response_model=PreEvaluationResult)
+def pre_evaluate_srs(request: EvaluationRequest):
+    """Heuristic-only scoring (structure, Mermaid, citations, business-rule codes) in milliseconds, no LLM call."""
+    return pre_evaluate(request.srs_content, request.rag_context, threshold=EVAL_GATE_THRESHOLD)
+
 @app.post("/retrieve")
-async def retrieve_docs(query: str, top_k: int = 5):
+def retrieve_docs(
+    response: Response,
+    query: str,
+    top_k: int = 5,
+    collection: Optional[str] = None,
+    fusion_method: Optional[str] = None,
+    vector_weight: Optional[float] = None,
+    keyword_weight: Optional[float] = None,
+    source: Optional[List[str]] = Query(None),
+    section: Optional[List[str]] = Query(None),
+    category: Optional[List[str]] = Query(None),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    profile: bool = False,
+    x_profile: Optional[str] = Header(None),
+):
     """
     Debug endpoint for RAG Retrieval.
+    Fusion params override the endpoint default (e.g. keyword_weight=0 for pure semantic search).
+    Metadata filters (source/section/category/date) are pushed down to Chroma and BM25.
+    `?profile=true` or header `X-Profile: 1` captures a cProfile of this request (id in the `X-Profile-Id` header).
     """
+    filters = RetrievalFilter(
+        source=source, section=section, category=category,
+        created_after=created_after, created_before=created_before,
+    )
+    overrides = {"method": fusion_method, "vector_weight": vector_weight, "keyword_weight": keyword_weight}
+    try:
+        fusion = FusionConfig(**{
+            **ENDPOINT_FUSION_DEFAULTS["retrieve"].model_dump(),
+            **{k: v for k, v in overrides.items() if v is not None},
+        })
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+
     try:
-        results = srs_generator.retriever.retrieve(query, top_k=top_k)
+        with profiler.maybe_profile("retrieve", _profile_requested(profile, x_profile),
+                                    query=query, collection=collection) as profile_id:
+            retriever = srs_generator.kb_registry.get(collection)
+            results = retriever.retrieve(query, top_k=top_k, fusion=fusion, filters=filters)
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
         return {"results": results}
+    except KnowledgeBaseNotFound as e:
+        if collection is None:
+            return {"results": []}  # KB mặc định chưa index: như trước, không có kết quả
+        raise HTTPException(status_code=404, detail=f"Knowledge base not found: {e.args[0]}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+def submit_job(job: JobRequest):
+    """
+    Submit a generate (or generate + evaluate) job and return immediately with its id.
+    An identical job that is still queued/running is returned instead of creating a duplicate.
+    """
+    try:
+        payload = job.request.model_dump(mode="json")
+        if job.force_evaluation:
+            payload["force_evaluation"] = True
+        return job_queue.submit(job.kind, payload, priority=job.priority)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.get("/jobs", response_model=List[JobStatus])
+def list_jobs(status: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """
+    List recent jobs (without results).
+    """
+    return job_queue.list(status=status, limit=limit)
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    """
+    Job status and result. `wait` > 0 long-polls up to that many seconds until the job finishes.
+    """
+    job = job_queue.wait(job_id, wait) if wait else job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events stream: one `status` event per status change, ending when the job finishes.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    async def stream():
+        current, last_status = job, None
+        while current is not None:
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield f"event: status\ndata: {JobStatus(**current).model_dump_json()}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if last_status in FINISHED:
+                return
+            current = await run_in_threadpool(job_queue.wait, job_id, 15, last_status)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """
+    Cancel a queued job (running jobs cannot be interrupted).
+    """
+    if job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return {"cancelled": job_queue.cancel(job_id)}
+
+@app.get("/collections")
+def list_collections():
+    """
+    List available knowledge bases and which ones are currently loaded in memory.
+    """
+    return srs_generator.kb_registry.stats()
+
+@app.get("/metrics")
+def get_metrics(format: str = Query("prometheus", pattern="^(prometheus|json)$")):
+    """
+    Process metrics: request latency, single-flight coalescing (`singleflight_*`), job queue...
+    Prometheus text format by default, `?format=json` for dashboards.
+    """
+    metrics.set_gauge("job_queue_workers", job_queue.max_workers)
+    for status, count in job_queue.stats()["jobs"].items():
+        metrics.set_gauge("job_queue_jobs", count, status=status)
+    if format == "json":
+        return metrics.snapshot()
+    return PlainTextResponse(metrics.render_prometheus())
+
+@app.get("/profiles")
+def list_profiles():
+    """
+    Captured request profiles, newest first (stored in PROFILE_DIR).
+    """
+    return profiler.list()
+
+@app.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = Query("folded", pattern="^(folded|pstats|text)$")):
+    """
+    Download a profile. `folded` = collapsed stacks for flamegraph.pl / speedscope / inferno,
+    `pstats` = raw cProfile dump (snakeviz, `python -m pstats`), `text` = top functions by cumulative time.
+    """
+    if format == "pstats":
+        path = profiler.path(profile_id)
+        if path:
+            return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+    else:
+        content = profiler.folded(profile_id) if format == "folded" else profiler.summary(profile_id)
+        if content is not None:
+            headers = {"Content-Disposition": f'attachment; filename="{profile_id}.folded"'} if format == "folded" else None
+            return PlainTextResponse(content, headers=headers)
+    raise HTTPException(status_code=404, detail=f"Profile not found: {profile_id}")
+
 @app.get("/health")
 async def health_check():
     """
-    Health check endpoint.
+    Health check endpoint. Cheap (no model / DB access) so dashboards can probe it on every refresh.
     """
-    return {"status": "healthy"}
+    return {"status": "healthy", "uptime_seconds": round(time.monotonic() - STARTED_AT, 1)}
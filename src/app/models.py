@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Literal
+from datetime import datetime
 
 class SRSRequest(BaseModel):
     project_description: str = Field(..., description="Description of the project to generate SRS for")
@@ -11,6 +12,10 @@ class SRSResponse(BaseModel):
 class EvaluationRequest(BaseModel):
     srs_content: str = Field(..., description="SRS content to be evaluated")
     rag_context: Optional[str] = None # Pass context for Faithfulness check
+    mode: Optional[Literal["auto", "full", "sectioned"]] = Field(
+        None, description="'full' = one prompt, 'sectioned' = map-reduce per Markdown section, 'auto' = by length"
+    )
+    force_evaluation: bool = Field(False, description="Run the LLM judge even if the heuristic pre-score is below the gate")
 
 class EvaluationScoreItem(BaseModel):
     raw: float
@@ -43,8 +48,49 @@ class EvaluationResult(BaseModel):
     group: str
     comment: EvaluationComment
 
+class SectionScores(BaseModel):
+    completeness: float
+    consistency: float
+    accuracy: float
+    format_tone: float
+    faithfulness: Optional[float] = None # None khi mục không trích dẫn tài liệu nào trong Context
+
+class SectionEvaluation(BaseModel):
+    """Kết quả chấm 1 mục (map step của sectioned evaluation)."""
+    scores: SectionScores
+    summary: str
+    strengths: List[str]
+    issues: List[EvaluationIssue]
+    quick_fixes: List[str]
+
+class PreEvaluationChecks(BaseModel):
+    missing_sections: List[str]
+    mermaid_blocks: int
+    mermaid_errors: List[str]
+    unclosed_code_blocks: int
+    tables: int
+    business_rules: int
+    duplicate_business_rules: List[str]
+    citations: int
+    matched_sources: List[str]
+    unknown_sources: List[str] = Field(..., description="Cited sources that were not in the retrieved context")
+    uncited_sources: List[str] = Field(..., description="Retrieved sources never cited in the SRS")
+
+class PreEvaluationResult(BaseModel):
+    completeness: float
+    format_tone: float
+    faithfulness: Optional[float] = None # None khi không có context để đối chiếu
+    pre_score: float = Field(..., description="Weighted heuristic estimate (0-10)")
+    threshold: float
+    passed: bool = Field(..., description="pre_score >= threshold, i.e. worth sending to the LLM judge")
+    checks: PreEvaluationChecks
+    elapsed_ms: float
+
 class EvaluationResponse(BaseModel):
-    evaluation_result: EvaluationResult = Field(..., description="Structured evaluation result")
+    evaluation_result: Optional[EvaluationResult] = Field(
+        None, description="Structured evaluation result (None when the LLM judge was skipped by the pre-evaluation gate)"
+    )
+    pre_evaluation: Optional[PreEvaluationResult] = Field(None, description="Heuristic pre-evaluation")
 
 class ChunkMetadata(BaseModel):
     doc_id: str = Field(..., description="Unique ID of the document")
@@ -52,7 +98,46 @@ class ChunkMetadata(BaseModel):
     section: str = Field(..., description="Section name or header")
     category: str = Field(..., description="Category: 'rule', 'process', 'requirement', 'nfr'")
     created_at: str = Field(..., description="Indexing timestamp")
+    created_ts: Optional[float] = Field(None, description="Indexing timestamp as epoch seconds (for date filters)")
+
+class FusionConfig(BaseModel):
+    method: Literal["rrf", "score", "convex"] = Field("rrf", description="Fusion strategy for vector + keyword results")
+    vector_weight: float = Field(1.0, ge=0, description="Weight of semantic (vector) results. 0 disables vector search")
+    keyword_weight: float = Field(1.0, ge=0, description="Weight of keyword (BM25) results. 0 disables keyword search")
+    rrf_k: int = Field(60, gt=0, description="RRF smoothing constant c in w / (c + rank)")
+    normalization: Literal["minmax", "zscore"] = Field("minmax", description="Score normalization for 'score'/'convex'")
+    short_circuit: bool = Field(True, description="Skip vector search when BM25 alone clearly answers an exact-code query")
+    short_circuit_ratio: float = Field(2.0, gt=0, description="Required BM25 top1/top2 score ratio to short-circuit")
+
+class RetrievalFilter(BaseModel):
+    source: Optional[List[str]] = Field(None, description="Only chunks from these source files")
+    section: Optional[List[str]] = Field(None, description="Only chunks under these sections (Header 1/2)")
+    category: Optional[List[str]] = Field(None, description="Only chunks of these categories")
+    created_after: Optional[datetime] = Field(None, description="Only chunks indexed at or after this time")
+    created_before: Optional[datetime] = Field(None, description="Only chunks indexed at or before this time")
 
 class RAGRequest(SRSRequest):
     use_rag: bool = Field(True, description="Whether to use RAG")
+    fusion: Optional[FusionConfig] = None # Override endpoint default fusion settings
+    filters: Optional[RetrievalFilter] = None # Metadata pre-filter pushed down to Chroma + BM25
+    collection: Optional[str] = Field(None, description="Knowledge base (collection) to retrieve from. Default: server default")
+
+
+class JobRequest(BaseModel):
+    kind: Literal["generate", "generate_evaluate"] = Field("generate", description="Workflow to run in the background")
+    request: RAGRequest = Field(..., description="Generation request (same body as /generate-srs)")
+    priority: int = Field(0, ge=0, le=9, description="Higher runs first")
+    force_evaluation: bool = Field(False, description="generate_evaluate: run the LLM judge regardless of the pre-score gate")
 
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    status: Literal["queued", "running", "succeeded", "failed", "cancelled"]
+    priority: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    deduplicated: bool = Field(False, description="True if an identical in-flight job was returned instead of a new one")
+    result: Optional[Dict[str, Any]] = None # srs_content, rag_context (+ evaluation_result)
@@ -0,0 +1,201 @@
+"""
+Chunk Table: lưu id / nội dung / metadata của chunk thành bảng offset + blob trong 1 file, mở bằng mmap.
+
+Thay cho 3 list Python (bm25_corpus, bm25_ids, bm25_metadatas) giữ hàng triệu object str/dict trong RAM:
+chỉ decode chuỗi của những hàng được truy cập (top-k kết quả).
+
+Layout file (little-endian, mỗi section căn lề 64B để view thẳng thành mảng numpy):
+    [MAGIC 8B][padding -> 64B][sections...][header JSON][u64 header_len][MAGIC 8B]
+"""
+
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import struct
+import tempfile
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+MAGIC = b"SRSCHNK1"
+FORMAT_VERSION = 1
+ALIGN = 64
+SUFFIX = ".chunks"
+
+
+def _id_hash(doc_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def table_digest(ids: List[str], documents: List[str]) -> str:
+    """Hash (id, nội dung) theo thứ tự hàng: cache vector (.npy, IVF) khóa theo digest này."""
+    h = hashlib.sha1()
+    for doc_id, doc in zip(ids, documents):
+        h.update(doc_id.encode("utf-8"))
+        h.update(b"\0")
+        h.update(doc.encode("utf-8"))
+        h.update(b"\1")
+    return h.hexdigest()
+
+
+def metadata_digest(metadatas: List[Optional[Dict[str, Any]]]) -> str:
+    """Hash metadata theo thứ tự hàng (vd: re-index đổi created_at, dedup ghi duplicate_sources)."""
+    h = hashlib.sha1()
+    for metadata in metadatas or []:
+        h.update(json.dumps(metadata or {}, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        h.update(b"\1")
+    return h.hexdigest()
+
+
+class BlobColumn:
+    """Cột chuỗi read-only: blob bytes + offsets int64 (n+1). Hỗ trợ len / index / iter như list."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, decode: Optional[Callable[[str], Any]] = None):
+        self.blob = blob
+        self.offsets = offsets
+        self.decode = decode
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        raw = self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+        return self.decode(raw) if self.decode else raw
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _decode_metadata(raw: str) -> Dict[str, Any]:
+    return json.loads(raw) or {}
+
+
+class ChunkTable:
+    """Bảng chunk mmap: `texts`, `ids`, `metadatas` là BlobColumn; `row_of(id)` tra hàng qua hash đã sort."""
+
+    def __init__(self, path: str, header: Dict[str, Any], sections: Dict[str, np.ndarray]):
+        self.path = path
+        self.header = header
+        self.texts = BlobColumn(sections["texts"], sections["text_offsets"])
+        self.ids = BlobColumn(sections["ids"], sections["id_offsets"])
+        self.metadatas = BlobColumn(sections["metadatas"], sections["metadata_offsets"], _decode_metadata)
+        self.id_hashes = sections["id_hashes"]
+        self.id_rows = sections["id_rows"]
+
+    @property
+    def digest(self) -> str:
+        """Digest (id, nội dung), xem table_digest."""
+        return self.header["digest"]
+
+    def __len__(self) -> int:
+        return self.header["count"]
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        h = np.uint64(_id_hash(doc_id))
+        pos = int(np.searchsorted(self.id_hashes, h))
+        while pos < len(self.id_hashes) and self.id_hashes[pos] == h:
+            row = int(self.id_rows[pos])
+            if self.ids[row] == doc_id:
+                return row
+            pos += 1
+        return None
+
+    @classmethod
+    def write(cls, path: str, ids: List[str], documents: List[str], metadatas: List[Optional[Dict[str, Any]]],
+              digest: Optional[str] = None, meta_digest: Optional[str] = None) -> Dict[str, Any]:
+        """Ghi bảng ra file tạm rồi rename (replica khác đang mmap file cũ không bị ảnh hưởng)."""
+        hashes = np.fromiter((_id_hash(i) for i in ids), dtype=np.uint64, count=len(ids))
+        order = np.argsort(hashes, kind="stable")
+        columns = {
+            "texts": [d.encode("utf-8") for d in documents],
+            "ids": [i.encode("utf-8") for i in ids],
+            "metadatas": [json.dumps(m or {}, ensure_ascii=False).encode("utf-8") for m in (metadatas or [None] * len(ids))],
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        sections: Dict[str, Dict[str, Any]] = {}
+
+        def write_section(f, name: str, data: bytes, dtype: str):
+            f.write(b"\0" * (-f.tell() % ALIGN))
+            sections[name] = {"offset": f.tell(), "nbytes": len(data), "dtype": dtype}
+            f.write(data)
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC.ljust(ALIGN, b"\0"))
+                for name, values in columns.items():
+                    prefix = name[:-1] if name.endswith("s") else name
+                    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+                    np.cumsum([len(v) for v in values], out=offsets[1:])
+                    write_section(f, f"{prefix}_offsets", offsets.tobytes(), "int64")
+                    write_section(f, name, b"".join(values), "uint8")
+                write_section(f, "id_hashes", hashes[order].tobytes(), "uint64")
+                write_section(f, "id_rows", order.astype(np.int64).tobytes(), "int64")
+
+                header = {
+                    "format_version": FORMAT_VERSION,
+                    "count": len(ids),
+                    "digest": digest or table_digest(ids, documents),
+                    "metadata_digest": meta_digest or metadata_digest(metadatas),
+                    "sections": sections,
+                }
+                header_bytes = json.dumps(header).encode("utf-8")
+                f.write(header_bytes)
+                f.write(struct.pack("<Q", len(header_bytes)))
+                f.write(MAGIC)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return header
+
+    @classmethod
+    def open(cls, path: str) -> "ChunkTable":
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a chunk table: {path}")
+            f.seek(-(8 + len(MAGIC)), os.SEEK_END)
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            f.seek(-(8 + len(MAGIC) + header_len), os.SEEK_END)
+            header = json.loads(f.read(header_len))
+        if header.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk table version {header.get('format_version')}")
+
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        sections = {
+            name: raw[s["offset"]:s["offset"] + s["nbytes"]].view(np.dtype(s["dtype"]))
+            for name, s in header["sections"].items()
+        }
+        return cls(path, header, sections)
+
+    @classmethod
+    def build_or_open(cls, directory: str, name: str, ids: List[str], documents: List[str],
+                      metadatas: List[Optional[Dict[str, Any]]]) -> "ChunkTable":
+        """
+        Mở `{directory}/{name}.{digest}.chunks` nếu đã có, ngược lại ghi mới và dọn file cũ của collection.
+        Tên file gồm digest nội dung + digest metadata: chỉ đổi metadata cũng phải ghi bảng mới.
+        """
+        digest = table_digest(ids, documents)
+        meta_digest = metadata_digest(metadatas)
+        path = os.path.join(directory, f"{name}.{digest[:8]}{meta_digest[:8]}{SUFFIX}")
+        if not os.path.exists(path):
+            cls.write(path, ids, documents, metadatas, digest=digest, meta_digest=meta_digest)
+            pattern = f"{glob.escape(name)}.{'[0-9a-f]' * 16}{SUFFIX}"
+            for stale in glob.glob(os.path.join(glob.escape(directory), pattern)):
+                if stale != path:
+                    # Process khác đang mmap vẫn đọc được (inode giữ đến khi unmap)
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(stale)
+        return cls.open(path)
@@ -0,0 +1,134 @@
+"""
+Chunking helpers dùng chung cho Indexer.
+
+- Flat: Markdown Header split -> RecursiveCharacterTextSplitter (chunk ~1000 chars).
+- Hierarchical (small-to-big): Parent = 1 Markdown header section (lưu 1 lần, không embed),
+  Child = chunk nhỏ trong parent (embed + rerank). Child giữ (parent_id, parent_start, parent_end)
+  để mở rộng ra parent sau khi rerank.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import List, Dict, Any, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+
+HEADERS_TO_SPLIT_ON = [
+    ("#", "Header 1"),
+    ("##", "Header 2"),
+    ("###", "Header 3"),
+]
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+RESERVED_KEYS = ["source", "section", "category", "created_at", "created_ts"]
+
+
+def stable_id(*parts: str) -> str:
+    """ID xác định (deterministic) -> re-index cùng nội dung sẽ upsert đè thay vì tạo bản sao."""
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def document_key(initial_metadata: Dict[str, Any]) -> str:
+    """
+    Khóa của 1 document: `filename` = đường dẫn tương đối trong KB (+ số trang với PDF) -> cơ sở cho ID chunk xác định.
+    Không dùng đường dẫn thật: index cùng thư mục qua "./kb" hay đường dẫn tuyệt đối (daemon) phải ra cùng ID.
+    """
+    doc_key = initial_metadata.get("filename", initial_metadata.get("path", "unknown"))
+    return f"{doc_key}#page={initial_metadata['page']}" if "page" in initial_metadata else doc_key
+
+
+def split_sections(text: str) -> List[Document]:
+    """Bước 1: Chia theo Markdown Header. File không có header -> 1 section duy nhất."""
+    markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON, strip_headers=False)
+    sections = markdown_splitter.split_text(text)
+    return sections or [Document(page_content=text, metadata={})]
+
+
+def split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 100) -> List[str]:
+    """Bước 2: Chia nhỏ tiếp bằng RecursiveCharacterTextSplitter."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=SEPARATORS
+    )
+    return text_splitter.split_text(text)
+
+
+def build_metadata(initial_metadata: Dict[str, Any], header_metadata: Dict[str, Any],
+                   doc_id: str, indexed_at: datetime) -> Dict[str, Any]:
+    """
+    Merge metadata: File metadata + Header metadata, bổ sung các trường bắt buộc theo ChunkMetadata Schema.
+    Lưu ý: ChromaDB chỉ hỗ trợ flat metadata (str, int, float, bool), không nested dict.
+    """
+    combined_metadata = {**initial_metadata, **header_metadata}
+    return {
+        "doc_id": doc_id,
+        "source": combined_metadata.get("filename", "unknown"),
+        "section": combined_metadata.get("Header 1", combined_metadata.get("Header 2", "General")),
+        "category": "knowledge", # Default, logic phân loại có thể cải tiến sau
+        "created_at": indexed_at.isoformat(),
+        "created_ts": indexed_at.timestamp(), # Số để Chroma lọc theo khoảng ngày ($gte/$lte)
+        # Giữ lại các field khác nếu cần
+        **{k: v for k, v in combined_metadata.items() if k not in RESERVED_KEYS}
+    }
+
+
+def chunk_flat(text: str, initial_metadata: Dict[str, Any], chunk_size: int = 1000,
+               chunk_overlap: int = 100) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Chunk phẳng: Markdown Header -> RecursiveCharacterTextSplitter. Trả về [(content, metadata)].
+    ID xác định theo (file, trang, thứ tự chunk) -> re-index ghi đè thay vì nhân bản.
+    """
+    final_chunks = []
+    indexed_at = datetime.now()
+    id_key = document_key(initial_metadata)
+
+    for split in split_sections(text):
+        for chunk_content in split_text(split.page_content, chunk_size, chunk_overlap):
+            doc_id = stable_id(id_key, "chunk", str(len(final_chunks)))
+            final_chunks.append((chunk_content, build_metadata(initial_metadata, split.metadata, doc_id, indexed_at)))
+    return final_chunks
+
+
+def chunk_hierarchical(text: str, initial_metadata: Dict[str, Any], child_size: int = 400,
+                       child_overlap: int = 50) -> Tuple[List[Dict[str, Any]], List[Tuple[str, Dict[str, Any]]]]:
+    """
+    Trả về (parents, children):
+    - parents: [{"parent_id", "path", "source", "section", "content"}] - lưu vào ParentStore.
+    - children: [(content, metadata)] - metadata có thêm parent_id, parent_start, parent_end.
+    """
+    indexed_at = datetime.now()
+    doc_key = initial_metadata.get("path", initial_metadata.get("filename", "unknown"))
+    # PDF được index theo trang -> thêm số trang vào khóa để ID không trùng giữa các trang
+    id_key = document_key(initial_metadata)
+    parents, children = [], []
+
+    for p_idx, section in enumerate(split_sections(text)):
+        parent_text = section.page_content
+        parent_id = stable_id(id_key, "parent", str(p_idx))
+        parent_meta = build_metadata(initial_metadata, section.metadata, parent_id, indexed_at)
+        parents.append({
+            "parent_id": parent_id,
+            "path": doc_key,
+            "source": parent_meta["source"],
+            "section": parent_meta["section"],
+            "content": parent_text,
+        })
+
+        cursor = 0
+        for c_idx, child_text in enumerate(split_text(parent_text, child_size, child_overlap)):
+            # Offset của child trong parent (splitter có thể strip whitespace -> tìm từ vị trí trước đó)
+            start = parent_text.find(child_text, max(0, cursor - child_overlap))
+            if start < 0:
+                start = parent_text.find(child_text)
+            start = max(start, 0)
+            end = start + len(child_text)
+            cursor = end
+
+            child_meta = build_metadata(
+                initial_metadata, section.metadata, stable_id(parent_id, "child", str(c_idx)), indexed_at
+            )
+            child_meta.update({"parent_id": parent_id, "parent_start": start, "parent_end": end})
+            children.append((child_text, child_meta))
+
+    return parents, children
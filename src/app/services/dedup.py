@@ -0,0 +1,247 @@
+"""
+Near-duplicate detection lúc index (MinHash + LSH trên word shingle của chunk).
+
+KB WMS lặp lại nhiều boilerplate (glossary chung, bảng quy tắc copy, cùng 1 template SRS): mỗi bản sao đều bị
+embed, lưu, index BM25 và chiếm chỗ trong top-k. Ở đây chỉ chunk đầu tiên (canonical) được đưa vào Chroma;
+các bản gần trùng (Jaccard ước lượng >= threshold) chỉ được ghi vào DuplicateStore (SQLite cạnh ChromaDB),
+metadata của canonical giữ danh sách source của các bản sao (`duplicate_sources`) để vẫn trích dẫn được.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+NUM_PERM = 128
+BANDS = 32                 # 32 band x 4 row: cặp có Jaccard ~0.8 gần như chắc chắn rơi chung ít nhất 1 bucket
+SHINGLE_SIZE = 5           # Word 5-gram
+DEFAULT_THRESHOLD = 0.85
+SOURCES_SEPARATOR = "|"    # Chroma chỉ nhận metadata phẳng -> list source nối thành chuỗi
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> List[str]:
+    """Word shingle trên text đã chuẩn hóa (chữ thường, bỏ dấu câu / khoảng trắng / ký hiệu Markdown)."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class MinHasher:
+    """Chữ ký MinHash `num_perm` chiều: h_i(x) = (a_i * x + b_i) mod p, lấy min trên các shingle (vectorized)."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a, b < 2^29 và x < 2^32 -> a * x + b < 2^61 + 2^29 < 2^64 (không tràn uint64)
+        self.a = rng.integers(1, 1 << 29, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 29, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, text: str) -> np.ndarray:
+        grams = shingles(text)
+        if not grams:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") for g in grams),
+            dtype=np.uint64, count=len(grams),
+        )
+        permuted = (hashes[:, None] * self.a[None, :] + self.b[None, :]) % _PRIME
+        return (permuted.min(axis=0) & _MAX_HASH).astype(np.uint32)
+
+
+def jaccard_estimate(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+
+class DuplicateStore:
+    """
+    SQLite (cùng thư mục ChromaDB, giống ParentStore):
+    - signatures: chữ ký MinHash của các chunk canonical (dựng lại LSH khi indexer khởi động -> incremental).
+    - duplicates: bản gần trùng đã gộp (nội dung + metadata) để khôi phục khi file chứa canonical bị xóa.
+    """
+
+    def __init__(self, persist_path: str, collection_name: str, threshold: float = DEFAULT_THRESHOLD,
+                 num_perm: int = NUM_PERM, bands: int = BANDS):
+        os.makedirs(persist_path, exist_ok=True)
+        self.db_path = os.path.join(persist_path, "duplicates.sqlite3")
+        self.collection_name = collection_name
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: Optional[Dict[Tuple[int, bytes], set]] = None
+        self._signatures: Dict[str, np.ndarray] = {}
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS signatures (
+                    collection TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    source TEXT,
+                    signature BLOB NOT NULL,
+                    PRIMARY KEY (collection, chunk_id)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS duplicates (
+                    collection TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    canonical_id TEXT NOT NULL,
+                    source TEXT,
+                    content TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    PRIMARY KEY (collection, chunk_id)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sig_source ON signatures (collection, source)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_dup_source ON duplicates (collection, source)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_dup_canonical ON duplicates (collection, canonical_id)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---- LSH (in-memory, nạp lazy từ bảng signatures) ----
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _ensure_loaded(self):
+        if self._buckets is not None:
+            return
+        self._buckets = {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT chunk_id, signature FROM signatures WHERE collection = ?", (self.collection_name,)
+            ).fetchall()
+        for chunk_id, blob in rows:
+            self._index(chunk_id, np.frombuffer(blob, dtype=np.uint32))
+
+    def _index(self, chunk_id: str, signature: np.ndarray):
+        self._signatures[chunk_id] = signature
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, set()).add(chunk_id)
+
+    def _unindex(self, chunk_id: str):
+        signature = self._signatures.pop(chunk_id, None)
+        if signature is not None:
+            for key in self._band_keys(signature):
+                self._buckets.get(key, set()).discard(chunk_id)
+
+    def find_canonical(self, chunk_id: str, signature: np.ndarray) -> Optional[str]:
+        """Canonical gần giống nhất (>= threshold) khác chính nó, hoặc None."""
+        self._ensure_loaded()
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates |= self._buckets.get(key, set())
+        candidates.discard(chunk_id)
+        best, best_score = None, self.threshold
+        for candidate in sorted(candidates):
+            score = jaccard_estimate(signature, self._signatures[candidate])
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    # ---- Ghi nhận canonical / duplicate ----
+
+    def add_canonical(self, chunk_id: str, source: Optional[str], signature: np.ndarray):
+        self._ensure_loaded()
+        self._unindex(chunk_id)
+        self._index(chunk_id, signature)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM duplicates WHERE collection = ? AND chunk_id = ?", (self.collection_name, chunk_id))
+            conn.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?)",
+                         (self.collection_name, chunk_id, source, signature.tobytes()))
+
+    def add_duplicate(self, chunk_id: str, canonical_id: str, content: str, metadata: Dict[str, Any]) -> bool:
+        """Ghi nhận bản sao. True nếu chunk này trước đó là canonical (indexer phải xóa nó khỏi Chroma)."""
+        self._ensure_loaded()
+        was_canonical = chunk_id in self._signatures
+        self._unindex(chunk_id)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM signatures WHERE collection = ? AND chunk_id = ?", (self.collection_name, chunk_id))
+            # Bản sao của chunk cũ chuyển sang canonical mới
+            conn.execute("UPDATE duplicates SET canonical_id = ? WHERE collection = ? AND canonical_id = ?",
+                         (canonical_id, self.collection_name, chunk_id))
+            conn.execute(
+                "INSERT OR REPLACE INTO duplicates VALUES (?, ?, ?, ?, ?, ?)",
+                (self.collection_name, chunk_id, canonical_id, metadata.get("source"),
+                 content, json.dumps(metadata, ensure_ascii=False)),
+            )
+        return was_canonical
+
+    def duplicate_sources(self, canonical_ids: List[str]) -> Dict[str, List[str]]:
+        """canonical_id -> source (không trùng, giữ thứ tự) của các bản sao đã gộp vào nó."""
+        rows = []
+        with self._connect() as conn:
+            for i in range(0, len(canonical_ids), 500):  # Giới hạn số tham số của SQLite
+                batch = canonical_ids[i:i + 500]
+                rows += conn.execute(
+                    f"SELECT canonical_id, source FROM duplicates WHERE collection = ? "
+                    f"AND canonical_id IN ({','.join('?' for _ in batch)}) ORDER BY rowid",
+                    [self.collection_name, *batch],
+                ).fetchall()
+        result: Dict[str, Dict[str, None]] = {cid: {} for cid in canonical_ids}
+        for canonical_id, source in rows:
+            if source:
+                result[canonical_id][source] = None
+        return {cid: list(sources) for cid, sources in result.items()}
+
+    def remove_source(self, source: str) -> Tuple[List[str], Dict[str, List[Tuple[str, str, Dict[str, Any]]]]]:
+        """
+        Xóa dữ liệu dedup của 1 file (theo `source` = đường dẫn tương đối trong KB). Trả về:
+        - touched: canonical (thuộc file khác) mất bớt bản sao -> cần cập nhật `duplicate_sources`.
+        - orphans: canonical thuộc file bị xóa -> [(chunk_id, content, metadata)] các bản sao ở file khác,
+          indexer phải đưa 1 bản lên làm canonical mới.
+        """
+        self._ensure_loaded()
+        with self._connect() as conn:
+            touched = [r[0] for r in conn.execute(
+                "SELECT DISTINCT canonical_id FROM duplicates WHERE collection = ? AND source = ?",
+                (self.collection_name, source),
+            )]
+            conn.execute("DELETE FROM duplicates WHERE collection = ? AND source = ?", (self.collection_name, source))
+            removed = [r[0] for r in conn.execute(
+                "SELECT chunk_id FROM signatures WHERE collection = ? AND source = ?", (self.collection_name, source)
+            )]
+            conn.execute("DELETE FROM signatures WHERE collection = ? AND source = ?", (self.collection_name, source))
+
+            orphans: Dict[str, List[Tuple[str, str, Dict[str, Any]]]] = {}
+            for canonical_id in removed:
+                rows = conn.execute(
+                    "SELECT chunk_id, content, metadata FROM duplicates WHERE collection = ? AND canonical_id = ? "
+                    "ORDER BY rowid", (self.collection_name, canonical_id),
+                ).fetchall()
+                if rows:
+                    orphans[canonical_id] = [(cid, content, json.loads(meta)) for cid, content, meta in rows]
+                conn.execute("DELETE FROM duplicates WHERE collection = ? AND canonical_id = ?",
+                             (self.collection_name, canonical_id))
+
+        for chunk_id in removed:
+            self._unindex(chunk_id)
+        removed_set = set(removed)
+        return [c for c in touched if c not in removed_set], orphans
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM duplicates WHERE collection = ?", (self.collection_name,)
+            ).fetchone()[0]
@@ -1,7 +1,20 @@
 import os
+import time
+from typing import Any, Dict, Optional, Type
 import google.generativeai as genai
 from dotenv import load_dotenv
-from src.app.utils.logger import logger
+from pydantic import BaseModel, ValidationError
+from app.config import (
+    EVAL_STRUCTURED_OUTPUT, EVAL_PARSE_RETRIES, EVAL_MODE, EVAL_SECTIONED_MIN_CHARS, EVAL_MAX_WORKERS, EVAL_CACHE_PATH,
+    EVAL_GATE_THRESHOLD, GEMINI_API_ENDPOINT,
+)
+from app.models import EvaluationResult, SectionEvaluation
+from app.services.pre_evaluator import pre_evaluate
+from app.services.section_eval import CACHE_NAMESPACE as SECTION_CACHE_NAMESPACE, Section, SectionedEvaluation
+from app.utils.json_repair import JSONRepairError, loads_lenient
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.sqlite_cache import SQLiteKVCache
 
 load_dotenv()
 
@@ -62,35 +75,201 @@ BẢN SRS CẦN ĐÁNH GIÁ:
 {srs_content}
 """
 
+SECTION_EVALUATION_PROMPT_TEMPLATE = """
+Bạn là một "Giám khảo AI" chuyên nghiệp. Hãy chấm MỘT MỤC trong bản SRS (các mục khác được chấm riêng).
+
+MỤC CẦN ĐÁNH GIÁ: "{title}"
+
+BỐI CẢNH (CHỈ CÁC TÀI LIỆU GỐC MÀ MỤC NÀY TRÍCH DẪN):
+{rag_context}
+
+### Tiêu chí (Scale 1-10), chỉ xét trong phạm vi mục này:
+1. completeness: Mục có trình bày đủ nội dung cần có của loại mục này không?
+2. consistency: Logic trong mục có mâu thuẫn không?
+3. accuracy: Thuật ngữ và quy trình có chuyên nghiệp, thực tế không?
+4. format_tone: Format Markdown, Mermaid có chuẩn không?
+5. faithfulness: Nội dung có tuân thủ BỐI CẢNH không? Bịa đặt trái ngược Bối cảnh -> < 5.
+   Nếu không có Bối cảnh -> null.
+
+### JSON OUTPUT SCHEMA (BẮT BUỘC):
+{{
+  "scores": {{"completeness": 0, "consistency": 0, "accuracy": 0, "format_tone": 0, "faithfulness": null}},
+  "summary": "1-2 câu nhận xét về mục",
+  "strengths": [],
+  "issues": [
+    {{
+      "criterion": "completeness|consistency|accuracy|format_tone|faithfulness",
+      "problem": "Mô tả ngắn gọn vấn đề",
+      "evidence_quote": "Trích dẫn đoạn văn bản gặp lỗi (nếu có)",
+      "impact": "Ảnh hưởng (Nghiêm trọng/Vừa/Nhẹ)",
+      "recommendation": "Đề xuất sửa đổi"
+    }}
+  ],
+  "quick_fixes": []
+}}
+
+---
+NỘI DUNG MỤC:
+{section_content}
+"""
+
+def response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    JSON Schema của pydantic model -> dạng OpenAPI subset mà Gemini `response_schema` chấp nhận:
+    inline $ref, Optional (anyOf null) -> nullable, bỏ title/default.
+    """
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def convert(node: Dict[str, Any]) -> Dict[str, Any]:
+        if "$ref" in node:
+            return convert(defs[node["$ref"].split("/")[-1]])
+        if "anyOf" in node:
+            options = [o for o in node["anyOf"] if o.get("type") != "null"]
+            out = convert(options[0])
+            if len(options) < len(node["anyOf"]):
+                out["nullable"] = True
+            return out
+        out = {"type": node["type"]}
+        if "properties" in node:
+            out["properties"] = {k: convert(v) for k, v in node["properties"].items()}
+            out["required"] = node.get("required", [])
+        if "items" in node:
+            out["items"] = convert(node["items"])
+        for key in ("enum", "description"):
+            if key in node:
+                out[key] = node[key]
+        return out
+
+    return convert(schema)
+
+
 class Evaluator:
-    def __init__(self):
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+    """
+    Structured output: yêu cầu Gemini trả JSON đúng schema pydantic (response_schema),
+    validate thẳng bằng pydantic (`model_validate_json`, không qua dict trung gian).
+    Nếu lỗi parse -> thử sửa JSON (lenient repair) -> cuối cùng mới gọi lại LLM, chỉ cho lỗi parse/validate.
+
+    Mode: "full" = 1 prompt cho cả SRS, "sectioned" = map-reduce theo mục (xem section_eval),
+    "auto" = sectioned khi SRS dài hơn EVAL_SECTIONED_MIN_CHARS.
+    """
+
+    def __init__(self, structured: bool = EVAL_STRUCTURED_OUTPUT, parse_retries: int = EVAL_PARSE_RETRIES):
+        if GEMINI_API_ENDPOINT:
+            # Endpoint tự chỉ định (http:// cho server local) chỉ đi được qua REST transport
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport="rest",
+                            client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+        else:
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self.model_name = 'gemini-2.5-flash-lite'
+        self.model = genai.GenerativeModel(self.model_name)
+        self.parse_retries = parse_retries
+        self.structured = structured
+        self._schema_supported = True
+        self.sectioned = SectionedEvaluation(
+            self._score_section,
+            cache=SQLiteKVCache(EVAL_CACHE_PATH, SECTION_CACHE_NAMESPACE) if EVAL_CACHE_PATH else None,
+            max_workers=EVAL_MAX_WORKERS,
+            model_name=self.model_name,
+        )
+
+    def _generation_config(self, model_cls: Type[BaseModel]) -> Optional[Dict[str, Any]]:
+        if not self.structured:
+            return None
+        if not self._schema_supported:
+            return {"response_mime_type": "application/json"}
+        return {"response_mime_type": "application/json", "response_schema": response_schema(model_cls)}
 
-    def evaluate_srs(self, srs_content: str, rag_context: str = None) -> dict:
-        logger.info(f"[Evaluator] Assessing SRS (Context Provided: {bool(rag_context)})...")
+    def _generate(self, prompt: str, model_cls: Type[BaseModel]) -> str:
+        config = self._generation_config(model_cls)
+        if config is None:
+            return self.model.generate_content(prompt).text
         try:
+            response = self.model.generate_content(prompt, generation_config=config)
+        except (TypeError, ValueError, KeyError) as e:
+            if "response_schema" not in config:
+                raise
+            # SDK cũ không hỗ trợ response_schema -> chỉ giữ JSON mode
+            logger.warning(f"[Evaluator] response_schema not supported ({e}), falling back to JSON mode")
+            self._schema_supported = False
+            response = self.model.generate_content(prompt, generation_config=self._generation_config(model_cls))
+        return response.text
+
+    @staticmethod
+    def parse_result(text: str, model_cls: Type[BaseModel] = EvaluationResult) -> BaseModel:
+        """Fast path: validate thẳng từ JSON string; lỗi thì repair (fence, dấu phẩy thừa, bị cắt cụt) rồi validate lại."""
+        try:
+            result = model_cls.model_validate_json(text)
+            metrics.inc("evaluator_parse_total", outcome="direct")
+            return result
+        except ValidationError:
+            pass
+        result = model_cls.model_validate(loads_lenient(text))
+        metrics.inc("evaluator_parse_total", outcome="repaired")
+        return result
+
+    def _complete(self, prompt: str, model_cls: Type[BaseModel]) -> BaseModel:
+        """Gọi LLM + parse; chỉ gọi lại khi output không parse/validate được (lỗi API raise luôn)."""
+        last_error = None
+        for attempt in range(self.parse_retries + 1):
+            try:
+                text = self._generate(prompt, model_cls)
+            except Exception as e:
+                # Lỗi API (quota, network...) không retry ở đây
+                logger.error(f"[Evaluator Error] {e}")
+                raise
+            metrics.inc("evaluator_llm_calls_total")
+            try:
+                return self.parse_result(text, model_cls)
+            except (ValidationError, JSONRepairError) as e:
+                metrics.inc("evaluator_parse_total", outcome="failed")
+                logger.warning(f"[Evaluator] Unparseable output (attempt {attempt + 1}/{self.parse_retries + 1}): {e}")
+                last_error = e
+
+        logger.error(f"[Evaluator Error] Giving up after {self.parse_retries + 1} attempts")
+        raise ValueError(f"Evaluator returned invalid JSON: {last_error}") from last_error
+
+    def _score_section(self, section: Section, context: str) -> SectionEvaluation:
+        prompt = SECTION_EVALUATION_PROMPT_TEMPLATE.format(
+            title=section.title,
+            section_content=section.content,
+            rag_context=context or "Không có (mục này không trích dẫn tài liệu nào) -> faithfulness = null",
+        )
+        return self._complete(prompt, SectionEvaluation)
+
+    def evaluate_srs(self, srs_content: str, rag_context: str = None, mode: Optional[str] = None) -> dict:
+        mode = mode or EVAL_MODE
+        if mode == "auto":
+            mode = "sectioned" if len(srs_content) >= EVAL_SECTIONED_MIN_CHARS else "full"
+        logger.info(f"[Evaluator] Assessing SRS (Context Provided: {bool(rag_context)}, mode={mode})...")
+
+        start = time.perf_counter()
+        if mode == "sectioned":
+            result = self.sectioned.run(srs_content, rag_context)
+        else:
             # Handle empty context gracefully
             context_display = rag_context if rag_context else "Không có ngữ cảnh (Đánh giá ở chế độ General Knowledge)"
-            
             full_eval_prompt = EVALUATION_PROMPT_TEMPLATE.format(
                 srs_content=srs_content,
                 rag_context=context_display
             )
-            response = self.model.generate_content(full_eval_prompt)
-            
-            # Clean and Parse JSON
-            cleaned_response = response.text.strip()
-            if cleaned_response.startswith("```json"):
-                cleaned_response = cleaned_response[7:]
-            if cleaned_response.endswith("```"):
-                cleaned_response = cleaned_response[:-3]
-            cleaned_response = cleaned_response.strip()
-            
-            import json
-            result = json.loads(cleaned_response)
-            logger.success(f"[Evaluator] Score: {result.get('score', {}).get('total_weighted_score', 'N/A')}")
-            return result
-        except Exception as e:
-            logger.error(f"[Evaluator Error] {e}")
-            raise e
+            result = self._complete(full_eval_prompt, EvaluationResult)
+        metrics.observe("evaluator_seconds", time.perf_counter() - start, mode=mode)
+        logger.success(f"[Evaluator] Score: {result.score.total_weighted_score}")
+        return result.model_dump()
+
+    def assess(self, srs_content: str, rag_context: str = None, mode: Optional[str] = None,
+               force: bool = False) -> Dict[str, Any]:
+        """
+        Pre-evaluation heuristic (ms) trước; chỉ gọi LLM judge khi pre_score >= EVAL_GATE_THRESHOLD hoặc `force`.
+        Trả về {"pre_evaluation": ..., "evaluation_result": dict | None}.
+        """
+        pre = pre_evaluate(srs_content, rag_context, threshold=EVAL_GATE_THRESHOLD)
+        metrics.observe("pre_evaluator_seconds", pre.elapsed_ms / 1000)
+        if not pre.passed and not force:
+            metrics.inc("evaluator_gate_total", decision="skipped")
+            logger.info(f"[Evaluator] Pre-score {pre.pre_score} < {EVAL_GATE_THRESHOLD}, skipping LLM judge "
+                        f"(missing: {pre.checks.missing_sections})")
+            return {"pre_evaluation": pre.model_dump(), "evaluation_result": None}
+        metrics.inc("evaluator_gate_total", decision="forced" if not pre.passed else "passed")
+        return {"pre_evaluation": pre.model_dump(), "evaluation_result": self.evaluate_srs(srs_content, rag_context, mode)}
@@ -0,0 +1,124 @@
+"""
+Hybrid Fusion: gộp kết quả Vector Search + Keyword Search (BM25).
+
+Các chiến lược:
+- rrf:    Weighted Reciprocal Rank Fusion, chỉ dùng thứ hạng: sum(w_m / (c + rank)).
+- score:  Normalized-score fusion (CombSUM có trọng số) trên điểm đã chuẩn hóa (min-max / z-score).
+- convex: Convex combination alpha * vector + (1 - alpha) * keyword, doc thiếu ở 1 modality nhận điểm thấp nhất.
+"""
+
+import re
+import statistics
+from typing import List, Dict, Optional
+
+from app.models import FusionConfig
+
+# Token dạng mã chính xác: SKU-00123, PO_2024_01, INB-BR-01, A12B...
+EXACT_CODE_PATTERN = re.compile(r"\b(?=[\w-]*\d)(?=[\w-]*[A-Za-z])[A-Za-z0-9]+(?:[-_][A-Za-z0-9]+)*\b")
+
+
+def normalize_scores(scores: List[float], method: str = "minmax") -> List[float]:
+    """Chuẩn hóa điểm của 1 modality về cùng thang đo."""
+    if not scores:
+        return []
+    if method == "zscore":
+        if len(scores) < 2:
+            return [0.0 for _ in scores]
+        mean = statistics.fmean(scores)
+        std = statistics.pstdev(scores)
+        return [(s - mean) / std if std > 0 else 0.0 for s in scores]
+
+    lo, hi = min(scores), max(scores)
+    if hi == lo:
+        return [1.0 for _ in scores]
+    return [(s - lo) / (hi - lo) for s in scores]
+
+
+def _collect(result_lists: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+    """Map ID -> doc, lưu lại điểm gốc của từng modality để không mất thông tin magnitude."""
+    docs = {}
+    for modality, results in result_lists.items():
+        for rank, doc in enumerate(results):
+            entry = docs.setdefault(doc["id"], {**doc, "scores": {}, "ranks": {}})
+            entry["scores"][modality] = doc.get("initial_score", 0.0)
+            entry["ranks"][modality] = rank + 1
+    if len(result_lists) > 1:
+        for entry in docs.values():
+            if len(entry["ranks"]) > 1:
+                entry["search_type"] = "hybrid"
+    return docs
+
+
+def weighted_rrf(result_lists: Dict[str, List[Dict]], weights: Dict[str, float], c: int = 60) -> List[Dict]:
+    """Weighted Reciprocal Rank Fusion."""
+    docs = _collect(result_lists)
+    for entry in docs.values():
+        entry["fusion_score"] = sum(weights.get(m, 1.0) / (c + rank) for m, rank in entry["ranks"].items())
+    return sorted(docs.values(), key=lambda x: x["fusion_score"], reverse=True)
+
+
+def score_fusion(result_lists: Dict[str, List[Dict]], weights: Dict[str, float],
+                 normalization: str = "minmax", convex: bool = False) -> List[Dict]:
+    """Normalized-score fusion; convex=True chuẩn hóa trọng số về tổng 1 và phạt doc thiếu modality."""
+    docs = _collect(result_lists)
+    normalized = {}
+    floor = {}
+    for modality, results in result_lists.items():
+        norm = normalize_scores([r.get("initial_score", 0.0) for r in results], normalization)
+        normalized[modality] = {r["id"]: s for r, s in zip(results, norm)}
+        floor[modality] = min(norm) if norm else 0.0
+
+    total_weight = sum(weights.get(m, 1.0) for m in result_lists) or 1.0
+    for doc_id, entry in docs.items():
+        score = 0.0
+        for modality in result_lists:
+            w = weights.get(modality, 1.0)
+            if convex:
+                w = w / total_weight
+                score += w * normalized[modality].get(doc_id, floor[modality])
+            elif doc_id in normalized[modality]:
+                score += w * normalized[modality][doc_id]
+        entry["fusion_score"] = score
+    return sorted(docs.values(), key=lambda x: x["fusion_score"], reverse=True)
+
+
+def fuse(vector_results: List[Dict], keyword_results: List[Dict], config: FusionConfig,
+         limit: Optional[int] = None) -> List[Dict]:
+    """Điểm vào chung: chọn chiến lược theo config."""
+    weights = {"vector": config.vector_weight, "keyword": config.keyword_weight}
+    result_lists = {m: r for m, r in (("vector", vector_results), ("keyword", keyword_results))
+                    if r and weights[m] > 0}
+    if not result_lists:
+        return []
+
+    if config.method == "rrf":
+        fused = weighted_rrf(result_lists, weights, c=config.rrf_k)
+    else:
+        fused = score_fusion(result_lists, weights, config.normalization, convex=config.method == "convex")
+    return fused[:limit] if limit else fused
+
+
+def exact_codes(query: str) -> List[str]:
+    """Trích các token dạng mã (SKU, số phiếu, mã Business Rule...) trong query."""
+    return [m.group(0) for m in EXACT_CODE_PATTERN.finditer(query)]
+
+
+def keyword_is_sufficient(query: str, keyword_results: List[Dict], config: FusionConfig) -> bool:
+    """
+    Short-circuit: query chứa mã chính xác và BM25 đã tìm thấy doc chứa mã đó với điểm vượt trội
+    -> không cần chạy Vector Search.
+    """
+    if not config.short_circuit or not keyword_results:
+        return False
+    codes = exact_codes(query)
+    if not codes:
+        return False
+
+    top = keyword_results[0]
+    content = top.get("content", "").lower()
+    if not all(code.lower() in content for code in codes):
+        return False
+    if len(keyword_results) == 1:
+        return True
+    runner_up = keyword_results[1].get("initial_score", 0.0)
+    return top.get("initial_score", 0.0) >= config.short_circuit_ratio * max(runner_up, 1e-9)
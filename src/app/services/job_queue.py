@@ -0,0 +1,262 @@
+"""
+Job Queue: chạy các workflow dài (generate, generate + evaluate) ở background thay vì giữ HTTP connection.
+
+- Job được lưu trong SQLite -> restart server không mất job (job đang chạy dở được xếp lại hàng đợi).
+- Worker pool (thread) giới hạn số job chạy đồng thời; hàng đợi ưu tiên theo `priority` (cao chạy trước).
+- Dedup: submit trùng (cùng kind + payload) khi job cũ còn queued/running -> trả về job cũ.
+- Client poll `get()` hoặc chờ thay đổi trạng thái bằng `wait()` (long-poll / SSE ở API).
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.logger import logger
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+IN_FLIGHT = (QUEUED, RUNNING)
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+_COLUMNS = ("id", "kind", "status", "priority", "payload", "dedup_key", "result", "error",
+            "created_at", "started_at", "finished_at", "attempts")
+
+
+class QueueFull(RuntimeError):
+    """Số job đang chờ đã chạm giới hạn `max_pending`."""
+
+
+def dedup_key(kind: str, payload: Dict[str, Any]) -> str:
+    canonical = json.dumps({"kind": kind, "payload": payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    """
+    Hàng đợi job bền vững (SQLite) + worker pool.
+    `handlers`: kind -> hàm nhận payload (dict) và trả về result (JSON-serializable).
+    """
+
+    def __init__(self, db_path: str, handlers: Dict[str, Callable[[Dict[str, Any]], Any]],
+                 max_workers: int = 2, max_pending: int = 100, retention_hours: float = 24):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.handlers = handlers
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention_hours = retention_hours
+        self._pending: "queue.PriorityQueue[tuple]" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._stop = threading.Event()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    dedup_key TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs (dedup_key, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---- Lifecycle ----
+
+    def start(self):
+        """Dọn job cũ, xếp lại job queued/running từ lần chạy trước rồi khởi động worker."""
+        with self._connect() as conn:
+            conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({','.join('?' for _ in FINISHED)}) AND finished_at < ?",
+                (*FINISHED, time.time() - self.retention_hours * 3600),
+            )
+            conn.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING))
+            rows = conn.execute(
+                "SELECT id, priority FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()
+        for row in rows:
+            self._enqueue(row["id"], row["priority"])
+        if rows:
+            logger.info(f"[JobQueue] Recovered {len(rows)} pending jobs")
+
+        self._stop.clear()
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self, timeout: float = 5.0):
+        """Dừng nhận job mới; job đang chạy dở sẽ được xếp lại khi start lần sau."""
+        self._stop.set()
+        for _ in self._workers:
+            self._pending.put((float("-inf"), next(self._seq), None))  # Sentinel được lấy trước mọi job
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    # ---- API ----
+
+    def submit(self, kind: str, payload: Dict[str, Any], priority: int = 0) -> Dict[str, Any]:
+        """Tạo job mới, hoặc trả về job trùng đang queued/running (`deduplicated=True`)."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}', expected one of {sorted(self.handlers)}")
+        key = dedup_key(kind, payload)
+
+        with self._lock:
+            with self._connect() as conn:
+                existing = conn.execute(
+                    "SELECT * FROM jobs WHERE dedup_key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                    (key, *IN_FLIGHT),
+                ).fetchone()
+                if existing:
+                    return {**self._to_dict(existing), "deduplicated": True}
+
+                pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+                if pending >= self.max_pending:
+                    raise QueueFull(f"{pending} jobs already queued (max {self.max_pending})")
+
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, status, priority, payload, dedup_key, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, QUEUED, priority, json.dumps(payload, ensure_ascii=False), key, time.time()),
+                )
+            self._enqueue(job_id, priority)
+        return {**self.get(job_id), "deduplicated": False}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query, params = "SELECT * FROM jobs", []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._to_dict(row, include_result=False) for row in rows]
+
+    def cancel(self, job_id: str) -> bool:
+        """Hủy job còn đang chờ (job đang chạy không thể dừng giữa chừng)."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+        if cursor.rowcount:
+            self._notify()
+        return bool(cursor.rowcount)
+
+    def wait(self, job_id: str, timeout: float, since_status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Chờ tối đa `timeout` giây đến khi job kết thúc (hoặc đổi khỏi `since_status`), trả về trạng thái mới nhất.
+        Dùng cho long-poll / SSE thay vì client poll dồn dập.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in FINISHED or (since_status and job["status"] != since_status):
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            with self._changed:
+                self._changed.wait(min(remaining, 1.0))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "jobs": {row["status"]: row["n"] for row in rows},
+        }
+
+    # ---- Internals ----
+
+    def _enqueue(self, job_id: str, priority: int):
+        # PriorityQueue lấy phần tử nhỏ nhất -> đảo dấu priority; seq giữ FIFO trong cùng mức ưu tiên
+        self._pending.put((-priority, next(self._seq), job_id))
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _claim(self, job_id: str) -> Optional[sqlite3.Row]:
+        """Chuyển queued -> running (atomic); None nếu job đã bị hủy / worker khác lấy."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED),
+            )
+            if not cursor.rowcount:
+                return None
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, time.time(), job_id),
+            )
+        self._notify()
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            _, _, job_id = self._pending.get()
+            if job_id is None or self._stop.is_set():
+                break
+            row = self._claim(job_id)
+            if row is None:
+                continue
+            self._notify()
+            logger.info(f"[JobQueue] Running {row['kind']} job {job_id}")
+            try:
+                result = self.handlers[row["kind"]](json.loads(row["payload"]))
+                self._finish(job_id, SUCCEEDED, result=result)
+                logger.success(f"[JobQueue] Job {job_id} succeeded")
+            except Exception as e:
+                logger.error(f"[JobQueue] Job {job_id} failed: {e}")
+                self._finish(job_id, FAILED, error=str(e))
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row, include_result: bool = True) -> Dict[str, Any]:
+        job = {col: row[col] for col in _COLUMNS if col not in ("payload", "dedup_key", "result")}
+        if include_result:
+            job["payload"] = json.loads(row["payload"])
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
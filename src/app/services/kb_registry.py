@@ -0,0 +1,178 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+import chromadb
+import torch
+
+from app.config import (
+    RAG_DB_PATH, DEFAULT_COLLECTION, KB_MEMORY_CAP_MB, KB_SNAPSHOT_DIR, MODEL_WORKERS, MODEL_WORKER_THREADS,
+)
+from app.services.model_pool import ModelWorkerPool
+from app.services.rag_retriever import RAGRetriever, load_embedding_function, load_reranker, make_batchers
+from app.services.snapshot import SNAPSHOT_SUFFIX, import_snapshot, load_snapshot
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+
+class KnowledgeBaseNotFound(KeyError):
+    """Collection không tồn tại trong Vector DB."""
+
+
+class KnowledgeBaseRegistry:
+    """
+    Quản lý nhiều Knowledge Base (mỗi domain khách hàng 1 collection: WMS, GSP, HR...) trong 1 process.
+
+    - Embedding model + Cross-Encoder được load 1 lần, dùng chung cho mọi collection.
+    - RAGRetriever (BM25 + Chroma handle) của từng collection chỉ được nạp khi có request đầu tiên.
+    - Khi tổng RAM ước lượng vượt `memory_cap_mb`, collection ít dùng gần đây nhất bị evict (LRU).
+    """
+
+    def __init__(self, persist_path: str = RAG_DB_PATH, memory_cap_mb: int = KB_MEMORY_CAP_MB,
+                 snapshot_dir: str = KB_SNAPSHOT_DIR, model_workers: int = MODEL_WORKERS):
+        self.persist_path = persist_path
+        self.snapshot_dir = snapshot_dir
+        self.memory_cap_bytes = memory_cap_mb * 1024 * 1024
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # Settings mặc định: Chroma chỉ cho 1 cấu hình client / path trong 1 process (Indexer, script dùng chung path)
+        self.client = chromadb.PersistentClient(path=persist_path)
+        self._embedding_fn = None
+        self._reranker = None
+        self._batchers = None
+        self.model_pool = ModelWorkerPool(model_workers, MODEL_WORKER_THREADS) if model_workers > 0 else None
+        self._handles: "OrderedDict[str, RAGRetriever]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def _shared_models(self):
+        if self._embedding_fn is None:
+            self._embedding_fn = load_embedding_function(self.device)
+        if self._reranker is None:
+            # Có model pool: Cross-Encoder chỉ nằm trong worker, pool.predict thay cho CrossEncoder.predict
+            self._reranker = self.model_pool.start() if self.model_pool else load_reranker(self.device)
+        if self._batchers is None:
+            # Micro-batch chung cho mọi collection: request vào các KB khác nhau vẫn gộp được forward pass
+            # (embedding_fn vẫn giữ ở process chính cho Chroma / Indexer, query embedding đi qua pool)
+            embed = self.model_pool.embed if self.model_pool else self._embedding_fn
+            self._batchers = make_batchers(embed, self._reranker)
+        return self._embedding_fn, self._reranker
+
+    def _snapshot_path(self, name: str) -> Optional[str]:
+        if not self.snapshot_dir:
+            return None
+        path = os.path.join(self.snapshot_dir, name + SNAPSHOT_SUFFIX)
+        return path if os.path.exists(path) else None
+
+    def list_collections(self) -> List[str]:
+        # Chroma 0.6 trả về tên, các bản khác trả về Collection object
+        return sorted(c if isinstance(c, str) else c.name for c in self.client.list_collections())
+
+    def get(self, name: Optional[str] = None) -> RAGRetriever:
+        """Lấy retriever của collection, nạp lazy nếu chưa có trong RAM."""
+        name = name or DEFAULT_COLLECTION
+        with self._lock:
+            if name in self._handles:
+                self._handles.move_to_end(name)
+                metrics.inc("kb_registry_lookups_total", result="hit")
+                return self._handles[name]
+            if name not in self.list_collections() and not self._snapshot_path(name):
+                raise KnowledgeBaseNotFound(name)
+            load_lock = self._loading.setdefault(name, threading.Lock())
+
+        # Build BM25 ngoài global lock để các collection khác vẫn phục vụ được trong lúc nạp
+        with load_lock:
+            with self._lock:
+                if name in self._handles:
+                    self._handles.move_to_end(name)
+                    metrics.inc("kb_registry_lookups_total", result="hit")
+                    return self._handles[name]
+            metrics.inc("kb_registry_lookups_total", result="miss")
+            embedding_fn, reranker = self._shared_models()
+            logger.info(f"[KB Registry] Loading knowledge base '{name}'...")
+            snapshot = None
+            snapshot_path = self._snapshot_path(name)
+            if snapshot_path:
+                # Raise SnapshotMismatch nếu embedding model khác lúc export -> từ chối nạp
+                snapshot = load_snapshot(snapshot_path, embedding_fn=embedding_fn)
+                if name not in self.list_collections():
+                    import_snapshot(snapshot, self.client, embedding_fn, collection_name=name)
+            retriever = RAGRetriever(
+                persist_path=self.persist_path, collection_name=name, client=self.client,
+                embedding_fn=embedding_fn, reranker=reranker, snapshot=snapshot, batchers=self._batchers,
+            )
+            with self._lock:
+                self._handles[name] = retriever
+                self._loading.pop(name, None)
+                self._evict_over_cap(keep=name)
+            return retriever
+
+    def _evict_over_cap(self, keep: str):
+        while len(self._handles) > 1 and self.memory_bytes() > self.memory_cap_bytes:
+            victim = next(iter(self._handles))
+            if victim == keep:
+                break
+            self._handles.pop(victim)
+            logger.info(f"[KB Registry] Evicted '{victim}' (LRU, memory cap {self.memory_cap_bytes // (1024 * 1024)} MB)")
+
+    @property
+    def embedding_function(self):
+        """Embedding function dùng chung (vd: cho RAGIndexer trong watch mode)."""
+        return self._shared_models()[0]
+
+    def reload(self, name: str):
+        """
+        Nạp lại collection đang có trong RAM (sau khi index thay đổi) rồi thay handle.
+        Request đang chạy vẫn dùng handle cũ đến khi xong; collection chưa nạp thì bỏ qua.
+        """
+        with self._lock:
+            if name not in self._handles:
+                return
+        embedding_fn, reranker = self._shared_models()
+        retriever = RAGRetriever(
+            persist_path=self.persist_path, collection_name=name, client=self.client,
+            embedding_fn=embedding_fn, reranker=reranker, batchers=self._batchers,
+        )
+        with self._lock:
+            self._handles[name] = retriever
+            self._handles.move_to_end(name)
+            self._evict_over_cap(keep=name)
+
+    def apply_changes(self, name: str, upserted_ids: List[str], removed_ids: List[str]):
+        """
+        Áp dụng delta index (watch mode) vào collection đang nạp, không build lại BM25 từ đầu (xem RAGRetriever.apply_changes).
+        Collection chưa nạp thì bỏ qua: lần nạp sau đọc dữ liệu mới từ Chroma.
+        """
+        with self._lock:
+            current = self._handles.get(name)
+        if current is None:
+            return
+        retriever = current.apply_changes(upserted_ids, removed_ids)
+        with self._lock:
+            if self._handles.get(name) is current:  # Bị reload / evict trong lúc áp dụng -> giữ bản đó
+                self._handles[name] = retriever
+                self._evict_over_cap(keep=name)
+
+    def invalidate(self, name: str):
+        """Bỏ handle để lần truy cập sau nạp lại (vd: sau khi re-index)."""
+        with self._lock:
+            self._handles.pop(name, None)
+
+    def close(self):
+        """Dừng model worker (nếu có)."""
+        if self.model_pool:
+            self.model_pool.close()
+
+    def memory_bytes(self) -> int:
+        return sum(r.memory_bytes for r in self._handles.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "collections": self.list_collections(),
+                "snapshot_dir": self.snapshot_dir or None,
+                "loaded": {name: {"memory_mb": round(r.memory_bytes / (1024 * 1024), 2)}
+                           for name, r in self._handles.items()},
+                "memory_cap_mb": self.memory_cap_bytes // (1024 * 1024),
+                "model_workers": self.model_pool.size if self.model_pool else 0,
+            }
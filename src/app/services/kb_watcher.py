@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.rag_indexer import RAGIndexer, iter_source_files
+from app.utils.logger import logger
+
+try:
+    # Optional: inotify/FSEvents qua watchdog -> phản ứng ngay thay vì chờ chu kỳ polling
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class _WakeUpHandler(FileSystemEventHandler):
+    def __init__(self, wake_event: threading.Event):
+        self.wake_event = wake_event
+
+    def on_any_event(self, event):
+        self.wake_event.set()
+
+
+class KnowledgeBaseWatcher:
+    """
+    Theo dõi thư mục Knowledge Base và áp dụng thay đổi incremental vào Chroma + Parent Store.
+
+    - Phát hiện thay đổi bằng snapshot (mtime, size) mỗi `poll_interval` giây; nếu có watchdog thì
+      sự kiện inotify đánh thức vòng quét sớm hơn.
+    - Debounce: chỉ apply khi thư mục "yên" trong `debounce` giây (tránh index file đang ghi dở).
+    - Sau mỗi lần apply gọi `on_change(upserted_ids, removed_ids)` với các chunk id đã đổi
+      (vd: KnowledgeBaseRegistry.apply_changes cập nhật BM25 đang nạp trong API server).
+    """
+
+    def __init__(self, indexer: RAGIndexer, folder_path: str, include: Optional[List[str]] = None,
+                 exclude: Optional[List[str]] = None,
+                 on_change: Optional[Callable[[List[str], List[str]], None]] = None,
+                 poll_interval: float = 2.0, debounce: float = 1.5):
+        self.indexer = indexer
+        self.folder_path = folder_path
+        self.include = include
+        self.exclude = exclude
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+
+    def scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for file_path, _ in iter_source_files(self.folder_path, self.include, self.exclude):
+            try:
+                stat = os.stat(file_path)
+                snapshot[file_path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                continue # File bị xóa giữa lúc quét
+        return snapshot
+
+    def start(self, initial_sync: bool = False):
+        """Bắt đầu theo dõi. initial_sync=True sẽ index các file khác với lần quét đầu (coi mọi file là mới)."""
+        self._snapshot = {} if initial_sync else self.scan()
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_WakeUpHandler(self._wake), self.folder_path, recursive=True)
+            self._observer.start()
+        self._thread = threading.Thread(target=self._run, name="kb-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"[KB Watcher] Watching '{self.folder_path}' -> collection '{self.indexer.collection_name}' "
+                    f"({'inotify' if self._observer else 'polling'})")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        last_seen, changed_at = self._snapshot, None
+        while not self._stop.is_set():
+            # Khi đang chờ debounce thì quét dày hơn để apply đúng lúc
+            self._wake.wait(min(self.poll_interval, self.debounce) if changed_at else self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+
+            current = self.scan()
+            if current != last_seen:
+                # Còn đang thay đổi -> reset đồng hồ debounce
+                last_seen, changed_at = current, time.monotonic()
+            if changed_at is not None and time.monotonic() - changed_at >= self.debounce:
+                if current != self._snapshot:
+                    self.apply(current)
+                changed_at = None
+
+    def apply(self, current: Dict[str, Tuple[int, int]]):
+        """Áp dụng diff giữa snapshot cũ và mới: upsert file mới/sửa, xóa file đã mất."""
+        changed = [p for p, sig in current.items() if self._snapshot.get(p) != sig]
+        removed = [p for p in self._snapshot if p not in current]
+
+        for file_path in removed:
+            try:
+                self.indexer.remove_file(file_path, self.folder_path)
+                logger.info(f"[KB Watcher] Removed {file_path}")
+            except Exception as e:
+                logger.error(f"[KB Watcher] Failed to remove {file_path}: {e}")
+        for file_path in changed:
+            try:
+                num_chunks = self.indexer.index_file(file_path, self.folder_path)
+                logger.info(f"[KB Watcher] Indexed {file_path} ({num_chunks} chunks)")
+            except Exception as e:
+                logger.error(f"[KB Watcher] Failed to index {file_path}: {e}")
+
+        self._snapshot = current
+        upserted_ids, removed_ids = self.indexer.pop_changes()
+        if (upserted_ids or removed_ids) and self.on_change:
+            self.on_change(upserted_ids, removed_ids)
@@ -0,0 +1,65 @@
+"""
+Cập nhật BM25 (rank_bm25.BM25Okapi) theo delta thay vì build lại toàn bộ corpus.
+
+Watch mode chỉ sửa vài file mỗi lần: chỉ tokenize / đếm term của các chunk đổi, giữ nguyên term freqs của
+các chunk còn lại; idf được tính lại từ bảng document frequency (kích thước = vocabulary, không phải corpus).
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from rank_bm25 import BM25Okapi
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenize đơn giản theo khoảng trắng (Production nên dùng ViTokenizer) - dùng chung cho corpus và query."""
+    return text.lower().split()
+
+
+def document_frequencies(bm25: BM25Okapi) -> Dict[str, int]:
+    """Term -> số document chứa term. rank_bm25 bỏ bảng này sau khi tính idf nên đếm lại 1 lần rồi giữ trên object."""
+    nd = getattr(bm25, "nd", None)
+    if nd is None:
+        nd = Counter()
+        for freqs in bm25.doc_freqs:
+            nd.update(freqs.keys())
+        bm25.nd = nd
+    return nd
+
+
+def update_bm25(bm25: Optional[BM25Okapi], keep_rows: Sequence[int],
+                added_corpus: List[List[str]]) -> Optional[BM25Okapi]:
+    """
+    BM25 mới gồm các hàng `keep_rows` của `bm25` (theo thứ tự đó) rồi tới `added_corpus` (đã tokenize).
+    `bm25` cũ không bị sửa (request đang chạy vẫn dùng được). Trả về None nếu corpus mới rỗng.
+    """
+    if bm25 is None:
+        return BM25Okapi(added_corpus) if any(added_corpus) else None
+
+    nd = Counter(document_frequencies(bm25))
+    kept = set(keep_rows)
+    for row in range(bm25.corpus_size):
+        if row not in kept:
+            nd.subtract(bm25.doc_freqs[row].keys())
+    doc_freqs = [bm25.doc_freqs[row] for row in keep_rows]
+    doc_len = [bm25.doc_len[row] for row in keep_rows]
+    for tokens in added_corpus:
+        freqs = dict(Counter(tokens))
+        doc_freqs.append(freqs)
+        doc_len.append(len(tokens))
+        nd.update(freqs.keys())
+    nd = Counter({word: count for word, count in nd.items() if count > 0})
+    if not nd:
+        return None
+
+    updated = BM25Okapi.__new__(BM25Okapi)
+    updated.k1, updated.b, updated.epsilon = bm25.k1, bm25.b, bm25.epsilon
+    updated.tokenizer = None
+    updated.corpus_size = len(doc_freqs)
+    updated.doc_freqs = doc_freqs
+    updated.doc_len = doc_len
+    updated.avgdl = sum(doc_len) / len(doc_len)
+    updated.idf = {}
+    updated._calc_idf(nd)
+    updated.nd = nd
+    return updated
@@ -0,0 +1,110 @@
+"""
+Metadata Filter: đẩy điều kiện lọc (source, section, category, ngày index) xuống tầng tìm kiếm.
+
+- Vector: chuyển RetrievalFilter -> mệnh đề `where` của ChromaDB (lọc trước khi tính khoảng cách).
+- Keyword: MetadataBitmapIndex dựng sẵn posting list (giá trị metadata -> doc index) lúc build BM25,
+  khi query chỉ ghép bitmap ứng viên và chấm BM25 trên tập con đó.
+"""
+
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from app.models import RetrievalFilter
+
+FILTER_FIELDS = ("source", "section", "category")
+
+
+def _created_ts(metadata: Dict[str, Any]) -> float:
+    """Timestamp lúc index; fallback parse `created_at` cho index cũ chưa có `created_ts`."""
+    if "created_ts" in metadata:
+        return float(metadata["created_ts"])
+    try:
+        return datetime.fromisoformat(metadata["created_at"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return float("nan")
+
+
+def is_empty(filters: Optional[RetrievalFilter]) -> bool:
+    if filters is None:
+        return True
+    return not any(getattr(filters, f) for f in FILTER_FIELDS) and not filters.created_after and not filters.created_before
+
+
+def has_date_filter(filters: Optional[RetrievalFilter]) -> bool:
+    return filters is not None and bool(filters.created_after or filters.created_before)
+
+
+def to_chroma_where(filters: Optional[RetrievalFilter], dates: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Chuyển filter sang cú pháp `where` của ChromaDB. Trả về None nếu không có điều kiện.
+    `dates=False`: bỏ điều kiện ngày (caller tự lọc sau, vd: index cũ có chunk chưa có `created_ts`).
+    """
+    if is_empty(filters):
+        return None
+
+    clauses = []
+    for field in FILTER_FIELDS:
+        values = getattr(filters, field)
+        if values:
+            clauses.append({field: values[0]} if len(values) == 1 else {field: {"$in": list(values)}})
+    # Chroma chỉ so sánh $gte/$lte trên số -> dùng created_ts (epoch seconds)
+    if dates and filters.created_after:
+        clauses.append({"created_ts": {"$gte": filters.created_after.timestamp()}})
+    if dates and filters.created_before:
+        clauses.append({"created_ts": {"$lte": filters.created_before.timestamp()}})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class MetadataBitmapIndex:
+    """Posting list metadata -> doc index (int32), ghép thành bitmap ứng viên khi query."""
+
+    def __init__(self, metadatas: List[Dict[str, Any]]):
+        self.size = len(metadatas)
+        postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in FILTER_FIELDS}
+        for idx, metadata in enumerate(metadatas):
+            metadata = metadata or {}
+            for field in FILTER_FIELDS:
+                value = metadata.get(field)
+                if value is not None:
+                    postings[field].setdefault(str(value), []).append(idx)
+
+        self.postings = {
+            field: {value: np.asarray(ids, dtype=np.int32) for value, ids in values.items()}
+            for field, values in postings.items()
+        }
+        self.created_ts = np.asarray([_created_ts(m or {}) for m in metadatas], dtype=np.float64)
+        # Chunk index trước khi có `created_ts`: Chroma `where` theo created_ts sẽ loại chúng (bitmap thì parse created_at)
+        self.missing_created_ts = sum(1 for m in metadatas if "created_ts" not in (m or {}))
+
+    def mask(self, filters: Optional[RetrievalFilter]) -> Optional[np.ndarray]:
+        """Bitmap (bool array) các doc thỏa filter; None nghĩa là không lọc."""
+        if is_empty(filters):
+            return None
+
+        mask = np.ones(self.size, dtype=bool)
+        for field in FILTER_FIELDS:
+            values = getattr(filters, field)
+            if not values:
+                continue
+            field_mask = np.zeros(self.size, dtype=bool)
+            for value in values:
+                ids = self.postings[field].get(value)
+                if ids is not None:
+                    field_mask[ids] = True
+            mask &= field_mask
+
+        # NaN (không rõ ngày) luôn bị loại khi có điều kiện ngày
+        if filters.created_after:
+            mask &= self.created_ts >= filters.created_after.timestamp()
+        if filters.created_before:
+            mask &= self.created_ts <= filters.created_before.timestamp()
+        return mask
+
+    def candidate_ids(self, filters: Optional[RetrievalFilter]) -> Optional[np.ndarray]:
+        mask = self.mask(filters)
+        return None if mask is None else np.flatnonzero(mask)
@@ -0,0 +1,233 @@
+"""
+Model worker pool: chạy Bi-Encoder (query embedding) + Cross-Encoder trong các process riêng.
+
+- Mỗi worker giữ 1 bản model, được ghim vào 1 lát CPU core (sched_setaffinity) với số torch thread riêng
+  -> forward pass không tranh GIL / thread torch với process FastAPI, throughput scale theo số core.
+- Giao tiếp qua multiprocessing Pipe (socket local): payload chỉ là query / passage và mảng float nhỏ.
+- Mỗi worker xử lý 1 request tại 1 thời điểm; caller lấy worker rảnh từ hàng đợi (tự cân bằng tải).
+  Đặt sau MicroBatcher: mỗi batch đi trọn vào 1 worker, N worker chạy N batch song song.
+
+    pool = ModelWorkerPool(workers=4).start()
+    vectors = pool.embed(["quy trình nhập kho"])
+    scores = pool.predict([["query", "passage"]])   # drop-in cho CrossEncoder.predict
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+STARTUP_TIMEOUT = 300  # Giây: lần đầu có thể phải tải model từ HuggingFace
+
+
+class ModelWorkerError(RuntimeError):
+    """Worker trả lỗi hoặc chết giữa chừng (worker chết được khởi động lại ở background)."""
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_slices(workers: int, cores: Optional[Sequence[int]] = None) -> List[List[int]]:
+    """Chia đều core cho các worker (worker thừa core khi workers > số core thì dùng chung vòng tròn)."""
+    cores = list(cores if cores is not None else available_cores())
+    if workers >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(workers)]
+    size = len(cores) // workers
+    return [cores[i * size:(i + 1) * size] for i in range(workers)]
+
+
+def load_models() -> Tuple[Callable, Any]:
+    """Loader mặc định (chạy trong worker): cùng model với RAGRetriever, trên CPU."""
+    import torch
+    from app.services.rag_retriever import load_embedding_function, load_reranker
+
+    torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+    return load_embedding_function("cpu"), load_reranker("cpu")
+
+
+def _worker_main(conn, cores: List[int], threads: int, loader: Callable[[], Tuple[Callable, Any]]):
+    """Entry point của process worker: ghim core, giới hạn thread, load model rồi phục vụ request."""
+    # Phải set trước khi import torch (OpenMP/MKL đọc env lúc khởi tạo)
+    os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    try:
+        embedding_fn, reranker = loader()
+    except Exception as e:
+        conn.send(("error", repr(e)))
+        return
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            op, payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if op == "stop":
+            return
+        try:
+            if op == "embed":
+                result = np.asarray(embedding_fn(payload), dtype=np.float32)
+            elif op == "rerank":
+                result = np.asarray(reranker.predict(payload), dtype=np.float32)
+            else:
+                raise ValueError(f"unknown op '{op}'")
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+
+class _Worker:
+    def __init__(self, index: int, cores: List[int], threads: int, ctx, loader):
+        self.index = index
+        self.cores = cores
+        self.threads = threads
+        self.ctx = ctx
+        self.loader = loader
+        self.conn = None
+        self.process = None
+
+    def spawn(self):
+        parent, child = self.ctx.Pipe()
+        self.process = self.ctx.Process(
+            target=_worker_main, args=(child, self.cores, self.threads, self.loader),
+            name=f"model-worker-{self.index}", daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.conn = parent
+
+    def wait_ready(self, timeout: float):
+        if not self.conn.poll(timeout):
+            raise ModelWorkerError(f"model-worker-{self.index} not ready after {timeout}s")
+        status, detail = self.conn.recv()
+        if status != "ready":
+            raise ModelWorkerError(f"model-worker-{self.index} failed to load models: {detail}")
+        logger.info(f"[Model Pool] Worker {self.index} ready (pid {detail}, cores {self.cores}, {self.threads} threads)")
+
+    def call(self, op: str, payload: Any):
+        self.conn.send((op, payload))
+        status, result = self.conn.recv()
+        if status != "ok":
+            raise ModelWorkerError(f"model-worker-{self.index} {op} failed: {result}")
+        return result
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(("stop", None))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class ModelWorkerPool:
+    """
+    `workers` process, mỗi process `threads` torch thread (0 = số core của lát được ghim).
+    Process được tạo bằng "spawn" (không fork process đang chạy torch / thread của FastAPI).
+    `loader`: hàm top-level (pickle được) trả về (embedding_fn, reranker), chạy trong từng worker.
+    """
+
+    def __init__(self, workers: int = 2, threads: int = 0, cores: Optional[Sequence[int]] = None,
+                 loader: Callable[[], Tuple[Callable, Any]] = load_models):
+        self.ctx = mp.get_context("spawn")
+        slices = core_slices(workers, cores)
+        self._workers = [_Worker(i, s, threads or len(s), self.ctx, loader) for i, s in enumerate(slices)]
+        # None trong hàng đợi = pool không còn worker nào (caller đang chờ nhận lỗi thay vì treo)
+        self._idle: "queue.Queue[Optional[_Worker]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def size(self) -> int:
+        return len(self._workers)
+
+    def start(self) -> "ModelWorkerPool":
+        if self._started:
+            return self
+        for worker in self._workers:
+            worker.spawn()  # Spawn hết rồi mới chờ -> các worker load model song song
+        for worker in self._workers:
+            worker.wait_ready(STARTUP_TIMEOUT)
+            self._idle.put(worker)
+        self._started = True
+        metrics.set_gauge("model_pool_workers", self.size)
+        return self
+
+    def _call(self, op: str, payload: List[Any]) -> np.ndarray:
+        if not self._started:
+            raise ModelWorkerError("ModelWorkerPool.start() has not been called")
+        start = time.perf_counter()
+        worker = self._idle.get()
+        metrics.observe("model_pool_queue_seconds", time.perf_counter() - start, op=op)
+        if worker is None:
+            self._idle.put(None)
+            raise ModelWorkerError("no model workers left (all failed to restart)")
+        alive = True
+        try:
+            with metrics.timer("model_pool_call_seconds", op=op):
+                return worker.call(op, payload)
+        except (EOFError, OSError) as e:
+            # Worker chết (OOM, bị kill...): khởi động lại ở background (load model mất tới STARTUP_TIMEOUT),
+            # request này lỗi ngay, các request khác dùng worker còn lại
+            alive = False
+            metrics.inc("model_pool_restarts_total")
+            logger.error(f"[Model Pool] Worker {worker.index} died during {op}: {e!r}, restarting")
+            threading.Thread(target=self._respawn, args=(worker,), name=f"model-worker-{worker.index}-respawn",
+                             daemon=True).start()
+            raise ModelWorkerError(f"model-worker-{worker.index} died during {op}") from e
+        finally:
+            if alive:
+                self._idle.put(worker)
+
+    def _respawn(self, worker: _Worker):
+        """Chỉ trả worker về hàng đợi khi đã sẵn sàng; khởi động lại lỗi -> bỏ worker, pool nhỏ đi 1."""
+        worker.stop()
+        try:
+            worker.spawn()
+            worker.wait_ready(STARTUP_TIMEOUT)
+        except Exception as e:
+            logger.error(f"[Model Pool] Worker {worker.index} failed to restart: {e!r}, dropping it")
+            worker.stop()
+            with self._lock:
+                self._workers.remove(worker)
+                remaining = len(self._workers)
+            metrics.set_gauge("model_pool_workers", remaining)
+            if not remaining:
+                self._idle.put(None)
+            return
+        if not self._started:  # Pool đã close() trong lúc khởi động lại
+            worker.stop()
+            return
+        self._idle.put(worker)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self._call("embed", list(texts))
+
+    def predict(self, pairs: List[List[str]]) -> np.ndarray:
+        return self._call("rerank", [list(p) for p in pairs])
+
+    def close(self):
+        if not self._started:
+            return
+        self._started = False
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,75 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterable
+
+
+class ParentStore:
+    """
+    Lưu Parent Sections (small-to-big retrieval) trong SQLite cạnh ChromaDB.
+    Parent chỉ được lưu 1 lần và chỉ được đọc cho các child thắng sau Rerank.
+    """
+
+    def __init__(self, persist_path: str, collection_name: str):
+        os.makedirs(persist_path, exist_ok=True)
+        self.db_path = os.path.join(persist_path, "parent_sections.sqlite3")
+        self.collection_name = collection_name
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS parents (
+                    collection TEXT NOT NULL,
+                    parent_id TEXT NOT NULL,
+                    path TEXT,
+                    source TEXT,
+                    section TEXT,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (collection, parent_id)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_parents_source ON parents (collection, source)")
+
+    @contextmanager
+    def _connect(self):
+        # Mỗi thao tác 1 connection -> an toàn khi gọi từ nhiều thread của API server
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def upsert(self, parents: Iterable[Dict[str, Any]]):
+        rows = [
+            (self.collection_name, p["parent_id"], p.get("path"), p.get("source"), p.get("section"), p["content"])
+            for p in parents
+        ]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO parents VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def get_many(self, parent_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not parent_ids:
+            return {}
+        placeholders = ",".join("?" for _ in parent_ids)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT parent_id, path, source, section, content FROM parents "
+                f"WHERE collection = ? AND parent_id IN ({placeholders})",
+                [self.collection_name, *parent_ids],
+            ).fetchall()
+        return {
+            row[0]: {"parent_id": row[0], "path": row[1], "source": row[2], "section": row[3], "content": row[4]}
+            for row in rows
+        }
+
+    def delete_by_source(self, source: str):
+        """Xóa Parent Section của 1 file theo `source` (đường dẫn tương đối trong KB, không phụ thuộc cách viết path)."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM parents WHERE collection = ? AND source = ?", (self.collection_name, source))
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM parents WHERE collection = ?", (self.collection_name,)
+            ).fetchone()[0]
@@ -0,0 +1,96 @@
+import hashlib
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import PyPDF2
+
+from app.utils.logger import logger
+from app.utils.sqlite_cache import SQLiteKVCache
+
+CACHE_NAMESPACE = "pdf_pages:v1" # Đổi version khi thay đổi logic trích xuất
+MIN_PAGES_FOR_POOL = 8           # PDF nhỏ: trích trực tiếp, không đáng chi phí spawn process
+PAGES_PER_TASK = 4
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 nội dung file (đọc theo block, không load cả file vào RAM)."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _extract_range(file_path: str, start: int, end: int) -> List[str]:
+    """Worker: mở PDF và trích text các trang [start, end), mỗi trang chỉ gọi extract_text() 1 lần."""
+    with open(file_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+class PDFExtractor:
+    """
+    Trích text PDF theo từng trang:
+    - Mỗi trang chỉ extract 1 lần, các nhóm trang chạy song song trên nhiều core (ProcessPool).
+    - Cache theo (digest file, số trang) -> re-index PDF không đổi sẽ bỏ qua extraction hoàn toàn.
+    - Trả về iterator (page_no, text) theo thứ tự trang để stream thẳng vào chunker.
+    """
+
+    def __init__(self, cache_path: str, max_workers: Optional[int] = None):
+        self.cache = SQLiteKVCache(cache_path, CACHE_NAMESPACE)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # "spawn": pool được tạo trong API server nhiều thread (watch mode, job worker) -> fork có thể
+            # chép theo lock đang bị giữ (torch, loguru, sqlite) và treo worker
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=mp.get_context("spawn"))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def iter_pages(self, file_path: str) -> Iterator[Tuple[int, str]]:
+        """Yield (page_no 1-based, text) theo thứ tự trang, bỏ qua trang rỗng."""
+        digest = file_digest(file_path)
+        num_pages = self.cache.get(f"{digest}:num_pages")
+
+        if num_pages is not None:
+            cached = self.cache.get_many([f"{digest}:{i}" for i in range(num_pages)])
+            if len(cached) == num_pages:
+                logger.debug(f"[PDF] Cache hit for {os.path.basename(file_path)} ({num_pages} pages)")
+                for i in range(num_pages):
+                    if cached[f"{digest}:{i}"].strip():
+                        yield i + 1, cached[f"{digest}:{i}"]
+                return
+
+        with open(file_path, "rb") as f:
+            num_pages = len(PyPDF2.PdfReader(f).pages)
+
+        ranges = [(s, min(s + PAGES_PER_TASK, num_pages)) for s in range(0, num_pages, PAGES_PER_TASK)]
+        if num_pages < MIN_PAGES_FOR_POOL or self.max_workers == 1:
+            results = (_extract_range(file_path, s, e) for s, e in ranges)
+        else:
+            # executor.map giữ thứ tự -> vẫn stream theo trang trong khi các range sau đang chạy song song
+            results = self._executor().map(_extract_range, [file_path] * len(ranges),
+                                           [s for s, _ in ranges], [e for _, e in ranges])
+
+        for (start, _), texts in zip(ranges, results):
+            self.cache.set_many((f"{digest}:{start + j}", text) for j, text in enumerate(texts))
+            for j, text in enumerate(texts):
+                if text.strip():
+                    yield start + j + 1, text
+
+        # Chỉ đánh dấu hoàn tất sau khi mọi trang đã được cache
+        self.cache.set(f"{digest}:num_pages", num_pages)
@@ -0,0 +1,166 @@
+"""
+Pre-evaluator: chấm sơ bộ SRS bằng heuristic local (vài ms, không gọi LLM) để chặn các bản SRS thiếu rõ ràng
+trước khi tốn tiền cho Gemini judge.
+
+- Completeness: đủ 5 mục bắt buộc (theo SRS_SYSTEM_PROMPT), có Business Rules đánh mã XXX-BR-01, có sơ đồ Mermaid.
+- Format: Mermaid hợp lệ (loại diagram, ngoặc cân bằng, subgraph/end), có bảng Markdown, code fence đóng đủ.
+- Faithfulness: trích dẫn [Source: ...] khớp với tài liệu đã retrieve (không trích nguồn "ma", phủ được các nguồn).
+"""
+
+import re
+import time
+from typing import Dict, List, Optional
+
+from app.models import PreEvaluationChecks, PreEvaluationResult
+from app.services.section_eval import CRITERIA_WEIGHTS, cited_sources, context_blocks
+
+# Mục bắt buộc -> pattern nhận diện trong tiêu đề (tiếng Việt / tiếng Anh)
+REQUIRED_SECTIONS = {
+    "Giới thiệu": r"giới thiệu|introduction",
+    "Mô tả tổng quan": r"tổng quan|overview|overall description",
+    "Workflow Framework": r"workflow",
+    "Các Module chức năng": r"module|chức năng|functional requirements",
+    "Yêu cầu phi chức năng": r"phi chức năng|non[- ]functional",
+}
+MERMAID_TYPES = (
+    "graph", "flowchart", "sequenceDiagram", "classDiagram", "stateDiagram", "stateDiagram-v2", "erDiagram",
+    "gantt", "pie", "journey", "mindmap", "timeline", "gitGraph", "quadrantChart", "requirementDiagram",
+)
+FLOWCHART_DIRECTIONS = ("TB", "TD", "BT", "RL", "LR")
+MIN_BUSINESS_RULES = 3
+MIN_MERMAID_BLOCKS = 2
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+_FENCE = re.compile(r"^\s*```\s*([\w-]*)\s*$")
+_BUSINESS_RULE = re.compile(r"\b[A-Z][A-Z0-9]{1,9}-BR-\d{2,4}\b")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)+\|?\s*$", re.MULTILINE)
+_BRACKETS = {"[": "]", "(": ")", "{": "}"}
+# Phần của statement flowchart không phải shape node: chuỗi trong nháy kép, label cạnh |...|, node bất đối xứng id>text]
+_FLOWCHART_TEXT = re.compile(r'"[^"]*"|\|[^|]*\|')
+_ASYMMETRIC_NODE = re.compile(r"(\w)>[^\]]*\]")
+
+
+def code_blocks(markdown: str) -> List[Dict[str, object]]:
+    """[{"lang", "body", "closed"}] theo thứ tự xuất hiện; block chưa đóng (output bị cắt) có closed=False."""
+    blocks, current = [], None
+    for line in markdown.splitlines():
+        match = _FENCE.match(line)
+        if current is None:
+            if match:
+                current = {"lang": match.group(1).lower(), "lines": []}
+        elif match and not match.group(1):
+            blocks.append({"lang": current["lang"], "body": "\n".join(current["lines"]), "closed": True})
+            current = None
+        else:
+            current["lines"].append(line)
+    if current is not None:
+        blocks.append({"lang": current["lang"], "body": "\n".join(current["lines"]), "closed": False})
+    return blocks
+
+
+def validate_mermaid(body: str) -> Optional[str]:
+    """Kiểm tra cú pháp cơ bản của 1 sơ đồ Mermaid. Trả về mô tả lỗi, hoặc None nếu hợp lệ."""
+    lines = [ln.strip() for ln in body.splitlines() if ln.strip() and not ln.strip().startswith("%%")]
+    if not lines:
+        return "empty diagram"
+    header = lines[0].split()
+    if header[0] not in MERMAID_TYPES:
+        return f"unknown diagram type '{header[0]}'"
+    if header[0] in ("graph", "flowchart"):
+        if len(header) > 1 and header[1].rstrip(";") not in FLOWCHART_DIRECTIONS:
+            return f"invalid direction '{header[1]}'"
+        opened = sum(1 for ln in lines if re.match(r"subgraph\b", ln))
+        closed = sum(1 for ln in lines if re.fullmatch(r"end;?", ln))
+        if opened != closed:
+            return f"{opened} subgraph vs {closed} end"
+        if len(lines) < 2:
+            return "no nodes"
+        return _check_node_shapes(lines)
+    # Loại sơ đồ khác: ngoặc là cú pháp riêng (cardinality erDiagram `||--o{`) hoặc text tự do (message sequence)
+    return None
+
+
+def _check_node_shapes(lines: List[str]) -> Optional[str]:
+    """Ngoặc của shape node flowchart phải cân bằng trong từng dòng (mỗi dòng là 1 statement độc lập)."""
+    for line_no, line in enumerate(lines[1:], start=2):
+        stack = []
+        for ch in _ASYMMETRIC_NODE.sub(r"\1[]", _FLOWCHART_TEXT.sub("", line)):
+            if ch in _BRACKETS:
+                stack.append(_BRACKETS[ch])
+            elif ch in _BRACKETS.values():
+                if not stack or stack.pop() != ch:
+                    return f"unbalanced '{ch}' at line {line_no}"
+        if stack:
+            return f"unclosed bracket at line {line_no}"
+    return None
+
+
+def pre_evaluate(srs_content: str, rag_context: Optional[str] = None,
+                 retrieved_sources: Optional[List[str]] = None, threshold: float = 0.0) -> PreEvaluationResult:
+    """
+    `retrieved_sources`: tên file đã retrieve; mặc định tách từ `rag_context` dạng [DOCUMENT i] của SRSGenerator.
+    `passed` = pre_score >= threshold (LLM judge chỉ chạy khi passed hoặc khi bị ép).
+    """
+    start = time.perf_counter()
+
+    headings = [title.lower() for _, title in _HEADING.findall(srs_content)]
+    missing = [name for name, pattern in REQUIRED_SECTIONS.items()
+               if not any(re.search(pattern, title) for title in headings)]
+
+    blocks = code_blocks(srs_content)
+    mermaid = [b for b in blocks if b["lang"] == "mermaid"]
+    mermaid_errors = [f"#{i + 1}: {err}" for i, b in enumerate(mermaid) if (err := validate_mermaid(b["body"]))]
+    unclosed_fences = sum(1 for b in blocks if not b["closed"])
+    business_rules = _BUSINESS_RULE.findall(srs_content)
+    tables = len(_TABLE_SEPARATOR.findall(srs_content))
+
+    cited = cited_sources(srs_content)
+    if retrieved_sources is None:
+        retrieved_sources = list(context_blocks(rag_context)) if rag_context else []
+    retrieved = {s.strip().lower() for s in retrieved_sources}
+    matched = [s for s in cited if s in retrieved]
+    unknown = [s for s in cited if s not in retrieved]
+
+    completeness = 10 * (
+        0.6 * (len(REQUIRED_SECTIONS) - len(missing)) / len(REQUIRED_SECTIONS)
+        + 0.2 * min(len(set(business_rules)) / MIN_BUSINESS_RULES, 1.0)
+        + 0.2 * min(len(mermaid) / MIN_MERMAID_BLOCKS, 1.0)
+    )
+    format_tone = 10 * (
+        0.4 * ((len(mermaid) - len(mermaid_errors)) / len(mermaid) if mermaid else 0.0)
+        + 0.2 * (1.0 if tables else 0.0)
+        + 0.2 * (1.0 if headings else 0.0)
+        + 0.2 * (0.0 if unclosed_fences else 1.0)
+    )
+    faithfulness = None
+    if retrieved:
+        precision = len(matched) / len(cited) if cited else 0.0
+        coverage = len(set(matched)) / len(retrieved)
+        faithfulness = 10 * (0.5 * precision + 0.5 * coverage)
+
+    scores = {"completeness": completeness, "format_tone": format_tone, "faithfulness": faithfulness}
+    weighted = [(v, CRITERIA_WEIGHTS[k]) for k, v in scores.items() if v is not None]
+    pre_score = sum(v * w for v, w in weighted) / sum(w for _, w in weighted)
+
+    return PreEvaluationResult(
+        completeness=round(completeness, 2),
+        format_tone=round(format_tone, 2),
+        faithfulness=round(faithfulness, 2) if faithfulness is not None else None,
+        pre_score=round(pre_score, 2),
+        threshold=threshold,
+        passed=pre_score >= threshold,
+        checks=PreEvaluationChecks(
+            missing_sections=missing,
+            mermaid_blocks=len(mermaid),
+            mermaid_errors=mermaid_errors,
+            unclosed_code_blocks=unclosed_fences,
+            tables=tables,
+            business_rules=len(set(business_rules)),
+            duplicate_business_rules=sorted({c for c in business_rules if business_rules.count(c) > 1}),
+            citations=len(cited),
+            matched_sources=matched,
+            unknown_sources=unknown,
+            uncited_sources=sorted(retrieved - set(matched)),
+        ),
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 3),
+    )
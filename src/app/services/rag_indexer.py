@@ -1,16 +1,54 @@
 import os
 import chromadb
-import PyPDF2
 from chromadb.utils import embedding_functions
-from typing import List, Dict, Any
+from fnmatch import fnmatch
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from dotenv import load_dotenv
 
 # Import Data Models
+from app.config import RAG_DB_PATH, DEFAULT_COLLECTION, EMBEDDING_MODEL, DEDUP_ENABLED, DEDUP_THRESHOLD
 from app.models import ChunkMetadata
-from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+from app.services.chunking import chunk_hierarchical
+from app.services.dedup import SOURCES_SEPARATOR, DuplicateStore
+from app.services.parent_store import ParentStore
+from app.services.pdf_extractor import PDFExtractor
+from app.services.token_chunking import ChunkingConfig, chunk_document, chunking_metadata, from_collection_metadata
+from app.utils.logger import logger
 
 load_dotenv()
 
+SUPPORTED_EXTENSIONS = (".md", ".txt", ".pdf")
+
+
+def _matches_any(rel_name: str, patterns: List[str]) -> bool:
+    filename = rel_name.rsplit("/", 1)[-1]
+    return any(fnmatch(rel_name, p) or fnmatch(filename, p) for p in patterns)
+
+
+def iter_source_files(folder_path: str, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+                      recursive: bool = True) -> Iterator[Tuple[str, str]]:
+    """
+    Quét thư mục Knowledge Base, yield (file_path, đường dẫn tương đối dạng posix).
+    Glob được so với cả đường dẫn tương đối và tên file, vd: include=["rules/*.md"], exclude=["*draft*"].
+    """
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        if not recursive:
+            dirs.clear()
+        for filename in sorted(files):
+            file_path = os.path.join(root, filename)
+            rel_name = os.path.relpath(file_path, folder_path).replace(os.sep, "/")
+
+            if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                logger.debug(f"[Indexer] Skip unsupported file: {rel_name}")
+                continue
+            if include and not _matches_any(rel_name, include):
+                continue
+            if exclude and _matches_any(rel_name, exclude):
+                continue
+            yield file_path, rel_name
+
+
 class RAGIndexer:
     """
     Service chịu trách nhiệm:
@@ -20,160 +58,308 @@ class RAGIndexer:
     4. Lưu vào ChromaDB
     """
     
-    def __init__(self, persist_path: str = "./rag_db"):
+    def __init__(self, persist_path: str = RAG_DB_PATH, collection_name: str = DEFAULT_COLLECTION,
+                 hierarchical: Optional[bool] = None, chunk_size: int = 1000, chunk_overlap: int = 100,
+                 child_chunk_size: int = 400, child_chunk_overlap: int = 50,
+                 client=None, embedding_function=None, chunking: Optional[ChunkingConfig] = None,
+                 dedup: Optional[bool] = None, dedup_threshold: float = DEDUP_THRESHOLD):
         """
         Khởi tạo ChromaDB client và Embedding Function.
         
         Gợi ý implement:
         - Dùng chromadb.PersistentClient(path=persist_path)
-        - Dùng embedding_functions.GoogleGenerativeAiEmbeddingFunction(api_key=...)
-        - Lấy hoặc tạo collection "srs_knowledge_base"
+        - Dùng embedding_functions.SentenceTransformerEmbeddingFunction (local, không rate limit)
+        - Lấy hoặc tạo collection `collection_name` (mỗi domain khách hàng 1 Knowledge Base: WMS, GSP, HR...)
+
+        hierarchical=True: embed các child chunk nhỏ (child_chunk_size), lưu Parent Section
+        (Markdown header split) 1 lần vào ParentStore để mở rộng context sau khi Rerank.
+        None = theo metadata collection (hoặc ParentStore đã có dữ liệu với collection cũ), collection mới thì False.
+        `client`/`embedding_function` cho phép dùng chung với API server (watch mode) thay vì load lại.
+        `chunking`: chiến lược chunk (xem token_chunking). None = chiến lược đã ghi trong metadata collection,
+        collection mới thì theo CHUNK_STRATEGY. Chiến lược được ghi vào collection lúc tạo.
+        `dedup` (mặc định DEDUP_ENABLED): chunk gần trùng (Jaccard >= dedup_threshold) với 1 chunk đã index không được
+        embed / lưu lại, source của nó được ghi vào metadata `duplicate_sources` của chunk canonical (xem dedup.py).
         """
         self.persist_path = persist_path
-        self.client = chromadb.PersistentClient(path=persist_path)
-        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="paraphrase-multilingual-MiniLM-L12-v2"
+        self.collection_name = collection_name
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.child_chunk_size = child_chunk_size
+        self.child_chunk_overlap = child_chunk_overlap
+        self.parent_store = ParentStore(persist_path, collection_name)
+        self.dedup_store = DuplicateStore(persist_path, collection_name, dedup_threshold) \
+            if (DEDUP_ENABLED if dedup is None else dedup) else None
+        self.duplicates_collapsed = 0
+        # Chunk id đã upsert / xóa kể từ lần pop_changes() cuối (watch mode áp dụng delta vào BM25 đang nạp)
+        self._upserted_ids: set = set()
+        self._deleted_ids: set = set()
+        self.client = client or chromadb.PersistentClient(path=persist_path)
+        self.embedding_function = embedding_function or embedding_functions.SentenceTransformerEmbeddingFunction(
+            model_name=EMBEDDING_MODEL
         )
+        defaults = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+        requested = chunking or ChunkingConfig(**defaults)
         self.collection = self.client.get_or_create_collection(
-            name="srs_knowledge_base", 
+            name=collection_name, 
             embedding_function=self.embedding_function,
-            metadata={"hnsw:space": "cosine"}
+            metadata={"hnsw:space": "cosine", **chunking_metadata(requested), "hierarchical": bool(hierarchical)}
         )
+        collection_metadata = self.collection.metadata or {}
+        recorded_hierarchical = collection_metadata.get("hierarchical")
+        if recorded_hierarchical is None:  # Collection tạo trước khi ghi cờ này
+            recorded_hierarchical = self.parent_store.count() > 0
+        self.hierarchical = recorded_hierarchical if hierarchical is None else hierarchical
+        if hierarchical is not None and "hierarchical" in collection_metadata and hierarchical != recorded_hierarchical:
+            logger.warning(f"[Indexer] Collection '{collection_name}' was indexed with hierarchical={recorded_hierarchical}, "
+                           f"now {hierarchical}: re-index everything to keep chunks consistent")
+        recorded = from_collection_metadata(self.collection.metadata, **defaults)
+        self.chunking = chunking or recorded
+        if chunking and "chunk_strategy" in collection_metadata \
+                and chunking_metadata(chunking) != chunking_metadata(recorded):
+            logger.warning(f"[Indexer] Collection '{collection_name}' was chunked with {chunking_metadata(recorded)}, "
+                           f"now {chunking_metadata(chunking)}: re-index everything to keep chunks consistent")
 
-    def load_documents(self, folder_path: str) -> List[Dict[str, Any]]:
-        """Đọc tài liệu đa định dạng với xử lý lỗi."""
-        documents = []
+    def iter_documents(self, folder_path: str, include: Optional[List[str]] = None,
+                       exclude: Optional[List[str]] = None, recursive: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Đọc tài liệu đa định dạng với xử lý lỗi, trả về lần lượt từng document (stream).
+        PDF được tách theo trang (metadata có `page`) để chunker xử lý ngay, không giữ cả file trong RAM.
+        """
         if not os.path.exists(folder_path):
             print(f"Error: Folder {folder_path} does not exist.")
-            return documents
+            return
 
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            try:
-                content = ""
-                if filename.endswith(".md") or filename.endswith(".txt"):
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                elif filename.endswith(".pdf"):
-                    # Senior Tip: Dùng thư viện chuyên dụng cho PDF
-                    with open(file_path, "rb") as f:
-                        reader = PyPDF2.PdfReader(f)
-                        content = "\n".join([page.extract_text() for page in reader.pages if page.extract_text()])
-                
+        with PDFExtractor(cache_path=os.path.join(self.persist_path, "extraction_cache.sqlite3")) as pdf_extractor:
+            for file_path, rel_name in iter_source_files(folder_path, include, exclude, recursive):
+                yield from self._read_file(file_path, rel_name, pdf_extractor)
+
+    def _read_file(self, file_path: str, rel_name: str, pdf_extractor: PDFExtractor) -> Iterator[Dict[str, Any]]:
+        """Đọc 1 file. `filename` là đường dẫn tương đối so với thư mục KB (dùng làm `source` khi trích dẫn)."""
+        try:
+            if file_path.lower().endswith((".md", ".txt")):
+                with open(file_path, "r", encoding="utf-8") as f:
+                    content = f.read()
                 if content:
-                    documents.append({
+                    yield {
                         "content": content, 
-                        "metadata": {"filename": filename, "path": file_path}
-                    })
-            except Exception as e:
-                print(f"Error reading file {filename}: {e}")
-                
-        return documents
+                        "metadata": {"filename": rel_name, "path": file_path}
+                    }
+            elif file_path.lower().endswith(".pdf"):
+                # Senior Tip: Dùng thư viện chuyên dụng cho PDF (song song + cache theo trang)
+                for page_no, page_text in pdf_extractor.iter_pages(file_path):
+                    yield {
+                        "content": page_text,
+                        "metadata": {"filename": rel_name, "path": file_path, "page": page_no}
+                    }
+        except Exception as e:
+            print(f"Error reading file {rel_name}: {e}")
+
+    def load_documents(self, folder_path: str, include: Optional[List[str]] = None,
+                       exclude: Optional[List[str]] = None, recursive: bool = True) -> List[Dict[str, Any]]:
+        """Đọc toàn bộ tài liệu vào list (giữ tương thích; build_index dùng iter_documents)."""
+        return list(self.iter_documents(folder_path, include, exclude, recursive))
 
     def chunk_text(self, text: str, initial_metadata: Dict[str, Any]) -> List[tuple[str, Dict[str, Any]]]:
         """
-        Chia nhỏ văn bản thành các chunks có kích thước vừa phải (~500-1000 tokens).
+        Chia nhỏ văn bản thành các chunks có kích thước vừa phải (theo ký tự hoặc theo token, xem self.chunking).
         Quan trọng: Cố gắng giữ ngữ cảnh (Context) bằng cách chia theo Markdown Header (#, ##).
         """
-        import uuid
-        from datetime import datetime
-        
-        # Bước 1: Chia theo Markdown Header
-        headers_to_split_on = [
-            ("#", "Header 1"),
-            ("##", "Header 2"),
-            ("###", "Header 3"),
-        ]
-        markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on, strip_headers=False)
-        md_header_splits = markdown_splitter.split_text(text)
-
-        # Bước 2: Chia nhỏ tiếp bằng RecursiveCharacterTextSplitter
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=100,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+        # Logic dùng chung với generate_testset.py (ground truth chunk id phải khớp với id trong index)
+        return chunk_document(text, initial_metadata, self.chunking)
 
-        final_chunks = []
-        
-        # Nếu file không có markdown header nào, xử lý nguyên văn bản
-        if not md_header_splits:
-            from langchain_core.documents import Document
-            md_header_splits = [Document(page_content=text, metadata={})]
-
-        for split in md_header_splits:
-            # Sub-split content của từng section
-            sub_chunks = text_splitter.split_text(split.page_content)
-            
-            for chunk_content in sub_chunks:
-                # Merge metadata: File metadata + Header metadata
-                combined_metadata = {**initial_metadata, **split.metadata}
-                
-                # Bổ sung các trường bắt buộc theo ChunkMetadata Schema
-                # Lưu ý: ChromaDB chỉ hỗ trợ flat metadata (str, int, float, bool), không nested dict
-                full_metadata = {
-                    "doc_id": str(uuid.uuid4()),
-                    "source": combined_metadata.get("filename", "unknown"),
-                    "section": combined_metadata.get("Header 1", combined_metadata.get("Header 2", "General")),
-                    "category": "knowledge", # Default, logic phân loại có thể cải tiến sau
-                    "created_at": datetime.now().isoformat(),
-                    # Giữ lại các field khác nếu cần
-                    **{k: v for k, v in combined_metadata.items() if k not in ["source", "section", "category", "created_at"]}
-                }
-                
-                final_chunks.append((chunk_content, full_metadata))
-                
-        return final_chunks
-
-    def build_index(self, folder_path: str):
-        """Main flow chuyển sang chạy Local Embeddings (Nhanh hơn, không rate limit)."""
+    def build_index(self, folder_path: str, include: Optional[List[str]] = None,
+                    exclude: Optional[List[str]] = None, recursive: bool = True):
+        """
+        Main flow chuyển sang chạy Local Embeddings (Nhanh hơn, không rate limit).
+        Quét đệ quy `folder_path`, lọc file theo glob `include`/`exclude` (so với đường dẫn tương đối).
+        """
         print(f"Đang bắt đầu index dữ liệu từ: {folder_path}...")
-        
-        raw_docs = self.load_documents(folder_path)
-        if not raw_docs:
+
+        num_docs, num_chunks = self._index_documents(self.iter_documents(folder_path, include, exclude, recursive),
+                                                     replace_rekeyed=True)
+
+        if num_docs == 0:
             print("Không có tài liệu nào để xử lý.")
             return
+        if num_chunks == 0:
+            print("Không có chunk nào được tạo ra.")
+            return
+            
+        print(f"Hoàn thành! Đã index {num_chunks} chunks từ {num_docs} tài liệu vào collection "
+              f"'{self.collection_name}' tại '{self.persist_path}'.")
+        if self.dedup_store:
+            print(f"Đã gộp {self.duplicates_collapsed} chunk gần trùng vào chunk canonical.")
+
+    @staticmethod
+    def source_name(file_path: str, folder_path: Optional[str] = None) -> str:
+        """`source` của file: đường dẫn tương đối so với thư mục KB (không phụ thuộc cách viết folder_path)."""
+        if not folder_path:
+            return os.path.basename(file_path)
+        return os.path.relpath(os.path.abspath(file_path), os.path.abspath(folder_path)).replace(os.sep, "/")
+
+    def index_file(self, file_path: str, folder_path: Optional[str] = None) -> int:
+        """Incremental upsert 1 file: xóa chunk cũ của file rồi index lại. Trả về số chunk mới."""
+        rel_name = self.source_name(file_path, folder_path)
+        self.remove_file(file_path, folder_path)
+        with PDFExtractor(cache_path=os.path.join(self.persist_path, "extraction_cache.sqlite3")) as pdf_extractor:
+            _, num_chunks = self._index_documents(self._read_file(file_path, rel_name, pdf_extractor))
+        return num_chunks
+
+    def remove_file(self, file_path: str, folder_path: Optional[str] = None):
+        """Xóa toàn bộ chunk (và Parent Section) của 1 file khỏi Knowledge Base, theo `source` (xem source_name)."""
+        self._remove_source(self.source_name(file_path, folder_path))
+
+    def _remove_source(self, source: str):
+        stale_ids = self.collection.get(where={"source": source}, include=[])["ids"]
+        if stale_ids:
+            self.collection.delete(ids=stale_ids)
+            self._mark_deleted(stale_ids)
+        self.parent_store.delete_by_source(source)
+        if self.dedup_store:
+            self._release_duplicates(source)
 
-        all_texts = []
-        all_metadatas = []
-        all_ids = []
+    def pop_changes(self) -> Tuple[List[str], List[str]]:
+        """(id đã upsert / đổi metadata, id đã xóa) kể từ lần gọi trước -> delta cho keyword index đang nạp."""
+        upserted, deleted = sorted(self._upserted_ids), sorted(self._deleted_ids - self._upserted_ids)
+        self._upserted_ids, self._deleted_ids = set(), set()
+        return upserted, deleted
 
-        print(f"Đã đọc xong {len(raw_docs)} files. Bắt đầu chunking...")
+    def _mark_upserted(self, ids: Iterable[str]):
+        self._upserted_ids.update(ids)
+
+    def _mark_deleted(self, ids: Iterable[str]):
+        ids = set(ids)
+        self._deleted_ids |= ids
+        self._upserted_ids -= ids
+
+    def _remove_rekeyed(self, source: str, new_ids: List[str]):
+        """
+        Chunk đang lưu của `source` không trùng ID nào với lần chunk này -> ID được tính theo cách khác
+        (index cũ khóa theo đường dẫn file, hoặc đổi chiến lược chunk): xóa hết để upsert không nhân bản file.
+        """
+        existing = self.collection.get(where={"source": source}, include=[])["ids"]
+        if existing and new_ids and not set(existing) & set(new_ids):
+            logger.warning(f"[Indexer] '{source}': {len(existing)} stored chunks use different ids, replacing them")
+            self._remove_source(source)
+
+    def _index_documents(self, documents: Iterable[Dict[str, Any]], replace_rekeyed: bool = False) -> Tuple[int, int]:
+        """
+        Chunk + upsert theo batch. Trả về (số document, số chunk đã lưu).
+        `replace_rekeyed`: xóa chunk cũ của file nếu ID đã đổi cách tính (xem _remove_rekeyed); index_file tự xóa trước.
+        """
+        # Với Model Local, ta có thể tăng batch size lên lớn hơn và không cần Retry
+        batch_size = 50
+        buffer: List[tuple[str, Dict[str, Any]]] = []
+        num_docs, num_chunks, current_batch = 0, 0, 0
+        self.duplicates_collapsed = 0
+        kept_ids: set = set()      # Canonical vừa upsert (metadata mới chưa có duplicate_sources)
+        touched_ids: set = set()   # Canonical vừa nhận thêm bản sao
+        checked_sources: set = set()
 
-        for doc in raw_docs:
+        # Stream: document -> chunks -> upsert theo batch, không giữ toàn bộ corpus trong RAM
+        for doc in documents:
+            num_docs += 1
             try:
-                chunks = self.chunk_text(doc["content"], doc["metadata"])
-                
-                for i, (content, metadata) in enumerate(chunks):
-                    all_texts.append(content)
-                    all_metadatas.append(metadata)
-                    all_ids.append(metadata["doc_id"]) # Dùng UUID từ bước chunk
+                if self.hierarchical:
+                    parents, chunks = chunk_hierarchical(
+                        doc["content"], doc["metadata"], self.child_chunk_size, self.child_chunk_overlap
+                    )
+                else:
+                    parents, chunks = [], self.chunk_text(doc["content"], doc["metadata"])
             except Exception as e:
                 print(f"Lỗi khi chunk file {doc['metadata'].get('filename')}: {e}")
                 continue
+            source = doc["metadata"].get("filename")
+            if replace_rekeyed and source not in checked_sources:
+                checked_sources.add(source)
+                self._remove_rekeyed(source, [metadata["doc_id"] for _, metadata in chunks])
+            if parents:
+                self.parent_store.upsert(parents)
 
-        if not all_texts:
-            print("Không có chunk nào được tạo ra.")
+            if self.dedup_store:
+                chunks = self._collapse_duplicates(chunks, touched_ids)
+                kept_ids.update(metadata["doc_id"] for _, metadata in chunks)
+            buffer.extend(chunks)
+            while len(buffer) >= batch_size:
+                current_batch += 1
+                num_chunks += self._upsert_batch(buffer[:batch_size], current_batch)
+                buffer = buffer[batch_size:]
+
+        if buffer:
+            current_batch += 1
+            num_chunks += self._upsert_batch(buffer, current_batch)
+        if kept_ids or touched_ids:
+            self._refresh_duplicate_sources(kept_ids | touched_ids, touched_ids)
+        return num_docs, num_chunks
+
+    def _collapse_duplicates(self, chunks: List[tuple[str, Dict[str, Any]]],
+                             touched_ids: set) -> List[tuple[str, Dict[str, Any]]]:
+        """Giữ chunk canonical, ghi các chunk gần trùng vào DuplicateStore (không embed / lưu vào Chroma)."""
+        kept, stale = [], []
+        for content, metadata in chunks:
+            chunk_id = metadata["doc_id"]
+            signature = self.dedup_store.hasher.signature(content)
+            canonical_id = self.dedup_store.find_canonical(chunk_id, signature)
+            if canonical_id is None:
+                self.dedup_store.add_canonical(chunk_id, metadata.get("source"), signature)
+                kept.append((content, metadata))
+                continue
+            if self.dedup_store.add_duplicate(chunk_id, canonical_id, content, metadata):
+                stale.append(chunk_id)  # Re-index: chunk từng là canonical nay trùng với chunk khác
+            touched_ids.add(canonical_id)
+            self.duplicates_collapsed += 1
+        if stale:
+            self.collection.delete(ids=stale)
+            self._mark_deleted(stale)
+        return kept
+
+    def _refresh_duplicate_sources(self, chunk_ids: set, touched_ids: set):
+        """Ghi `duplicate_sources` / `duplicate_count` vào metadata các chunk canonical (Chroma chỉ nhận metadata phẳng)."""
+        sources = self.dedup_store.duplicate_sources(sorted(chunk_ids))
+        targets = [cid for cid in sorted(chunk_ids) if sources.get(cid) or cid in touched_ids]
+        if not targets:
             return
+        existing = self.collection.get(ids=targets, include=["metadatas"])
+        ids, metadatas = [], []
+        for chunk_id, metadata in zip(existing["ids"], existing["metadatas"]):
+            others = [s for s in sources.get(chunk_id, []) if s != metadata.get("source")]
+            ids.append(chunk_id)
+            metadatas.append({**metadata, "duplicate_sources": SOURCES_SEPARATOR.join(others),
+                              "duplicate_count": len(others)})
+        if ids:
+            self.collection.update(ids=ids, metadatas=metadatas)
+            self._mark_upserted(ids)
 
-        print(f"Tổng cộng: {len(all_texts)} chunks. Đang lưu vào ChromaDB...")
+    def _release_duplicates(self, source: str):
+        """
+        Xóa file khỏi DuplicateStore: canonical mất bản sao -> cập nhật lại sources;
+        canonical thuộc file bị xóa -> bản sao đầu tiên (file khác) được đưa vào Chroma làm canonical mới.
+        """
+        touched, orphans = self.dedup_store.remove_source(source)
+        touched_ids, promoted = set(touched), []
+        for duplicates in orphans.values():
+            (chunk_id, content, metadata), rest = duplicates[0], duplicates[1:]
+            self.dedup_store.add_canonical(chunk_id, metadata.get("source"), self.dedup_store.hasher.signature(content))
+            for dup_id, dup_content, dup_metadata in rest:
+                self.dedup_store.add_duplicate(dup_id, chunk_id, dup_content, dup_metadata)
+            promoted.append((content, metadata))
+            touched_ids.add(chunk_id)
+        if promoted:
+            self._upsert_batch(promoted, 1)
+        if touched_ids:
+            self._refresh_duplicate_sources(touched_ids, touched_ids)
 
-        # Với Model Local, ta có thể tăng batch size lên lớn hơn và không cần Retry
-        batch_size = 50 
-        total_batches = (len(all_texts) + batch_size - 1) // batch_size
-        
-        for i in range(0, len(all_texts), batch_size):
-            batch_end = i + batch_size
-            current_batch = i // batch_size + 1
-            print(f"Processing batch {current_batch}/{total_batches}...")
-            
-            try:
-                self.collection.upsert(
-                    documents=all_texts[i : batch_end],
-                    metadatas=all_metadatas[i : batch_end],
-                    ids=all_ids[i : batch_end]
-                )
-            except Exception as e:
-                print(f"❌ Lỗi khi lưu batch {current_batch}: {e}")
-            
-        print(f"Hoàn thành! Đã index {len(all_texts)} chunks vào ChromaDB tại '{self.persist_path}'.")
+    def _upsert_batch(self, chunks: List[tuple[str, Dict[str, Any]]], batch_no: int) -> int:
+        """Lưu 1 batch chunk vào ChromaDB, trả về số chunk đã lưu."""
+        print(f"Processing batch {batch_no}...")
+        try:
+            self.collection.upsert(
+                documents=[content for content, _ in chunks],
+                metadatas=[metadata for _, metadata in chunks],
+                ids=[metadata["doc_id"] for _, metadata in chunks] # Dùng ID từ bước chunk
+            )
+            self._mark_upserted(metadata["doc_id"] for _, metadata in chunks)
+            return len(chunks)
+        except Exception as e:
+            print(f"❌ Lỗi khi lưu batch {batch_no}: {e}")
+            return 0
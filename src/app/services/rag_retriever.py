@@ -1,9 +1,52 @@
+import copy
+import os
+import sys
 import chromadb
 from chromadb.utils import embedding_functions
 from sentence_transformers import CrossEncoder
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import numpy as np
 import torch
+from app.config import (
+    RAG_DB_PATH, DEFAULT_COLLECTION, EMBEDDING_MODEL, RERANKER_MODEL,
+    VECTOR_BACKEND, VECTOR_DTYPE, VECTOR_IVF_NLIST, VECTOR_IVF_NPROBE,
+    EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS, RERANK_BATCH_MAX_SIZE, RERANK_BATCH_MAX_WAIT_MS,
+)
+from app.models import FusionConfig, RetrievalFilter
+from app.services.chunk_table import ChunkTable
+from app.services.fusion import fuse, keyword_is_sufficient
+from app.services.keyword_index import tokenize, update_bm25
+from app.services.metadata_filter import MetadataBitmapIndex
+from app.services.parent_store import ParentStore
+from app.services.snapshot import current_metadatas
+from app.services.vector_store import NumpyVectorStore, create_vector_store
 from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.micro_batch import MicroBatcher
+from app.utils.single_flight import SingleFlight, make_key
+
+
+def load_embedding_function(device: str):
+    """Bi-Encoder dùng cho Vector Search (phải trùng model với Indexer)."""
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL, device=device)
+
+
+def load_reranker(device: str) -> CrossEncoder:
+    """Cross-Encoder dùng để Rerank."""
+    return CrossEncoder(RERANKER_MODEL, device=device)
+
+
+def make_batchers(embedding_fn, reranker) -> Dict[str, MicroBatcher]:
+    """
+    Micro-batcher cho query embedding + Cross-Encoder: request đồng thời dùng chung 1 forward pass.
+    Phải tạo 1 lần cho mỗi cặp model (KnowledgeBaseRegistry dùng chung cho mọi collection).
+    """
+    return {
+        "embed": MicroBatcher("embed", embedding_fn, max_batch=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS),
+        "rerank": MicroBatcher("rerank", reranker.predict, max_batch=RERANK_BATCH_MAX_SIZE,
+                               max_wait_ms=RERANK_BATCH_MAX_WAIT_MS),
+    }
+
 
 class RAGRetriever:
     """
@@ -16,157 +59,290 @@ class RAGRetriever:
     3. Filter: Lọc theo ngưỡng điểm (Score Threshold).
     """
 
-    def __init__(self, persist_path: str = "./rag_db_test"):
+    def __init__(self, persist_path: str = RAG_DB_PATH, collection_name: str = DEFAULT_COLLECTION,
+                 client=None, embedding_fn=None, reranker=None, snapshot=None,
+                 vector_backend: Optional[str] = None, batchers: Optional[Dict[str, MicroBatcher]] = None):
         """
         Khởi tạo các models.
         
         Gợi ý:
-        1. Load ChromaDB Client & Collection "srs_knowledge_base".
+        1. Load ChromaDB Client & Collection (mặc định "srs_knowledge_base").
         2. Dùng embedding model y hệt lúc Indexer: "paraphrase-multilingual-MiniLM-L12-v2".
         3. Load CrossEncoder model: "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1" (nhỏ, nhanh, tốt).
+
+        `client`, `embedding_fn`, `reranker` có thể truyền vào để dùng chung giữa nhiều collection
+        (xem KnowledgeBaseRegistry), tránh load model nhiều lần.
+        `snapshot` (app.services.snapshot.Snapshot): dùng BM25 dựng sẵn thay vì build lại lúc khởi động.
+        `vector_backend`: "chroma" | "numpy" | "ivf" (mặc định VECTOR_BACKEND), xem app.services.vector_store.
+        `batchers`: micro-batcher dùng chung (xem make_batchers), mặc định tạo riêng cho retriever này.
         """
-        """Khởi tạo với sự tối ưu hóa phần cứng."""
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.persist_path = persist_path
+        self.collection_name = collection_name
+        self.vector_backend = vector_backend or VECTOR_BACKEND
+        # Gộp các query giống hệt đang chạy đồng thời (vd: benchmark / nhiều user cùng mô tả)
+        self._inflight = SingleFlight("retrieve")
         
         # 1. Khởi tạo ChromaDB
-        self.client = chromadb.PersistentClient(path=persist_path)
+        self.client = client or chromadb.PersistentClient(path=persist_path)
         
         # 2. Embedding Function (Bi-Encoder) - Phải khớp với Indexer
         # Senior Tip: Dùng chính xác model đã dùng để Index để đảm bảo vector space đồng nhất
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="paraphrase-multilingual-MiniLM-L12-v2",
-            device=self.device
-        )
+        self.embedding_fn = embedding_fn or load_embedding_function(self.device)
         
         self.collection = self.client.get_or_create_collection(
-            name="srs_knowledge_base",
-            embedding_function=self.embedding_fn
+            name=collection_name,
+            embedding_function=self.embedding_fn,
+            metadata={"hnsw:space": "cosine"}
         )
 
         # 3. Load Cross-Encoder để Rerank
-        self.reranker = CrossEncoder(
-            "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", 
-            device=self.device
-        )
+        self.reranker = reranker or load_reranker(self.device)
+        # Query embedding / rerank đi qua micro-batcher (Chroma vẫn dùng embedding_fn gốc khi add/query)
+        self.batchers = batchers or make_batchers(self.embedding_fn, self.reranker)
+
+        # Parent Sections cho small-to-big retrieval (chỉ có dữ liệu nếu index ở chế độ hierarchical)
+        self.parent_store = ParentStore(persist_path, collection_name)
         
-        # 4. [NEW] Build In-Memory BM25 Index for Hybrid Search
+        # 4. [NEW] Build In-Memory BM25 Index for Hybrid Search (hoặc lấy từ Snapshot nếu khớp dữ liệu)
+        snapshot_vectors = None
+        # Chỉ dùng BM25 của snapshot khi (id, nội dung) của collection khớp lúc export (metadata lấy bản hiện tại)
+        snapshot_metadatas = current_metadatas(snapshot, self.collection) \
+            if snapshot is not None and snapshot.bm25 is not None else None
+        if snapshot_metadatas is not None:
+            self._load_keyword_index(snapshot.documents, snapshot.ids, snapshot_metadatas, snapshot.bm25)
+            snapshot_vectors = snapshot.vectors
+            logger.success(f"BM25 Index loaded from snapshot with {len(snapshot.ids)} docs.")
+        else:
+            self._build_keyword_index()
+
+        # 5. Vector Store (hàng khớp thứ tự ChunkTable -> kết quả map thẳng về corpus mmap)
+        self._init_vector_store(snapshot_vectors)
+        logger.info(f"Vector backend: {self.vector_store.name}")
+
+    def _init_vector_store(self, vectors: Optional[np.ndarray] = None):
+        self.vector_store = create_vector_store(
+            self.vector_backend, self.collection, self.chunks,
+            self.metadata_index, cache_dir=os.path.join(self.persist_path, "vector_cache"),
+            vectors=vectors, nlist=VECTOR_IVF_NLIST, nprobe=VECTOR_IVF_NPROBE, dtype=VECTOR_DTYPE,
+        )
+        self.memory_bytes += self.vector_store.memory_bytes
+
+    def _load_keyword_index(self, corpus: List[str], ids: List[str], metadatas: List[Dict[str, Any]], bm25):
+        """
+        Chuyển corpus sang ChunkTable (blob mmap + bảng offset) thay vì giữ hàng triệu str/dict Python;
+        bm25_corpus / bm25_ids / bm25_metadatas là các cột của bảng (index/len/iter như list).
+        """
+        self.chunks = ChunkTable.build_or_open(
+            os.path.join(self.persist_path, "chunk_table"), self.collection_name, ids, corpus, metadatas
+        )
+        self.bm25_corpus = self.chunks.texts
+        self.bm25_ids = self.chunks.ids
+        self.bm25_metadatas = self.chunks.metadatas
+        self.bm25 = bm25
+        self.metadata_index = MetadataBitmapIndex(metadatas or [{} for _ in ids])
+        self.memory_bytes = self._estimate_memory_bytes()
+
+    def _build_keyword_index(self):
+        """Build In-Memory BM25 Index + Metadata Bitmap cho collection hiện tại."""
         # Note: Với dữ liệu lớn (>100k chunks), nên dùng ElasticSearch/Solr thay vì build RAM như này.
-        logger.info("--- Building BM25 Index (Hybrid Search) ---")
+        logger.info(f"--- Building BM25 Index (Hybrid Search) for '{self.collection_name}' ---")
         try:
             all_docs = self.collection.get() # Fetch all data
             if all_docs['documents']:
-                self.bm25_corpus = all_docs['documents']
-                self.bm25_ids = all_docs['ids']
-                self.bm25_metadatas = all_docs['metadatas']
-                
-                # Simple tokenization by splitting spaces (Production nên dùng ViTokenizer)
-                tokenized_corpus = [doc.lower().split() for doc in self.bm25_corpus]
-                from rank_bm25 import BM25Okapi
-                self.bm25 = BM25Okapi(tokenized_corpus)
-                logger.success(f"BM25 Index built successfully with {len(self.bm25_corpus)} docs.")
+                try:
+                    # Simple tokenization by splitting spaces (Production nên dùng ViTokenizer)
+                    tokenized_corpus = [tokenize(doc) for doc in all_docs['documents']]
+                    from rank_bm25 import BM25Okapi
+                    bm25 = BM25Okapi(tokenized_corpus)
+                except Exception as e:
+                    # Vẫn nạp ChunkTable: Vector Search map kết quả về hàng của bảng
+                    logger.error(f"Error building BM25: {e}. Keyword search disabled.")
+                    bm25 = None
+                self._load_keyword_index(all_docs['documents'], all_docs['ids'], all_docs['metadatas'], bm25)
+                if bm25 is not None:
+                    logger.success(f"BM25 Index built successfully with {len(self.bm25_ids)} docs.")
             else:
-                self.bm25 = None
+                self._load_keyword_index([], [], [], None)
                 logger.warning("Warning: Database is empty, BM25 skipped.")
         except Exception as e:
             logger.error(f"Error building BM25: {e}")
-            self.bm25 = None
+            self._load_keyword_index([], [], [], None)
 
-    def retrieve(self, query: str, top_k: int = 5, rerank: bool = True) -> List[Dict[str, Any]]:
-        """Hàm chính: Hybrid Search (Vector + Keyword) -> Rerank."""
-        
-        # 1. Semantic Search (Vector)
-        vector_results = self._semantic_search(query, k=top_k * 2)
-        
-        # 2. Keyword Search (BM25)
-        keyword_results = self._keyword_search(query, k=top_k * 2)
-        
-        # 3. Merge Results (Reciprocal Rank Fusion - RRF)
-        unified_results = self._merge_results_rrf(vector_results, keyword_results, k=top_k * 3)
+    def apply_changes(self, upserted_ids: List[str], removed_ids: List[str]) -> "RAGRetriever":
+        """
+        Retriever mới (copy-on-write) đã áp dụng delta của index (watch mode): chỉ lấy từ Chroma và tokenize
+        các chunk đã upsert; BM25 / ChunkTable / Vector Store dựng từ hàng cũ còn giữ + hàng mới.
+        Request đang chạy vẫn dùng retriever cũ đến khi xong.
+        """
+        changed_rows = {self.chunks.row_of(doc_id) for doc_id in {*upserted_ids, *removed_ids}} - {None}
+        # Chỉ đếm hàng thật sự bị xóa (id mới chưa có hàng; id upsert lại không tính là xóa)
+        deleted = sum(1 for doc_id in set(removed_ids) - set(upserted_ids) if self.chunks.row_of(doc_id) is not None)
+        keep_rows = [row for row in range(len(self.chunks)) if row not in changed_rows]
+        with_vectors = isinstance(self.vector_store, NumpyVectorStore)
+        include = ["documents", "metadatas"] + (["embeddings"] if with_vectors else [])
+        fresh = self.collection.get(ids=list(upserted_ids), include=include) if upserted_ids else \
+            {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+
+        ids = [self.bm25_ids[row] for row in keep_rows] + list(fresh["ids"])
+        corpus = [self.bm25_corpus[row] for row in keep_rows] + list(fresh["documents"])
+        metadatas = [self.bm25_metadatas[row] for row in keep_rows] + list(fresh["metadatas"])
+        bm25 = update_bm25(self.bm25, keep_rows, [tokenize(doc) for doc in fresh["documents"]])
+
+        vectors = None
+        if with_vectors:
+            kept = np.asarray(self.vector_store.matrix[keep_rows], dtype=np.float32) if keep_rows else None
+            added = np.asarray(fresh["embeddings"], dtype=np.float32) if len(fresh["ids"]) else None
+            parts = [v for v in (kept, added) if v is not None]
+            vectors = np.vstack(parts) if parts else None
+
+        retriever = copy.copy(self)
+        retriever._inflight = SingleFlight("retrieve")
+        retriever._load_keyword_index(corpus, ids, metadatas, bm25)
+        retriever._init_vector_store(vectors)
+        logger.info(f"[Retrieval] Applied {len(fresh['ids'])} upserts / {deleted} "
+                    f"deletes to '{self.collection_name}' ({len(ids)} docs)")
+        return retriever
+
+    def _estimate_memory_bytes(self) -> int:
+        """Ước lượng RAM của phần in-memory (BM25 term freqs, metadata bitmap) để Registry quyết định eviction."""
+        # Corpus / ids / metadata nằm trong ChunkTable (mmap, page cache do OS quản lý) -> không tính
+        # Mỗi entry dict term -> freq ~ 100 bytes (key string + int + slot)
+        term_freqs = sum(len(freqs) * 100 + sys.getsizeof(freqs) for freqs in self.bm25.doc_freqs) if self.bm25 else 0
+        postings = sum(ids.nbytes for values in self.metadata_index.postings.values() for ids in values.values())
+        return term_freqs + postings + self.metadata_index.created_ts.nbytes
+
+    def retrieve(self, query: str, top_k: int = 5, rerank: bool = True,
+                 fusion: Optional[FusionConfig] = None,
+                 filters: Optional[RetrievalFilter] = None,
+                 expand_parents: bool = True) -> List[Dict[str, Any]]:
+        """
+        Hàm chính: Hybrid Search (Vector + Keyword) -> Fusion -> Rerank -> (Small-to-Big) Parent Expansion.
+        `filters` được đẩy xuống cả 2 nhánh. Với index hierarchical, kết quả có thêm `context` = Parent Section.
+        Các lời gọi đồng thời cùng (query đã chuẩn hóa khoảng trắng, tham số) chỉ chạy 1 lần.
+        """
+        fusion = fusion or FusionConfig()
+        key = make_key(query, top_k, rerank, fusion, filters, expand_parents)
+        return self._inflight.do(
+            key, lambda: self._retrieve(query, top_k, rerank, fusion, filters, expand_parents)
+        )
+
+    def _retrieve(self, query: str, top_k: int, rerank: bool, fusion: FusionConfig,
+                  filters: Optional[RetrievalFilter], expand_parents: bool) -> List[Dict[str, Any]]:
+        # Latency từng stage -> /metrics (retrieval_stage_seconds{stage=...}, trang Performance của dashboard)
+        # 1. Keyword Search (BM25) - chạy trước vì rẻ (in-memory), dùng để quyết định short-circuit
+        with metrics.timer("retrieval_stage_seconds", stage="keyword"):
+            keyword_results = self._keyword_search(query, k=top_k * 2, filters=filters) if fusion.keyword_weight > 0 else []
+
+        # 2. Semantic Search (Vector) - bỏ qua nếu BM25 đã đủ (vd: query mã SKU chính xác)
+        if fusion.vector_weight > 0 and not keyword_is_sufficient(query, keyword_results, fusion):
+            with metrics.timer("retrieval_stage_seconds", stage="vector"):
+                vector_results = self._semantic_search(query, k=top_k * 2, filters=filters)
+        else:
+            vector_results = []
+            metrics.inc("retrieval_vector_skipped_total")
+            logger.debug(f"[Retrieval] Vector search skipped (short-circuit) for query: {query}")
+
+        # 3. Fusion (Weighted RRF / Normalized Score / Convex)
+        with metrics.timer("retrieval_stage_seconds", stage="fusion"):
+            unified_results = fuse(vector_results, keyword_results, fusion, limit=top_k * 3)
         
         if not unified_results:
             return []
             
-        # 4. Rerank
+        # 4. Rerank (trên child chunk nhỏ -> rẻ hơn rerank cả section)
         if rerank:
-            ranked_results = self._rerank_results(query, unified_results)
+            with metrics.timer("retrieval_stage_seconds", stage="rerank"):
+                ranked_results = self._rerank_results(query, unified_results)
+        else:
+            ranked_results = unified_results
+
+        # 5. Small-to-Big: chỉ mở rộng Parent cho các child thắng
+        if expand_parents:
+            with metrics.timer("retrieval_stage_seconds", stage="expand"):
+                return self._expand_to_parents(ranked_results, top_k)
+        return ranked_results[:top_k]
+
+    def _expand_to_parents(self, ranked_results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """Giữ child tốt nhất của mỗi Parent (tránh lặp context), gắn nội dung Parent vào `context`."""
+        if not any(r['metadata'].get('parent_id') for r in ranked_results):
             return ranked_results[:top_k]
-        
-        return unified_results[:top_k]
 
-    def _keyword_search(self, query: str, k: int = 10) -> List[Dict[str, Any]]:
-        """Tìm kiếm từ khóa chính xác bằng BM25."""
+        winners, seen_parents = [], set()
+        for result in ranked_results:
+            parent_id = result['metadata'].get('parent_id')
+            if parent_id:
+                if parent_id in seen_parents:
+                    continue
+                seen_parents.add(parent_id)
+            winners.append(result)
+            if len(winners) == top_k:
+                break
+
+        parents = self.parent_store.get_many(list(seen_parents))
+        for result in winners:
+            parent = parents.get(result['metadata'].get('parent_id'))
+            if parent:
+                result['context'] = parent['content']
+                result['child_span'] = [result['metadata'].get('parent_start'), result['metadata'].get('parent_end')]
+        return winners
+
+    def _keyword_search(self, query: str, k: int = 10,
+                        filters: Optional[RetrievalFilter] = None) -> List[Dict[str, Any]]:
+        """Tìm kiếm từ khóa chính xác bằng BM25 (chỉ chấm điểm trên tập ứng viên đã lọc metadata)."""
         if not self.bm25:
             return []
             
-        tokenized_query = query.lower().split()
-        # Lấy top k docs có điểm BM25 cao nhất
-        # rank_bm25 trả về list documents, ta cần map ngược lại ID và Metadata
-        scores = self.bm25.get_scores(tokenized_query)
+        tokenized_query = tokenize(query)
+        # rank_bm25 trả về điểm theo vị trí document, ta cần map ngược lại ID và Metadata
+        candidate_ids = self.metadata_index.candidate_ids(filters)
+        if candidate_ids is None:
+            scores = np.asarray(self.bm25.get_scores(tokenized_query))
+            doc_indices = None
+        elif candidate_ids.size == 0:
+            return []
+        else:
+            # Pre-filter: filter càng chặt thì càng ít doc phải chấm điểm
+            scores = np.asarray(self.bm25.get_batch_scores(tokenized_query, candidate_ids.tolist()))
+            doc_indices = candidate_ids
         
-        # Get top n indices
-        import numpy as np
-        top_n_indices = np.argsort(scores)[::-1][:k]
+        # Get top k positions (argpartition O(n) thay vì sort toàn bộ)
+        if len(scores) > k:
+            top_positions = np.argpartition(scores, -k)[-k:]
+        else:
+            top_positions = np.arange(len(scores))
+        top_positions = top_positions[np.argsort(scores[top_positions])[::-1]]
         
         results = []
-        for idx in top_n_indices:
-            if scores[idx] > 0: # Chỉ lấy nếu có điểm
+        for pos in top_positions:
+            if scores[pos] > 0: # Chỉ lấy nếu có điểm
+                idx = int(doc_indices[pos]) if doc_indices is not None else int(pos)
                 results.append({
                     "id": self.bm25_ids[idx],
                     "content": self.bm25_corpus[idx],
                     "metadata": self.bm25_metadatas[idx] if self.bm25_metadatas else {},
-                    "initial_score": float(scores[idx]), # BM25 score (không chuẩn hóa 0-1 nhưng RRF không quan tâm)
+                    "initial_score": float(scores[pos]), # BM25 score (không chuẩn hóa 0-1, fusion sẽ chuẩn hóa nếu cần)
                     "search_type": "keyword"
                 })
         return results
 
-    def _merge_results_rrf(self, vector_results: List[Dict], keyword_results: List[Dict], k: int = 60) -> List[Dict]:
-        """Gộp kết quả bằng thuật toán Reciprocal Rank Fusion (cân bằng cả 2)."""
-        
-        # Map ID -> {doc_info, rrf_score}
-        fusion_scores = {}
-        
-        # Constant k for RRF (thường là 60)
-        c = 60
-        
-        # Process Vector Results
-        for rank, doc in enumerate(vector_results):
-            doc_id = doc['id']
-            if doc_id not in fusion_scores:
-                fusion_scores[doc_id] = {**doc, "rrf_score": 0}
-            fusion_scores[doc_id]["rrf_score"] += 1 / (c + rank + 1)
-            
-        # Process Keyword Results
-        for rank, doc in enumerate(keyword_results):
-            doc_id = doc['id']
-            if doc_id not in fusion_scores:
-                fusion_scores[doc_id] = {**doc, "rrf_score": 0}
-            fusion_scores[doc_id]["rrf_score"] += 1 / (c + rank + 1)
-            
-        # Sort by RRF score desc
-        sorted_results = sorted(fusion_scores.values(), key=lambda x: x['rrf_score'], reverse=True)
-        return sorted_results[:k]
-
-    def _semantic_search(self, query: str, k: int = 10) -> List[Dict[str, Any]]:
-        """Tìm kiếm không gian vector và format lại dữ liệu."""
-        if self.collection.count() == 0:
-             return []
-             
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=k,
-            include=["documents", "metadatas", "distances"]
-        )
-
-        formatted_results = []
-        if not results['ids'] or not results['ids'][0]:
+    def _semantic_search(self, query: str, k: int = 10,
+                         filters: Optional[RetrievalFilter] = None) -> List[Dict[str, Any]]:
+        """Tìm kiếm không gian vector qua Vector Store và format lại dữ liệu. `filters` được áp dụng trước khi chấm điểm."""
+        # Vector Search không phụ thuộc BM25 (BM25 lỗi / rỗng vẫn tìm được theo vector)
+        if not self.vector_store.count:
             return []
 
-        for i in range(len(results['ids'][0])):
+        query_vector = np.asarray(self.batchers["embed"].submit([query])[0], dtype=np.float32)
+        hits = self.vector_store.search(query_vector, k, filters)
+
+        formatted_results = []
+        for row, similarity in hits:
             formatted_results.append({
-                "id": results['ids'][0][i],
-                "content": results['documents'][0][i],
-                "metadata": results['metadatas'][0][i],
-                "initial_score": 1 - results['distances'][0][i], # Convert distance to similarity
+                "id": self.bm25_ids[row],
+                "content": self.bm25_corpus[row],
+                "metadata": self.bm25_metadatas[row] if self.bm25_metadatas else {},
+                "initial_score": similarity,
                 "search_type": "vector"
             })
         
@@ -180,8 +356,8 @@ class RAGRetriever:
         # Tạo cặp [Query, Passages] cho Cross-Encoder
         pairs = [[query, r['content']] for r in results]
         
-        # Tính toán scores (logits)
-        scores = self.reranker.predict(pairs)
+        # Tính toán scores (logits), gộp chung forward pass với các request đồng thời
+        scores = self.batchers["rerank"].submit(pairs)
 
         # Gán lại score và sắp xếp
         for i, score in enumerate(scores):
@@ -0,0 +1,297 @@
+"""
+Offline retrieval evaluation: tính tập ứng viên 1 lần, sweep tham số fusion / rerank bằng NumPy.
+
+1. collect_candidates(): với mỗi query chạy Vector Search + BM25 ở độ sâu lớn (depth) và chấm Cross-Encoder cho
+   toàn bộ hợp ứng viên -> CandidateSet (ma trận Q x C), lưu .npz. Đây là phần chậm (embedding + reranker).
+2. evaluate(): replay 1 biến thể (method, weights, rrf_k, normalization, pool/rerank, top_k) trên cả ma trận,
+   không gọi model -> Hit Rate, MRR, nDCG, Recall@k trong vài ms mỗi biến thể.
+
+Replay bám sát fusion.fuse (cùng thứ tự ứng viên -> cùng tie-break). Không mô phỏng short-circuit và
+gộp Parent (expand_parents): đây là đánh giá ở mức chunk của hybrid search + rerank.
+"""
+
+import hashlib
+import itertools
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from app.models import FusionConfig
+
+MODALITIES = ("vector", "keyword")
+DEFAULT_KS = (1, 3, 5, 10)
+
+
+@dataclass
+class CandidateSet:
+    """
+    Q query x C slot ứng viên (pad). Slot theo thứ tự fuse(): ứng viên vector trước, rồi keyword-only.
+    - `*_score` NaN và `*_rank` 0 khi ứng viên không nằm trong kết quả của modality đó.
+    - `valid`: slot có ứng viên thật. `target`: chỉ số ground truth mà ứng viên khớp (-1 = không liên quan).
+    - `n_targets`: số ground truth của query (chunk ids, hoặc 1 với đánh giá theo source).
+    """
+    ids: np.ndarray            # (Q, C) object
+    valid: np.ndarray          # (Q, C) bool
+    vector_score: np.ndarray   # (Q, C) float32
+    vector_rank: np.ndarray    # (Q, C) int32, 1-based
+    keyword_score: np.ndarray
+    keyword_rank: np.ndarray
+    rerank_score: np.ndarray   # (Q, C) float32, NaN nếu không chấm
+    target: np.ndarray         # (Q, C) int16
+    n_targets: np.ndarray      # (Q,) int16
+    meta: Dict[str, Any]
+
+    @property
+    def num_queries(self) -> int:
+        return self.valid.shape[0]
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path, ids=self.ids.astype(str), valid=self.valid, vector_score=self.vector_score,
+            vector_rank=self.vector_rank, keyword_score=self.keyword_score, keyword_rank=self.keyword_rank,
+            rerank_score=self.rerank_score, target=self.target, n_targets=self.n_targets,
+            meta=np.array(json.dumps(self.meta, ensure_ascii=False)),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CandidateSet":
+        with np.load(path, allow_pickle=False) as data:
+            fields = {k: data[k] for k in data.files if k != "meta"}
+            return cls(**fields, meta=json.loads(str(data["meta"])))
+
+
+def dataset_fingerprint(dataset: List[Dict[str, Any]], level: str, depth: int, extra: str = "") -> str:
+    """Khóa cache: đổi testset / mức đánh giá / depth / index (extra = digest chunk table) -> thu thập lại."""
+    h = hashlib.sha1(f"{level}:{depth}:{extra}".encode("utf-8"))
+    for item in dataset:
+        h.update(json.dumps([item["question"], item.get("ground_truth_source"),
+                             item.get("ground_truth_chunk_ids")], ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def targets_for(item: Dict[str, Any], level: str) -> List[str]:
+    if level == "chunk":
+        return list(item.get("ground_truth_chunk_ids") or [])
+    return [item["ground_truth_source"]]
+
+
+def check_chunk_targets(dataset: List[Dict[str, Any]], row_of: callable) -> int:
+    """
+    Số ground truth chunk id có trong index (`row_of` = ChunkTable.row_of). Raise ValueError khi testset có
+    chunk id nhưng không id nào khớp: testset sinh từ index khác (vd. id cũ theo đường dẫn) -> chunk metrics = 0.
+    """
+    targets = {cid for item in dataset for cid in targets_for(item, "chunk")}
+    found = sum(1 for cid in targets if row_of(cid) is not None)
+    if targets and not found:
+        raise ValueError(f"None of the {len(targets)} ground_truth_chunk_ids exist in the index. "
+                         "Re-run generate_testset.py with the chunking options of the index.")
+    return found
+
+
+def _match_target(doc: Dict[str, Any], targets: List[str], level: str) -> int:
+    if level == "chunk":
+        return targets.index(doc["id"]) if doc["id"] in targets else -1
+    # Source: so khớp lỏng như benchmark_retrieval (metadata source có thể là đường dẫn)
+    source = doc.get("metadata", {}).get("source", "")
+    return next((i for i, t in enumerate(targets) if t and t in source), -1)
+
+
+def first_hit_rank(results: List[Dict[str, Any]], item: Dict[str, Any], level: str = "source") -> Optional[int]:
+    """Rank (1-based) của kết quả đầu tiên khớp ground truth của `item`, None nếu không có (dùng chung cho các benchmark)."""
+    targets = targets_for(item, level)
+    return next((i + 1 for i, doc in enumerate(results) if _match_target(doc, targets, level) >= 0), None)
+
+
+def collect_candidates(retriever, dataset: List[Dict[str, Any]], depth: int = 50, level: str = "source",
+                       progress: Optional[callable] = None) -> CandidateSet:
+    """Phần chậm (chạy 1 lần): vector + BM25 ở độ sâu `depth`, Cross-Encoder cho toàn bộ hợp ứng viên."""
+    rows = []
+    iterator = progress(dataset) if progress else dataset
+    for item in iterator:
+        query = item["question"]
+        vector = retriever._semantic_search(query, k=depth)
+        keyword = retriever._keyword_search(query, k=depth)
+
+        slots: Dict[str, Dict[str, Any]] = {}
+        for modality, results in (("vector", vector), ("keyword", keyword)):
+            for rank, doc in enumerate(results, start=1):
+                slot = slots.setdefault(doc["id"], {"doc": doc})
+                slot[f"{modality}_score"] = doc["initial_score"]
+                slot[f"{modality}_rank"] = rank
+        docs = [slot["doc"] for slot in slots.values()]
+        rerank = retriever.reranker.predict([[query, d["content"]] for d in docs]) if docs else []
+        targets = targets_for(item, level)
+        rows.append((list(slots.values()), np.asarray(rerank, dtype=np.float32), targets))
+
+    width = max((len(slots) for slots, _, _ in rows), default=0) or 1
+    q = len(rows)
+    cands = CandidateSet(
+        ids=np.full((q, width), "", dtype=object), valid=np.zeros((q, width), dtype=bool),
+        vector_score=np.full((q, width), np.nan, dtype=np.float32), vector_rank=np.zeros((q, width), dtype=np.int32),
+        keyword_score=np.full((q, width), np.nan, dtype=np.float32), keyword_rank=np.zeros((q, width), dtype=np.int32),
+        rerank_score=np.full((q, width), np.nan, dtype=np.float32), target=np.full((q, width), -1, dtype=np.int16),
+        n_targets=np.zeros(q, dtype=np.int16),
+        meta={"depth": depth, "level": level, "queries": [item["question"] for item in dataset]},
+    )
+    for i, (slots, rerank, targets) in enumerate(rows):
+        cands.n_targets[i] = len(targets)
+        for j, slot in enumerate(slots):
+            cands.ids[i, j] = slot["doc"]["id"]
+            cands.valid[i, j] = True
+            cands.rerank_score[i, j] = rerank[j]
+            cands.target[i, j] = _match_target(slot["doc"], targets, level)
+            for modality in MODALITIES:
+                if f"{modality}_rank" in slot:
+                    getattr(cands, f"{modality}_score")[i, j] = slot[f"{modality}_score"]
+                    getattr(cands, f"{modality}_rank")[i, j] = slot[f"{modality}_rank"]
+    return cands
+
+
+# ---- Replay (vectorized) ----
+
+def _normalize(scores: np.ndarray, present: np.ndarray, method: str) -> np.ndarray:
+    """normalize_scores() theo từng hàng, chỉ trên các ứng viên `present`."""
+    masked = np.where(present, scores, np.nan)
+    count = present.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if method == "zscore":
+            mean = np.nanmean(masked, axis=1, keepdims=True)
+            std = np.nanstd(masked, axis=1, keepdims=True)
+            out = np.where((std > 0) & (count >= 2), (masked - mean) / std, 0.0)
+        else:
+            lo = np.nanmin(np.where(present, scores, np.inf), axis=1, keepdims=True)
+            hi = np.nanmax(np.where(present, scores, -np.inf), axis=1, keepdims=True)
+            out = np.where(hi > lo, (masked - lo) / (hi - lo), 1.0)
+    return np.where(present, out, np.nan)
+
+
+def fused_scores(cands: CandidateSet, fusion: FusionConfig, vector_k: int, keyword_k: int) -> np.ndarray:
+    """Điểm fusion (Q, C); ứng viên không thuộc modality nào (sau khi cắt theo k) = -inf."""
+    weights = {"vector": fusion.vector_weight, "keyword": fusion.keyword_weight}
+    limits = {"vector": vector_k, "keyword": keyword_k}
+    present = {m: (getattr(cands, f"{m}_rank") > 0) & (getattr(cands, f"{m}_rank") <= limits[m]) & (weights[m] > 0)
+               for m in MODALITIES}
+    any_present = present["vector"] | present["keyword"]
+    score = np.zeros(cands.valid.shape, dtype=np.float64)
+
+    if fusion.method == "rrf":
+        for m in MODALITIES:
+            rank = getattr(cands, f"{m}_rank")
+            score += np.where(present[m], weights[m] / (fusion.rrf_k + rank), 0.0)
+    else:
+        # fuse() chỉ tính các modality có kết quả cho query đó (ảnh hưởng tổng trọng số của convex)
+        has_results = {m: present[m].any(axis=1, keepdims=True) for m in MODALITIES}
+        total_weight = sum(np.where(has_results[m], weights[m], 0.0) for m in MODALITIES)
+        total_weight = np.where(total_weight > 0, total_weight, 1.0)
+        for m in MODALITIES:
+            norm = _normalize(getattr(cands, f"{m}_score").astype(np.float64), present[m], fusion.normalization)
+            if fusion.method == "convex":
+                floor = np.nanmin(np.where(present[m], norm, np.inf), axis=1, keepdims=True)
+                floor = np.where(np.isfinite(floor), floor, 0.0)
+                value = np.where(present[m], norm, floor)
+                score += np.where(has_results[m], weights[m] / total_weight * value, 0.0)
+            else:
+                score += np.where(present[m], weights[m] * norm, 0.0)
+    return np.where(any_present, score, -np.inf)
+
+
+def rank_candidates(cands: CandidateSet, fusion: FusionConfig, top_k: int = 5, pool: Optional[int] = None,
+                    rerank: bool = True, vector_k: Optional[int] = None, keyword_k: Optional[int] = None) -> np.ndarray:
+    """
+    Thứ tự cuối (Q, top_k) các chỉ số slot (-1 = thiếu), giống RAGRetriever._retrieve:
+    mỗi nhánh lấy top_k*2, fuse lấy `pool` (mặc định top_k*3), rồi rerank bằng Cross-Encoder.
+    """
+    vector_k = vector_k or top_k * 2
+    keyword_k = keyword_k or top_k * 2
+    pool = pool or top_k * 3
+    fused = fused_scores(cands, fusion, vector_k, keyword_k)
+    # Stable sort trên thứ tự slot = tie-break giống sorted() trong fuse()
+    order = np.argsort(-fused, axis=1, kind="stable")[:, :pool]
+    in_pool = np.isfinite(np.take_along_axis(fused, order, axis=1))
+
+    if rerank:
+        rr = np.take_along_axis(cands.rerank_score, order, axis=1).astype(np.float64)
+        rr = np.where(in_pool & ~np.isnan(rr), rr, -np.inf)
+        by_rerank = np.argsort(-rr, axis=1, kind="stable")
+        order = np.take_along_axis(order, by_rerank, axis=1)
+        in_pool = np.take_along_axis(in_pool, by_rerank, axis=1)
+
+    order = np.where(in_pool, order, -1)[:, :top_k]
+    if order.shape[1] < top_k:
+        order = np.pad(order, ((0, 0), (0, top_k - order.shape[1])), constant_values=-1)
+    return order
+
+
+def ranking_metrics(cands: CandidateSet, order: np.ndarray, ks: Sequence[int] = DEFAULT_KS) -> Dict[str, float]:
+    """Hit Rate@k, MRR@k, nDCG@k, Recall@k (gain nhị phân, mỗi ground truth chỉ tính lần xuất hiện đầu tiên)."""
+    targets = np.where(order >= 0, np.take_along_axis(cands.target, np.maximum(order, 0), axis=1), -1)
+    max_targets = max(int(cands.n_targets.max()) if cands.n_targets.size else 0, 1)
+    depth = order.shape[1]
+    # match[q, pos, t]: vị trí pos là ground truth t
+    match = targets[:, :, None] == np.arange(max_targets)[None, None, :]
+    has_targets = cands.n_targets > 0
+    discounts = 1.0 / np.log2(np.arange(depth) + 2.0)
+
+    results = {}
+    for k in ks:
+        if k > depth:
+            continue
+        mk = match[:, :k, :]
+        found = mk.any(axis=1)                                    # (Q, T)
+        first_pos = np.where(found, mk.argmax(axis=1), k)         # (Q, T)
+        first_any = first_pos.min(axis=1)                         # (Q,)
+        hit = first_any < k
+        dcg = np.where(found, discounts[np.minimum(first_pos, depth - 1)], 0.0).sum(axis=1)
+        ideal = np.array([discounts[:min(int(n), k)].sum() for n in cands.n_targets])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            recall = found.sum(axis=1) / np.maximum(cands.n_targets, 1)
+            ndcg = np.where(ideal > 0, dcg / ideal, 0.0)
+        mrr = np.where(hit, 1.0 / (first_any + 1), 0.0)
+
+        denom = max(int(has_targets.sum()), 1)
+        results[f"hit@{k}"] = float(hit[has_targets].sum() / denom)
+        results[f"mrr@{k}"] = float(mrr[has_targets].sum() / denom)
+        results[f"ndcg@{k}"] = float(ndcg[has_targets].sum() / denom)
+        results[f"recall@{k}"] = float(recall[has_targets].sum() / denom)
+    return results
+
+
+def evaluate(cands: CandidateSet, fusion: Optional[FusionConfig] = None, top_k: int = 10, pool: Optional[int] = None,
+             rerank: bool = True, ks: Sequence[int] = DEFAULT_KS, **branch_k) -> Dict[str, float]:
+    order = rank_candidates(cands, fusion or FusionConfig(), top_k=top_k, pool=pool, rerank=rerank, **branch_k)
+    return ranking_metrics(cands, order, ks=[k for k in ks if k <= top_k])
+
+
+def variant_grid(methods: Iterable[str] = ("rrf",), vector_weights: Iterable[float] = (1.0,),
+                 keyword_weights: Iterable[float] = (1.0,), rrf_ks: Iterable[int] = (60,),
+                 normalizations: Iterable[str] = ("minmax",), pools: Iterable[Optional[int]] = (None,),
+                 reranks: Iterable[bool] = (True,)) -> List[Dict[str, Any]]:
+    """Tích Descartes các tham số; bỏ tổ hợp thừa (rrf_k chỉ cho rrf, normalization chỉ cho score/convex)."""
+    variants, seen = [], set()
+    for method, vw, kw, rrf_k, norm, pool, rr in itertools.product(
+            methods, vector_weights, keyword_weights, rrf_ks, normalizations, pools, reranks):
+        if vw == 0 and kw == 0:
+            continue
+        variant = {"method": method, "vector_weight": vw, "keyword_weight": kw,
+                   "rrf_k": rrf_k if method == "rrf" else None,
+                   "normalization": norm if method != "rrf" else None, "pool": pool, "rerank": rr}
+        key = tuple(variant.values())
+        if key not in seen:
+            seen.add(key)
+            variants.append(variant)
+    return variants
+
+
+def sweep(cands: CandidateSet, variants: List[Dict[str, Any]], top_k: int = 10,
+          ks: Sequence[int] = DEFAULT_KS) -> List[Dict[str, Any]]:
+    rows = []
+    for variant in variants:
+        fusion = FusionConfig(
+            method=variant["method"], vector_weight=variant["vector_weight"], keyword_weight=variant["keyword_weight"],
+            rrf_k=variant["rrf_k"] or 60, normalization=variant["normalization"] or "minmax",
+        )
+        metrics = evaluate(cands, fusion, top_k=top_k, pool=variant["pool"], rerank=variant["rerank"], ks=ks)
+        rows.append({**variant, **metrics})
+    return rows
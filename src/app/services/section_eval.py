@@ -0,0 +1,220 @@
+"""
+Sectioned (map-reduce) evaluation cho SRS dài.
+
+- Map: chia SRS theo Markdown header (# / ##), chấm từng mục song song. Faithfulness của 1 mục chỉ đối chiếu
+  với các tài liệu Context mà mục đó trích dẫn ([Source: file.md]) thay vì nhồi toàn bộ Context vào mọi prompt.
+- Reduce: gộp điểm các mục (trọng số theo độ dài mục) về đúng `EvaluationScore` / trọng số tiêu chí của bản full.
+- Cache theo (nội dung mục + context được trích + model): sinh lại 1 phần SRS thì các mục không đổi dùng lại điểm cũ.
+"""
+
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from app.models import (
+    EvaluationComment, EvaluationIssue, EvaluationResult, EvaluationScore, EvaluationScoreItem, SectionEvaluation,
+)
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.sqlite_cache import SQLiteKVCache
+
+CACHE_NAMESPACE = "eval_sections:v1"  # Đổi version khi đổi prompt / logic chấm mục
+CRITERIA_WEIGHTS = {
+    "completeness": 0.25,
+    "consistency": 0.2,
+    "accuracy": 0.2,
+    "format_tone": 0.15,
+    "faithfulness": 0.2,
+}
+NO_CONTEXT_FAITHFULNESS = 8.0  # Giống prompt full: không có Bối cảnh -> mặc định 8.0 (N/A)
+MIN_SECTION_CHARS = 300        # Mục quá ngắn (tiêu đề tài liệu, mục lục...) được gộp vào mục kế tiếp
+GROUPS = ((9.0, "Xuất sắc"), (7.0, "Tốt"), (5.0, "Trung bình"), (float("-inf"), "Kém"))
+
+_HEADER = re.compile(r"^(#{1,2})\s+(.+?)\s*#*\s*$")
+_CITATION = re.compile(r"\[(?:Source|Nguồn)\s*:\s*([^\]]+)\]", re.IGNORECASE)
+_DOC_BLOCK = re.compile(r"^\s*\[DOCUMENT \d+\]\s*$", re.MULTILINE)
+_DOC_SOURCE = re.compile(r"^\s*- Source:\s*(.+?)\s*$", re.MULTILINE)
+_DOC_ALSO_IN = re.compile(r"^\s*- Also in:\s*(.+?)\s*$", re.MULTILINE)  # Source của các bản gần trùng đã gộp
+
+
+@dataclass
+class Section:
+    title: str
+    content: str
+    sources: List[str] = field(default_factory=list)
+
+
+def split_srs_sections(srs_content: str, min_chars: int = MIN_SECTION_CHARS) -> List[Section]:
+    """Chia theo header cấp 1-2 (bỏ qua '#' trong code block / Mermaid), gộp mục quá ngắn vào mục sau."""
+    raw: List[Section] = []
+    title, lines, in_fence = "Preamble", [], False
+    for line in srs_content.splitlines():
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADER.match(line)
+        if match:
+            if "".join(lines).strip():
+                raw.append(Section(title, "\n".join(lines).strip()))
+            title, lines = match.group(2), []
+        lines.append(line)
+    if "".join(lines).strip():
+        raw.append(Section(title, "\n".join(lines).strip()))
+
+    sections: List[Section] = []
+    carry: Optional[Section] = None
+    for section in raw:
+        if carry is not None:
+            section = Section(section.title, f"{carry.content}\n\n{section.content}")
+        carry = section if len(section.content) < min_chars else None
+        if carry is None:
+            sections.append(section)
+    if carry is not None:
+        if sections:
+            sections[-1] = Section(sections[-1].title, f"{sections[-1].content}\n\n{carry.content}")
+        else:
+            sections.append(carry)
+
+    for section in sections:
+        section.sources = cited_sources(section.content)
+    return sections
+
+
+def cited_sources(text: str) -> List[str]:
+    """Tên file được trích dẫn dạng [Source: a.md] / [Source: a.md, b.md] (giữ thứ tự, không trùng)."""
+    sources: Dict[str, None] = {}
+    for match in _CITATION.finditer(text):
+        for name in re.split(r"[,;]", match.group(1)):
+            if name.strip():
+                sources[name.strip().lower()] = None
+    return list(sources)
+
+
+def context_blocks(rag_context: str) -> Dict[str, List[str]]:
+    """Tách Context do SRSGenerator dựng ([DOCUMENT i] / - Source: ...) thành source -> các block."""
+    blocks: Dict[str, List[str]] = {}
+    for block in _DOC_BLOCK.split(rag_context)[1:]:
+        match = _DOC_SOURCE.search(block)
+        if match:
+            blocks.setdefault(match.group(1).strip().lower(), []).append(block.strip())
+            also_in = _DOC_ALSO_IN.search(block)
+            for name in (also_in.group(1).split(",") if also_in else []):
+                if name.strip():
+                    blocks.setdefault(name.strip().lower(), []).append(block.strip())
+    return blocks
+
+
+def section_context(section: Section, rag_context: Optional[str], blocks: Dict[str, List[str]]) -> str:
+    """
+    Context dùng để chấm Faithfulness của 1 mục:
+    - Context có cấu trúc [DOCUMENT i]: chỉ các block của file mà mục trích dẫn ("" nếu mục không trích dẫn gì).
+    - Context tự do (gửi thẳng vào /evaluate-srs, không tách được): dùng nguyên văn cho mọi mục.
+    """
+    if not rag_context:
+        return ""
+    if not blocks:
+        return rag_context
+    return "\n\n".join(block for source in section.sources for block in blocks.get(source, []))
+
+
+def cache_key(section: Section, context: str, model_name: str) -> str:
+    return hashlib.sha256("\x1f".join((model_name, section.title, section.content, context)).encode("utf-8")).hexdigest()
+
+
+def group_for(total: float) -> str:
+    return next(label for bound, label in GROUPS if total >= bound)
+
+
+def aggregate(sections: List[Section], results: List[SectionEvaluation], cached: int = 0) -> EvaluationResult:
+    """Reduce: trung bình có trọng số (độ dài mục) từng tiêu chí -> EvaluationScore với trọng số của bản full."""
+    lengths = [max(len(s.content), 1) for s in sections]
+
+    def mean(values_weights) -> Optional[float]:
+        pairs = [(min(max(v, 0.0), 10.0), w) for v, w in values_weights if v is not None]
+        if not pairs:
+            return None
+        return sum(v * w for v, w in pairs) / sum(w for _, w in pairs)
+
+    items = {}
+    for criterion, weight in CRITERIA_WEIGHTS.items():
+        raw = mean((getattr(r.scores, criterion), w) for r, w in zip(results, lengths))
+        if raw is None:  # Không mục nào có Context để đối chiếu (chỉ xảy ra với faithfulness)
+            raw = NO_CONTEXT_FAITHFULNESS
+        items[criterion] = EvaluationScoreItem(raw=round(raw, 2), weight=weight, weighted=round(raw * weight, 3))
+    total = round(sum(item.weighted for item in items.values()), 2)
+
+    per_section = sorted(
+        (sum(getattr(r.scores, c) or 0.0 for c in CRITERIA_WEIGHTS if c != "faithfulness") / 4, s.title)
+        for s, r in zip(sections, results)
+    )
+    summary_lines = [f"Đánh giá theo {len(sections)} mục ({cached} mục dùng lại kết quả cache)."]
+    if per_section:
+        summary_lines.append(f"Mục yếu nhất: {per_section[0][1]} ({per_section[0][0]:.1f}/10).")
+    summary_lines += [f"- {s.title}: {r.summary}" for s, r in zip(sections, results) if r.summary]
+
+    issues = [
+        EvaluationIssue(**{**issue.model_dump(), "problem": f"[{s.title}] {issue.problem}"})
+        for s, r in zip(sections, results) for issue in r.issues
+    ]
+    return EvaluationResult(
+        score=EvaluationScore(**items, total_weighted_score=total),
+        group=group_for(total),
+        comment=EvaluationComment(
+            summary="\n".join(summary_lines),
+            strengths=list(dict.fromkeys(x for r in results for x in r.strengths)),
+            issues=issues,
+            quick_fixes=list(dict.fromkeys(x for r in results for x in r.quick_fixes)),
+        ),
+    )
+
+
+class SectionedEvaluation:
+    """
+    `score_fn(section, context) -> SectionEvaluation` là lời gọi LLM cho 1 mục (Evaluator cung cấp).
+    `cache=None` tắt cache.
+    """
+
+    def __init__(self, score_fn: Callable[[Section, str], SectionEvaluation],
+                 cache: Optional[SQLiteKVCache] = None, max_workers: int = 4, model_name: str = ""):
+        self.score_fn = score_fn
+        self.cache = cache
+        self.max_workers = max_workers
+        self.model_name = model_name
+
+    def run(self, srs_content: str, rag_context: Optional[str] = None) -> EvaluationResult:
+        sections = split_srs_sections(srs_content)
+        blocks = context_blocks(rag_context) if rag_context else {}
+        contexts = [section_context(s, rag_context, blocks) for s in sections]
+        keys = [cache_key(s, c, self.model_name) for s, c in zip(sections, contexts)]
+
+        cached = self.cache.get_many(keys) if self.cache else {}
+        results: List[Optional[SectionEvaluation]] = [
+            SectionEvaluation.model_validate(cached[k]) if k in cached else None for k in keys
+        ]
+        todo = [i for i, r in enumerate(results) if r is None]
+        metrics.inc("evaluator_section_total", len(sections) - len(todo), cache="hit")
+        metrics.inc("evaluator_section_total", len(todo), cache="miss")
+        logger.info(f"[Evaluator] Sectioned: {len(sections)} sections, {len(sections) - len(todo)} cached")
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(todo))) as pool:
+                futures = {i: pool.submit(self.score_fn, sections[i], contexts[i]) for i in todo}
+                errors = []
+                for i, future in futures.items():
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        errors.append(e)
+            # Lưu cả khi có mục lỗi -> lần chấm lại chỉ gọi LLM cho các mục còn thiếu
+            if self.cache:
+                self.cache.set_many((keys[i], results[i].model_dump()) for i in todo if results[i] is not None)
+            if errors:
+                raise errors[0]
+
+        # Mục không có Context để đối chiếu: bỏ faithfulness (LLM đôi khi vẫn tự cho điểm)
+        results = [
+            r if contexts[i] else r.model_copy(update={"scores": r.scores.model_copy(update={"faithfulness": None})})
+            for i, r in enumerate(results)
+        ]
+        return aggregate(sections, results, cached=len(sections) - len(todo))
@@ -0,0 +1,286 @@
+"""
+Index Snapshot: export/import 1 Knowledge Base thành 1 file versioned để bootstrap replica nhanh.
+
+Layout file (little-endian):
+    [MAGIC 8B][padding -> 64B][vectors: count x dim (float16/float32)][records JSON][BM25 pickle][header JSON][u64 header_len][MAGIC 8B]
+
+- Vectors nằm ở offset cố định (64, căn lề) -> np.memmap trực tiếp, không copy vào RAM.
+- Header ở cuối file (giống zip footer): chứa version, model fingerprint, offset từng section.
+- BM25 được pickle sẵn -> replica không phải tokenize/build lại. Chỉ load snapshot từ nguồn tin cậy.
+- Header chứa SHA-256 của records / BM25 (phát hiện file hỏng) và HMAC nếu có KB_SNAPSHOT_KEY
+  (phát hiện file bị sửa): kiểm tra xong mới unpickle.
+- `records_digest` (id, nội dung) cho biết collection trong Chroma còn khớp snapshot không (BM25 có dùng lại được).
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import pickle
+import struct
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.config import EMBEDDING_MODEL, KB_SNAPSHOT_KEY
+from app.services.chunk_table import table_digest
+from app.utils.logger import logger
+
+MAGIC = b"SRSKBSN1"
+FORMAT_VERSION = 2
+VECTORS_OFFSET = 64
+SNAPSHOT_SUFFIX = ".srskb"
+
+# Câu probe cố định: so embedding của model hiện tại với lúc export để phát hiện lệch model
+PROBE_TEXTS = [
+    "Quy tắc đặt mã SKU cho sản phẩm bán lẻ",
+    "Quy trình nhập kho: PO, Receipt, Putaway",
+    "Non-functional requirements: performance, security, reliability",
+]
+PROBE_MIN_COSINE = 0.999
+EXPORT_PAGE_SIZE = 5000
+
+
+class SnapshotMismatch(ValueError):
+    """Snapshot không tương thích (sai format hoặc khác embedding model)."""
+
+
+def model_fingerprint(embedding_fn) -> Dict[str, Any]:
+    probes = np.asarray(embedding_fn(PROBE_TEXTS), dtype=np.float32)
+    return {"model": EMBEDDING_MODEL, "dim": int(probes.shape[1]), "probe_vectors": probes.round(6).tolist()}
+
+
+def verify_fingerprint(expected: Dict[str, Any], embedding_fn):
+    """Raise SnapshotMismatch nếu embedding model hiện tại khác model lúc export."""
+    current = model_fingerprint(embedding_fn)
+    if expected["model"] != current["model"] or expected["dim"] != current["dim"]:
+        raise SnapshotMismatch(
+            f"Embedding model mismatch: snapshot={expected['model']}({expected['dim']}d), "
+            f"current={current['model']}({current['dim']}d)"
+        )
+    a = np.asarray(expected["probe_vectors"], dtype=np.float32)
+    b = np.asarray(current["probe_vectors"], dtype=np.float32)
+    cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+    if float(cosine.min()) < PROBE_MIN_COSINE:
+        raise SnapshotMismatch(f"Embedding model fingerprint mismatch (min probe cosine {cosine.min():.4f})")
+
+
+def records_digest(ids: List[str], documents: List[str]) -> str:
+    """Digest (id, nội dung) không phụ thuộc thứ tự trả về của Chroma."""
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    return table_digest([ids[i] for i in order], [documents[i] for i in order])
+
+
+def _sign(key: str, *digests: str) -> str:
+    return hmac.new(key.encode("utf-8"), "\n".join(digests).encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def verify_integrity(header: Dict[str, Any], records: bytes, bm25: bytes, key: str = KB_SNAPSHOT_KEY):
+    """Raise SnapshotMismatch nếu records / BM25 không khớp checksum, hoặc HMAC sai / thiếu khi có `key`."""
+    integrity = header["integrity"]
+    records_sha256 = hashlib.sha256(records).hexdigest()
+    bm25_sha256 = hashlib.sha256(bm25).hexdigest()
+    if records_sha256 != integrity["records_sha256"] or bm25_sha256 != integrity["bm25_sha256"]:
+        raise SnapshotMismatch("Snapshot checksum mismatch (corrupted file)")
+    if key:
+        signature = integrity.get("hmac_sha256")
+        if not signature or not hmac.compare_digest(signature, _sign(key, records_sha256, bm25_sha256)):
+            raise SnapshotMismatch("Snapshot signature missing or invalid (KB_SNAPSHOT_KEY)")
+    elif integrity.get("hmac_sha256"):
+        logger.warning("[Snapshot] Snapshot is signed but KB_SNAPSHOT_KEY is not set: signature not verified")
+
+
+class Snapshot:
+    """Snapshot đã mở: `vectors` là memmap read-only, records/BM25 được load vào RAM."""
+
+    def __init__(self, path: str, header: Dict[str, Any], vectors: np.ndarray, ids: List[str],
+                 documents: List[str], metadatas: List[Dict[str, Any]], bm25):
+        self.path = path
+        self.header = header
+        self.vectors = vectors
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.bm25 = bm25
+
+    @property
+    def collection_name(self) -> str:
+        return self.header["collection"]
+
+    @property
+    def fingerprint(self) -> Dict[str, Any]:
+        return self.header["model_fingerprint"]
+
+
+def export_snapshot(collection, path: str, embedding_fn, dtype: str = "float16", bm25=None,
+                    key: str = KB_SNAPSHOT_KEY) -> Dict[str, Any]:
+    """
+    Ghi toàn bộ collection (vectors, ids, documents, metadata, BM25) ra 1 file snapshot.
+    Ghi ra file tạm rồi rename -> replica không bao giờ đọc phải snapshot ghi dở. `key`: ký HMAC phần records + BM25.
+    """
+    from rank_bm25 import BM25Okapi
+    from app.services.keyword_index import tokenize
+
+    np_dtype = np.dtype(dtype)
+    ids, documents, metadatas = [], [], []
+    dim = None
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC.ljust(VECTORS_OFFSET, b"\0"))
+
+            # 1. Vectors: phân trang để không giữ cả ma trận trong RAM
+            offset = 0
+            while True:
+                page = collection.get(
+                    limit=EXPORT_PAGE_SIZE, offset=offset, include=["embeddings", "documents", "metadatas"]
+                )
+                if not page["ids"]:
+                    break
+                embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+                dim = dim or embeddings.shape[1]
+                f.write(embeddings.astype(np_dtype).tobytes())
+                ids.extend(page["ids"])
+                documents.extend(page["documents"])
+                metadatas.extend(page["metadatas"] or [{} for _ in page["ids"]])
+                offset += len(page["ids"])
+
+            vectors_nbytes = f.tell() - VECTORS_OFFSET
+
+            # 2. Records
+            records_offset = f.tell()
+            records = json.dumps({"ids": ids, "documents": documents, "metadatas": metadatas},
+                                 ensure_ascii=False).encode("utf-8")
+            f.write(records)
+            records_nbytes = f.tell() - records_offset
+
+            # 3. Keyword index (cùng tokenization với RAGRetriever)
+            if bm25 is None and documents:
+                bm25 = BM25Okapi([tokenize(doc) for doc in documents])
+            bm25_offset = f.tell()
+            bm25_bytes = pickle.dumps(bm25, protocol=pickle.HIGHEST_PROTOCOL)
+            f.write(bm25_bytes)
+            bm25_nbytes = f.tell() - bm25_offset
+
+            integrity = {
+                "records_sha256": hashlib.sha256(records).hexdigest(),
+                "bm25_sha256": hashlib.sha256(bm25_bytes).hexdigest(),
+            }
+            if key:
+                integrity["hmac_sha256"] = _sign(key, integrity["records_sha256"], integrity["bm25_sha256"])
+
+            # 4. Footer header
+            header = {
+                "format_version": FORMAT_VERSION,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "collection": collection.name,
+                "count": len(ids),
+                "dim": dim or 0,
+                "dtype": np_dtype.name,
+                "model_fingerprint": model_fingerprint(embedding_fn),
+                "records_digest": records_digest(ids, documents),
+                "integrity": integrity,
+                "sections": {
+                    "vectors": {"offset": VECTORS_OFFSET, "nbytes": vectors_nbytes},
+                    "records": {"offset": records_offset, "nbytes": records_nbytes},
+                    "bm25": {"offset": bm25_offset, "nbytes": bm25_nbytes},
+                },
+            }
+            header_bytes = json.dumps(header).encode("utf-8")
+            f.write(header_bytes)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(MAGIC)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logger.success(f"[Snapshot] Exported '{collection.name}' ({len(ids)} chunks, {np_dtype.name}) -> {path}")
+    return header
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise SnapshotMismatch(f"Not a snapshot file: {path}")
+        f.seek(-(8 + len(MAGIC)), os.SEEK_END)
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        if f.read(len(MAGIC)) != MAGIC:
+            raise SnapshotMismatch(f"Truncated snapshot file: {path}")
+        f.seek(-(8 + len(MAGIC) + header_len), os.SEEK_END)
+        header = json.loads(f.read(header_len))
+    if header.get("format_version") != FORMAT_VERSION:
+        raise SnapshotMismatch(f"Unsupported snapshot version {header.get('format_version')}")
+    return header
+
+
+def load_snapshot(path: str, embedding_fn=None, key: str = KB_SNAPSHOT_KEY) -> Snapshot:
+    """
+    Mở snapshot; nếu truyền embedding_fn thì kiểm tra fingerprint trước khi đọc dữ liệu.
+    Checksum (và HMAC nếu có `key`) được kiểm tra trước khi unpickle BM25.
+    """
+    header = read_header(path)
+    if embedding_fn is not None:
+        verify_fingerprint(header["model_fingerprint"], embedding_fn)
+
+    sections = header["sections"]
+    if header["count"]:
+        vectors = np.memmap(path, dtype=np.dtype(header["dtype"]), mode="r",
+                            offset=sections["vectors"]["offset"], shape=(header["count"], header["dim"]))
+    else:
+        vectors = np.zeros((0, header["dim"]), dtype=np.dtype(header["dtype"]))
+    with open(path, "rb") as f:
+        f.seek(sections["records"]["offset"])
+        records_bytes = f.read(sections["records"]["nbytes"])
+        f.seek(sections["bm25"]["offset"])
+        bm25_bytes = f.read(sections["bm25"]["nbytes"])
+    verify_integrity(header, records_bytes, bm25_bytes, key)
+    records = json.loads(records_bytes)
+    bm25 = pickle.loads(bm25_bytes)
+
+    return Snapshot(path, header, vectors, records["ids"], records["documents"], records["metadatas"], bm25)
+
+
+def current_metadatas(snapshot: Snapshot, collection) -> Optional[List[Dict[str, Any]]]:
+    """
+    Metadata hiện tại trong Chroma theo thứ tự hàng của snapshot nếu (id, nội dung) của collection vẫn khớp
+    `records_digest`; None nếu index đã đổi sau khi export (kể cả sửa cùng số chunk) -> phải build lại BM25.
+    """
+    ids, documents, metadatas = [], [], []
+    offset = 0
+    while True:
+        page = collection.get(limit=EXPORT_PAGE_SIZE, offset=offset, include=["documents", "metadatas"])
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"] or [{} for _ in page["ids"]])
+        offset += len(page["ids"])
+    if records_digest(ids, documents) != snapshot.header["records_digest"]:
+        return None
+    by_id = dict(zip(ids, metadatas))
+    return [by_id[doc_id] for doc_id in snapshot.ids]
+
+
+def import_snapshot(snapshot: Snapshot, client, embedding_fn, collection_name: Optional[str] = None,
+                    batch_size: int = 1000):
+    """Nạp snapshot vào Chroma bằng embeddings có sẵn (không chạy lại embedding model)."""
+    name = collection_name or snapshot.collection_name
+    collection = client.get_or_create_collection(
+        name=name, embedding_function=embedding_fn, metadata={"hnsw:space": "cosine"}
+    )
+    for i in range(0, len(snapshot.ids), batch_size):
+        collection.upsert(
+            ids=snapshot.ids[i:i + batch_size],
+            embeddings=np.asarray(snapshot.vectors[i:i + batch_size], dtype=np.float32),
+            documents=snapshot.documents[i:i + batch_size],
+            metadatas=snapshot.metadatas[i:i + batch_size],
+        )
+    logger.success(f"[Snapshot] Imported {len(snapshot.ids)} chunks into '{name}'")
+    return collection
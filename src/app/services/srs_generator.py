@@ -1,8 +1,15 @@
 import os
 from openai import OpenAI
 from dotenv import load_dotenv
+from typing import Optional
+from app.config import LLM_BASE_URL
+from app.models import FusionConfig, RetrievalFilter
+from app.services.dedup import SOURCES_SEPARATOR
+from app.services.kb_registry import KnowledgeBaseNotFound, KnowledgeBaseRegistry
 from app.services.rag_retriever import RAGRetriever
 from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.single_flight import SingleFlight, make_key
 
 load_dotenv()
 
@@ -29,22 +36,43 @@ class SRSGenerator:
     def __init__(self):
         # Init LLM Client
         self.client = OpenAI(
-            base_url="https://router.huggingface.co/v1",
+            base_url=LLM_BASE_URL,
             api_key=os.getenv("HF_TOKEN"),
         )
         self.model = "Qwen/Qwen3-Coder-30B-A3B-Instruct:nebius"
         
         # [NEW] Init RAG Retriever
-        # Gợi ý: Khởi tạo instance của RAGRetriever tại đây
-        self.retriever = RAGRetriever()
+        # Mỗi Knowledge Base (collection) được nạp lazy qua Registry, dùng chung models
+        self.kb_registry = KnowledgeBaseRegistry()
+        # Nhiều request cùng mô tả + tham số đang chạy đồng thời -> chỉ gọi LLM 1 lần
+        self._inflight = SingleFlight("generate_srs")
 
-    def generate_srs(self, project_description: str, use_rag: bool = True) -> tuple[str, str]:
+    @property
+    def retriever(self) -> RAGRetriever:
+        """Retriever của Knowledge Base mặc định."""
+        return self.kb_registry.get()
+
+    def generate_srs(self, project_description: str, use_rag: bool = True,
+                     fusion: Optional[FusionConfig] = None,
+                     filters: Optional[RetrievalFilter] = None,
+                     collection: Optional[str] = None) -> tuple[str, str]:
         """
         Hàm tạo SRS chính với logic Plan-then-Generate.
         Args:
             project_description: Input của user.
             use_rag: Có bật RAG hay không.
+            fusion: Cấu hình Hybrid Fusion (None = mặc định của Retriever).
+            filters: Lọc metadata (source, section, category, ngày) cho Knowledge Base.
+            collection: Knowledge Base cần dùng (None = mặc định). Raise KnowledgeBaseNotFound nếu collection được chỉ định
+                không tồn tại; KB mặc định chưa index thì sinh SRS không có context như trước.
         """
+        key = make_key(project_description, use_rag, fusion, filters, collection)
+        return self._inflight.do(
+            key, lambda: self._generate_srs(project_description, use_rag, fusion, filters, collection)
+        )
+
+    def _generate_srs(self, project_description: str, use_rag: bool, fusion: Optional[FusionConfig],
+                      filters: Optional[RetrievalFilter], collection: Optional[str]) -> tuple[str, str]:
         import time
         start_time = time.time()
         logger.info(f"[SRS Generator] Start: {project_description} | RAG Mode: {use_rag}")
@@ -52,11 +80,21 @@ class SRSGenerator:
         context_str = ""
         context_sources = []
         
+        if use_rag:
+            try:
+                retriever = self.kb_registry.get(collection)
+            except KnowledgeBaseNotFound:
+                if collection:
+                    raise
+                logger.warning("[Retrieval] Default knowledge base is not indexed yet. Proceeding without RAG.")
+                use_rag = False
+
         if use_rag:
             try:
                 logger.debug("[Retrieval] Searching Knowledge Base...")
                 # 1. Retrieve Context (Hybrid Search + Rerank)
-                retrieved_docs = self.retriever.retrieve(project_description, top_k=5, rerank=True)
+                with metrics.timer("generation_stage_seconds", stage="retrieval"):
+                    retrieved_docs = retriever.retrieve(project_description, top_k=5, rerank=True, fusion=fusion, filters=filters)
                 
                 if retrieved_docs:
                     logger.success(f"[Retrieval] Found {len(retrieved_docs)} documents.")
@@ -66,17 +104,21 @@ class SRSGenerator:
                     for i, doc in enumerate(retrieved_docs):
                         source_name = doc['metadata'].get('source', 'Unknown')
                         score = doc.get('rerank_score', doc.get('initial_score', 0))
+                        # Chunk canonical đại diện cho các bản gần trùng (dedup lúc index): vẫn trích dẫn được các file đó
+                        also_in = [s for s in doc['metadata'].get('duplicate_sources', '').split(SOURCES_SEPARATOR) if s]
+                        also_line = f"\n                        - Also in: {', '.join(also_in)}" if also_in else ""
                         
                         # Format context block
                         doc_block = f"""
                         [DOCUMENT {i+1}]
-                        - Source: {source_name}
+                        - Source: {source_name}{also_line}
                         - Relevance Score: {score:.4f}
                         - Content:
-                        {doc['content']}
+                        {doc.get('context', doc['content'])}
                         """
                         context_parts.append(doc_block)
                         context_sources.append(source_name)
+                        context_sources.extend(also_in)
                     
                     context_str = "\n".join(context_parts)
                 else:
@@ -108,15 +150,16 @@ class SRSGenerator:
         # 4. Call LLM
         logger.info(f"[Generation] Sending prompt to LLM (Context Len: {len(context_str)} chars)...")
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Yêu cầu dự án: {project_description}\n\nHãy viết bản SRS chi tiết ngay bây giờ."}
-                ],
-                temperature=0.2, # Low temp for factual accuracy
-                max_tokens=4096  # Ensure enough space for full SRS
-            )
+            with metrics.timer("generation_stage_seconds", stage="llm"):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": f"Yêu cầu dự án: {project_description}\n\nHãy viết bản SRS chi tiết ngay bây giờ."}
+                    ],
+                    temperature=0.2, # Low temp for factual accuracy
+                    max_tokens=4096  # Ensure enough space for full SRS
+                )
             
             result = response.choices[0].message.content
             print(f"[Generation] Done in {time.time() - start_time:.2f}s")
@@ -0,0 +1,256 @@
+"""
+Chunking theo token của model (thay cho đếm ký tự), chọn chiến lược theo từng collection.
+
+Bi-Encoder MiniLM chỉ đọc 128 token đầu, Cross-Encoder 512 token: chunk ~1000 ký tự tiếng Việt thường vượt 128 token
+-> phần đuôi bị cắt âm thầm khi embed, còn overlap 100 ký tự thì tốn compute. Ở đây kích thước được đo bằng chính
+tokenizer của embedding model và chunk được ghép từ các đơn vị nguyên vẹn (đoạn / câu / block):
+
+- chars:            chunk_flat cũ (Header split -> RecursiveCharacterTextSplitter), giữ nguyên chunk id của index cũ.
+- header:           Header split -> ghép các đoạn văn (đoạn quá dài tách theo câu, rồi theo từ) đến `max_tokens`.
+- sentence_window:  Header split -> ghép từng câu đến `max_tokens`, overlap bằng các câu nguyên vẹn cuối chunk trước.
+- structured:       như header nhưng code block (Mermaid, SQL schema...) và bảng Markdown không bao giờ bị cắt ngang
+                    (block dài được phép tới `block_max_tokens` = giới hạn của Cross-Encoder).
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_STRATEGY, EMBEDDING_MODEL
+from app.services.chunking import build_metadata, chunk_flat, document_key, split_sections, stable_id
+from app.utils.logger import logger
+
+STRATEGIES = ("chars", "header", "sentence_window", "structured")
+EMBEDDER_MAX_TOKENS = 128   # paraphrase-multilingual-MiniLM-L12-v2 max_seq_length
+SPECIAL_TOKENS = 2          # [CLS] + [SEP] tokenizer tự thêm, chiếm chỗ trong max_seq_length
+EMBEDDER_TEXT_TOKENS = EMBEDDER_MAX_TOKENS - SPECIAL_TOKENS  # Số token nội dung tối đa không bị cắt khi embed
+RERANKER_MAX_TOKENS = 512   # mmarco-mMiniLMv2-L12-H384
+
+_SENTENCE_END = re.compile(r"((?<=[.!?…;:])[ \t]+|\s*\n\s*)")
+_FENCE = re.compile(r"^\s*```")
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+@dataclass
+class ChunkingConfig:
+    strategy: str = CHUNK_STRATEGY
+    max_tokens: int = CHUNK_MAX_TOKENS
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+    block_max_tokens: int = RERANKER_MAX_TOKENS
+    # Chỉ dùng cho strategy "chars"
+    chunk_size: int = 1000
+    chunk_overlap: int = 100
+
+
+def approx_token_count(text: str) -> int:
+    """Ước lượng khi không có tokenizer: mỗi từ / dấu câu ~1 token, từ dài (> 6 ký tự) ~2 token (subword)."""
+    return sum(2 if len(t) > 6 else 1 for t in _APPROX_TOKEN.findall(text))
+
+
+@lru_cache(maxsize=1)
+def load_token_counter() -> Callable[[str], int]:
+    """
+    Đếm token nội dung bằng tokenizer của embedding model (không tính [CLS]/[SEP] để cộng dồn được theo unit,
+    giới hạn tương ứng là EMBEDDER_TEXT_TOKENS); thiếu transformers thì ước lượng.
+    """
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{EMBEDDING_MODEL}")
+    except Exception as e:  # ImportError hoặc không tải được model (offline)
+        logger.warning(f"[Chunking] Tokenizer unavailable ({e!r}), using approximate token counts")
+        return approx_token_count
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+@dataclass
+class _Unit:
+    text: str
+    tokens: int
+    sep: str            # Chuỗi nối với unit trước ("\n\n" giữa đoạn / block, " " hoặc "\n" giữa câu)
+    block: str = ""     # "code:<lang>" / "table" với unit atomic của strategy structured
+
+
+def _split_sentences(text: str) -> List[Tuple[str, str]]:
+    """[(câu, chuỗi nối với câu trước)]: giữ xuống dòng (dòng tiêu đề, list item), còn lại nối bằng space."""
+    parts = _SENTENCE_END.split(text)
+    sentences = []
+    for i in range(0, len(parts), 2):
+        if parts[i].strip():
+            sep = "\n" if i and "\n" in parts[i - 1] else " "
+            sentences.append((parts[i].strip(), sep))
+    return sentences
+
+
+def _split_words(text: str, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """Phương án cuối cho "câu" dài hơn max_tokens (vd: dòng liệt kê không dấu câu): cắt theo từ."""
+    pieces, current = [], []
+    for word in text.split():
+        if current and count(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _fit(text: str, sep: str, max_tokens: int, count: Callable[[str], int], by_sentence: bool) -> List[_Unit]:
+    """Tách 1 đoạn thành các unit <= max_tokens: nguyên đoạn -> theo câu -> theo từ."""
+    tokens = count(text)
+    if tokens <= max_tokens and not by_sentence:
+        return [_Unit(text, tokens, sep)]
+    units = []
+    for i, (sentence, s_sep) in enumerate(_split_sentences(text)):
+        s_sep = sep if i == 0 else s_sep
+        s_tokens = count(sentence)
+        if s_tokens <= max_tokens:
+            units.append(_Unit(sentence, s_tokens, s_sep))
+        else:
+            units += [_Unit(w, count(w), s_sep if j == 0 else " ")
+                      for j, w in enumerate(_split_words(sentence, max_tokens, count))]
+    return units
+
+
+def _blocks(text: str) -> List[Tuple[str, str]]:
+    """Tách section thành [(kind, text)]: kind = "text" | "code:<lang>" | "table" (block giữ nguyên)."""
+    blocks, buf, kind = [], [], "text"
+
+    def flush():
+        if "\n".join(buf).strip():
+            blocks.append((kind, "\n".join(buf).strip("\n")))
+        buf.clear()
+
+    for line in text.splitlines():
+        if kind.startswith("code"):
+            buf.append(line)
+            if _FENCE.match(line):
+                flush()
+                kind = "text"
+            continue
+        if _FENCE.match(line):
+            flush()
+            kind = "code:" + (line.strip()[3:].strip().lower() or "text")
+            buf.append(line)
+            continue
+        is_row = bool(_TABLE_ROW.match(line))
+        if is_row != (kind == "table"):
+            flush()
+            kind = "table" if is_row else "text"
+        buf.append(line)
+    flush()  # Code block chưa đóng cũng được giữ nguyên
+    return blocks
+
+
+def _units(section_text: str, config: ChunkingConfig, count: Callable[[str], int]) -> List[_Unit]:
+    by_sentence = config.strategy == "sentence_window"
+    if config.strategy != "structured":
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", section_text) if p.strip()]
+        return [u for p in paragraphs for u in _fit(p, "\n\n", config.max_tokens, count, by_sentence)]
+
+    units = []
+    for kind, text in _blocks(section_text):
+        if kind == "text":
+            for p in (p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()):
+                units += _fit(p, "\n\n", config.max_tokens, count, by_sentence=False)
+            continue
+        tokens = count(text)
+        if tokens <= config.block_max_tokens:
+            units.append(_Unit(text, tokens, "\n\n", block=kind))
+            continue
+        # Block vượt cả giới hạn Cross-Encoder: cắt theo dòng (giữ header của bảng / dòng mở fence ở mỗi phần)
+        lines = text.splitlines()
+        head = lines[:2] if kind == "table" else lines[:1]
+        tail = ["```"] if kind.startswith("code") and _FENCE.match(lines[-1]) else []
+        body = lines[len(head):len(lines) - len(tail)]
+        part: List[str] = []
+        for line in body:
+            if part and count("\n".join(head + part + [line] + tail)) > config.block_max_tokens:
+                piece = "\n".join(head + part + tail)
+                units.append(_Unit(piece, count(piece), "\n\n", block=kind))
+                part = []
+            part.append(line)
+        if part:
+            piece = "\n".join(head + part + tail)
+            units.append(_Unit(piece, count(piece), "\n\n", block=kind))
+    return units
+
+
+def _pack(units: List[_Unit], config: ChunkingConfig) -> List[List[_Unit]]:
+    """
+    Ghép unit đến max_tokens; chunk mới mở đầu bằng các unit cuối chunk trước (tổng <= overlap_tokens).
+    Block dài hơn max_tokens (<= block_max_tokens) đứng riêng 1 chunk thay vì bị cắt.
+    """
+    chunks, current, size = [], [], 0
+    for unit in units:
+        if current and size + unit.tokens > config.max_tokens:
+            chunks.append(current)
+            overlap, o_size = [], 0
+            for prev in reversed(current):
+                # Block (bảng / code) không bao giờ được lặp lại làm overlap
+                if prev.block or o_size + prev.tokens > config.overlap_tokens \
+                        or o_size + prev.tokens + unit.tokens > config.max_tokens:
+                    break
+                overlap.insert(0, prev)
+                o_size += prev.tokens
+            current, size = overlap, o_size
+        current.append(unit)
+        size += unit.tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_tokens(text: str, initial_metadata: Dict[str, Any], config: ChunkingConfig,
+                 count: Optional[Callable[[str], int]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """Chunk theo token (strategy header / sentence_window / structured). Trả về [(content, metadata)] như chunk_flat."""
+    count = count or load_token_counter()
+    indexed_at = datetime.now()
+    id_key = document_key(initial_metadata)
+    final_chunks = []
+
+    for section in split_sections(text):
+        for units in _pack(_units(section.page_content, config, count), config):
+            content = units[0].text + "".join(u.sep + u.text for u in units[1:])
+            doc_id = stable_id(id_key, config.strategy, str(len(final_chunks)))
+            metadata = build_metadata(initial_metadata, section.metadata, doc_id, indexed_at)
+            metadata.update({"chunk_strategy": config.strategy, "token_count": count(content)})
+            blocks = list(dict.fromkeys(u.block for u in units if u.block))
+            if blocks:
+                metadata["block_type"] = ",".join(blocks)  # Chroma chỉ nhận metadata phẳng
+            final_chunks.append((content, metadata))
+    return final_chunks
+
+
+def chunk_document(text: str, initial_metadata: Dict[str, Any], config: ChunkingConfig,
+                   count: Optional[Callable[[str], int]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """Điểm vào chung cho Indexer / generate_testset: chọn chiến lược theo config."""
+    if config.strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy '{config.strategy}', expected one of {STRATEGIES}")
+    if config.strategy == "chars":
+        return chunk_flat(text, initial_metadata, config.chunk_size, config.chunk_overlap)
+    return chunk_tokens(text, initial_metadata, config, count)
+
+
+def chunking_metadata(config: ChunkingConfig) -> Dict[str, Any]:
+    """Ghi vào metadata của Chroma collection lúc tạo -> lần index sau (watch mode...) dùng lại đúng chiến lược."""
+    metadata = {"chunk_strategy": config.strategy, "chunk_max_tokens": config.max_tokens,
+                "chunk_overlap_tokens": config.overlap_tokens}
+    if config.strategy == "chars":
+        metadata.update({"chunk_size": config.chunk_size, "chunk_overlap": config.chunk_overlap})
+    return metadata
+
+
+def from_collection_metadata(metadata: Optional[Dict[str, Any]], **defaults) -> ChunkingConfig:
+    """ChunkingConfig đã ghi trong metadata collection; collection cũ (chưa ghi) -> `defaults`."""
+    config = ChunkingConfig(**defaults)
+    metadata = metadata or {}
+    if metadata.get("chunk_strategy") in STRATEGIES:
+        config.strategy = metadata["chunk_strategy"]
+        config.max_tokens = int(metadata.get("chunk_max_tokens", config.max_tokens))
+        config.overlap_tokens = int(metadata.get("chunk_overlap_tokens", config.overlap_tokens))
+        config.chunk_size = int(metadata.get("chunk_size", config.chunk_size))
+        config.chunk_overlap = int(metadata.get("chunk_overlap", config.chunk_overlap))
+    return config
@@ -0,0 +1,394 @@
+"""
+Vector Store: tách phần Vector Search ra sau 1 interface để RAGRetriever đổi backend theo cấu hình.
+
+- ChromaVectorStore: hành vi cũ (HNSW của Chroma, filter bằng mệnh đề `where`).
+- NumpyVectorStore: exact cosine trên ma trận float32 đã chuẩn hóa, lưu ra .npy và mở bằng memmap
+  (matmul theo batch + argpartition, không round-trip qua Chroma client).
+  Hàng của ma trận khớp thứ tự ChunkTable của retriever -> filter dùng lại MetadataBitmapIndex.
+- IVF (nlist > 0): k-means chia ma trận thành `nlist` cụm, query chỉ quét `nprobe` cụm gần nhất
+  (mở rộng dần khi các cụm đó không đủ k hàng qua filter).
+- dtype float16 / int8 (scalar quantization theo từng chiều): quét trên bản nén (nhỏ 2-4 lần),
+  rồi chấm lại `k * rescore_factor` ứng viên tốt nhất bằng ma trận float32 (memmap, chỉ đọc vài hàng).
+
+Mọi backend trả về [(row, similarity)], row là vị trí trong ChunkTable của retriever.
+"""
+
+import json
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.models import RetrievalFilter
+from app.services.chunk_table import ChunkTable
+from app.services.metadata_filter import MetadataBitmapIndex, has_date_filter, to_chroma_where
+from app.utils.logger import logger
+
+BACKENDS = ("chroma", "numpy", "ivf")
+DTYPES = ("float32", "float16", "int8")
+RESCORE_FACTOR = 4
+BATCH_ROWS = 65536          # Số hàng mỗi lần matmul (giới hạn RAM tạm khi quét memmap)
+COMPRESSED_BATCH_ROWS = 4096  # Bản nén phải đổi sang float32 trước matmul -> block nhỏ cho vừa cache CPU
+FETCH_PAGE_SIZE = 5000
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 256
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Scalar quantization đối xứng theo từng chiều: x ~ codes * scales, codes trong [-127, 127]."""
+    scales = np.zeros(matrix.shape[1], dtype=np.float32)
+    for start in range(0, matrix.shape[0], BATCH_ROWS):
+        scales = np.maximum(scales, np.abs(np.asarray(matrix[start:start + BATCH_ROWS])).max(axis=0))
+    scales = np.maximum(scales, 1e-12) / 127.0
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    for start in range(0, matrix.shape[0], BATCH_ROWS):
+        block = np.asarray(matrix[start:start + BATCH_ROWS], dtype=np.float32)
+        codes[start:start + len(block)] = np.clip(np.rint(block / scales), -127, 127)
+    return codes, scales
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Vị trí k điểm cao nhất, đã sort giảm dần (argpartition O(n) thay vì sort toàn bộ)."""
+    if len(scores) > k:
+        positions = np.argpartition(scores, -k)[-k:]
+    else:
+        positions = np.arange(len(scores))
+    return positions[np.argsort(scores[positions])[::-1]]
+
+
+class VectorStore(ABC):
+    """Interface chung cho các backend Vector Search."""
+
+    name = "base"
+
+    @abstractmethod
+    def search(self, query_vector: np.ndarray, k: int,
+               filters: Optional[RetrievalFilter] = None) -> List[Tuple[int, float]]:
+        """Top-k [(row, similarity)] sau khi áp dụng `filters`."""
+
+    @property
+    @abstractmethod
+    def count(self) -> int:
+        """Số vector đang được index."""
+
+    @property
+    def memory_bytes(self) -> int:
+        """RAM do backend giữ (không tính page cache của memmap) để Registry quyết định eviction."""
+        return 0
+
+
+class ChromaVectorStore(VectorStore):
+    """Vector Search qua ChromaDB (HNSW). Kết quả được map về hàng của ChunkTable qua `row_of`."""
+
+    name = "chroma"
+
+    def __init__(self, collection, chunks: ChunkTable, metadata_index: Optional[MetadataBitmapIndex] = None):
+        self.collection = collection
+        self.chunks = chunks
+        self.metadata_index = metadata_index
+
+    @property
+    def count(self) -> int:
+        # Số hàng lấy lúc nạp / refresh (store được dựng lại khi index đổi): không round-trip Chroma mỗi query
+        return len(self.chunks)
+
+    def search(self, query_vector: np.ndarray, k: int,
+               filters: Optional[RetrievalFilter] = None) -> List[Tuple[int, float]]:
+        # Số lượng lấy lúc nạp (retriever được dựng lại khi index đổi) -> không gọi count() mỗi query
+        total = self.count
+        if not total:
+            return []
+        if not (has_date_filter(filters) and self.metadata_index is not None and self.metadata_index.missing_created_ts):
+            return self._query(query_vector, min(k, total), to_chroma_where(filters))
+
+        # Index cũ thiếu `created_ts`: lọc ngày sau bằng bitmap (fallback created_at, giống keyword search),
+        # tăng dần n_results tới khi đủ k hàng thỏa filter
+        mask = self.metadata_index.mask(filters)
+        if not mask.any():
+            return []
+        where, n = to_chroma_where(filters, dates=False), min(k, total)
+        while True:
+            hits = [(row, score) for row, score in self._query(query_vector, n, where) if mask[row]]
+            if len(hits) >= k or n >= total:
+                return hits[:k]
+            n = min(total, n * 4)
+
+    def _query(self, query_vector: np.ndarray, n: int, where: Optional[Dict[str, Any]]) -> List[Tuple[int, float]]:
+        results = self.collection.query(
+            query_embeddings=[np.asarray(query_vector, dtype=np.float32).tolist()],
+            n_results=n,
+            where=where,
+            include=["distances"],
+        )
+        if not results["ids"] or not results["ids"][0]:
+            return []
+        hits = []
+        for doc_id, distance in zip(results["ids"][0], results["distances"][0]):
+            row = self.chunks.row_of(doc_id)
+            if row is not None:
+                hits.append((row, 1 - distance))  # Convert distance to similarity
+        return hits
+
+
+class IVFIndex:
+    """Inverted File: centroid (spherical k-means) + danh sách hàng của từng cụm."""
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray):
+        self.centroids = centroids
+        self.assignments = assignments
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(assignments[order], np.arange(1, len(centroids)))
+        self.lists = np.split(order, bounds)
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, nlist: int, seed: int = 0) -> "IVFIndex":
+        rng = np.random.default_rng(seed)
+        n = matrix.shape[0]
+        nlist = max(1, min(nlist, n))
+        sample_rows = np.sort(rng.choice(n, size=min(n, nlist * KMEANS_SAMPLE_PER_LIST), replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = normalize_rows(centroids)
+
+        assignments = np.empty(n, dtype=np.int32)
+        for start in range(0, n, BATCH_ROWS):
+            block = np.asarray(matrix[start:start + BATCH_ROWS], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return cls(centroids, assignments)
+
+    def probe(self, query_vector: np.ndarray, nprobe: int) -> np.ndarray:
+        """Các hàng thuộc `nprobe` cụm gần query nhất (đã sort để đọc memmap tuần tự)."""
+        nearest = top_k(self.centroids @ query_vector, nprobe)
+        return np.sort(np.concatenate([self.lists[c] for c in nearest]))
+
+    @property
+    def memory_bytes(self) -> int:
+        return int(self.centroids.nbytes + self.assignments.nbytes + sum(lst.nbytes for lst in self.lists))
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact (hoặc IVF) cosine search in-process trên ma trận đã chuẩn hóa (có thể là memmap).
+    `codes` là bản nén dùng để quét (float16 / int8 + `scales`); None = quét thẳng `matrix` float32.
+    """
+
+    name = "numpy"
+
+    def __init__(self, matrix: np.ndarray, metadata_index: Optional[MetadataBitmapIndex] = None,
+                 ivf: Optional[IVFIndex] = None, nprobe: int = 8, codes: Optional[np.ndarray] = None,
+                 scales: Optional[np.ndarray] = None, rescore_factor: int = RESCORE_FACTOR):
+        self.matrix = matrix
+        self.metadata_index = metadata_index
+        self.ivf = ivf
+        self.nprobe = nprobe
+        self.codes = matrix if codes is None else codes
+        self.scales = scales
+        self.rescore_factor = rescore_factor
+        if ivf is not None:
+            self.name = "ivf"
+        if self.codes.dtype != np.float32:
+            self.name = f"{self.name}-{self.codes.dtype.name}"
+
+    @property
+    def count(self) -> int:
+        return int(self.matrix.shape[0])
+
+    @classmethod
+    def open(cls, cache_dir: str, collection, chunks: ChunkTable,
+             metadata_index: Optional[MetadataBitmapIndex] = None, vectors: Optional[np.ndarray] = None,
+             nlist: int = 0, nprobe: int = 8, dtype: str = "float32") -> "NumpyVectorStore":
+        """
+        Mở ma trận đã cache (`{cache_dir}/{collection}.npy`, memmap) nếu còn khớp nội dung,
+        ngược lại lấy embeddings từ Chroma (hoặc `vectors` của Snapshot) và ghi lại cache.
+        Với dtype float16/int8, bản nén được cache cạnh đó (`.float16.npy` / `.int8.npy` + `.int8_scales.npy`).
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype '{dtype}', expected one of {DTYPES}")
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, collection.name)
+        meta_path = base + ".json"
+        digest = chunks.digest
+        count = len(chunks)
+
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+        if meta.get("digest") == digest and os.path.exists(base + ".npy"):
+            matrix = np.load(base + ".npy", mmap_mode="r")
+        else:
+            if vectors is None:
+                vectors = cls._fetch_embeddings(collection, chunks)
+            matrix = normalize_rows(vectors) if count else np.zeros((0, 0), dtype=np.float32)
+            _atomic_save(base + ".npy", matrix)
+            meta = {"digest": digest, "count": count, "dim": int(matrix.shape[1])}
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            logger.info(f"[VectorStore] Cached {count} normalized vectors for '{collection.name}'")
+            if count:
+                matrix = np.load(base + ".npy", mmap_mode="r")
+
+        codes, scales = None, None
+        if dtype != "float32" and count:
+            codes_path = f"{base}.{dtype}.npy"
+            if meta.get("codes", {}).get(dtype) == digest and os.path.exists(codes_path):
+                codes = np.load(codes_path, mmap_mode="r")
+                if dtype == "int8":
+                    scales = np.load(base + ".int8_scales.npy")
+            else:
+                if dtype == "int8":
+                    codes, scales = quantize_int8(matrix)
+                    _atomic_save(base + ".int8_scales.npy", scales)
+                else:
+                    codes = np.asarray(matrix, dtype=np.float16)
+                _atomic_save(codes_path, codes)
+                codes = np.load(codes_path, mmap_mode="r")
+                meta.setdefault("codes", {})[dtype] = digest
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+
+        ivf = None
+        if nlist and count:
+            ivf_path = f"{base}.ivf{nlist}.npz"
+            if meta.get("ivf", {}).get(str(nlist)) == digest and os.path.exists(ivf_path):
+                with np.load(ivf_path) as data:
+                    ivf = IVFIndex(data["centroids"], data["assignments"])
+            else:
+                ivf = IVFIndex.train(matrix, nlist)
+                np.savez(ivf_path, centroids=ivf.centroids, assignments=ivf.assignments)
+                meta.setdefault("ivf", {})[str(nlist)] = digest
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+        return cls(matrix, metadata_index=metadata_index, ivf=ivf, nprobe=nprobe, codes=codes, scales=scales)
+
+    @staticmethod
+    def _fetch_embeddings(collection, chunks: ChunkTable) -> np.ndarray:
+        """Lấy embeddings từ Chroma (phân trang) rồi sắp lại theo thứ tự hàng của ChunkTable."""
+        matrix = None
+        offset = 0
+        while True:
+            page = collection.get(limit=FETCH_PAGE_SIZE, offset=offset, include=["embeddings"])
+            if not page["ids"]:
+                break
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if matrix is None:
+                matrix = np.zeros((len(chunks), embeddings.shape[1]), dtype=np.float32)
+            for doc_id, vector in zip(page["ids"], embeddings):
+                row = chunks.row_of(doc_id)
+                if row is not None:
+                    matrix[row] = vector
+            offset += len(page["ids"])
+        return matrix if matrix is not None else np.zeros((len(chunks), 0), dtype=np.float32)
+
+    def search(self, query_vector: np.ndarray, k: int,
+               filters: Optional[RetrievalFilter] = None) -> List[Tuple[int, float]]:
+        if self.matrix.shape[0] == 0:
+            return []
+        query_vector = normalize_rows(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+
+        mask = self.metadata_index.mask(filters) if self.metadata_index is not None else None
+        if self.ivf is not None:
+            rows = self._probe(query_vector, k, mask)
+        else:
+            rows = None if mask is None else np.flatnonzero(mask)
+        if rows is not None and rows.size == 0:
+            return []
+
+        compressed = self.codes is not self.matrix
+        best_rows, best_scores = self._scan(query_vector, k * self.rescore_factor if compressed else k, rows)
+        if compressed:
+            # Rescore: chấm lại ứng viên bằng float32 (điểm trả về là cosine chính xác)
+            order = np.argsort(best_rows)
+            best_rows = best_rows[order]
+            best_scores = np.asarray(self.matrix[best_rows], dtype=np.float32) @ query_vector
+        order = top_k(best_scores, k)
+        return [(int(best_rows[i]), float(best_scores[i])) for i in order]
+
+    def _probe(self, query_vector: np.ndarray, k: int, mask: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Hàng của `nprobe` cụm gần nhất (đã lọc theo `mask`). Post-filter có thể còn < k hàng -> nhân đôi nprobe
+        tới khi đủ k, cùng lắm quét mọi cụm (= exact scan trên tập đã lọc).
+        """
+        nlist = len(self.ivf.centroids)
+        nprobe = min(self.nprobe, nlist)
+        while True:
+            rows = self.ivf.probe(query_vector, nprobe)
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) >= k or nprobe >= nlist:
+                return rows
+            nprobe = min(nprobe * 2, nlist)
+
+    def _scan(self, query_vector: np.ndarray, k: int, rows: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Matmul theo batch, mỗi batch chỉ giữ top-k -> RAM tạm không phụ thuộc kích thước corpus."""
+        # int8: (codes * scales) @ q == codes @ (scales * q) -> chỉ scale query 1 lần
+        query_vector = query_vector * self.scales if self.scales is not None else query_vector
+        total = self.codes.shape[0] if rows is None else len(rows)
+        batch = BATCH_ROWS if self.codes.dtype == np.float32 else COMPRESSED_BATCH_ROWS
+        best_rows, best_scores = [], []
+        for start in range(0, total, batch):
+            if rows is None:
+                block_rows = np.arange(start, min(start + batch, total))
+                block = self.codes[start:start + batch]
+            else:
+                block_rows = rows[start:start + batch]
+                block = self.codes[block_rows]
+            scores = np.asarray(block, dtype=np.float32) @ query_vector
+            keep = top_k(scores, k)
+            best_rows.append(block_rows[keep])
+            best_scores.append(scores[keep])
+        return np.concatenate(best_rows), np.concatenate(best_scores)
+
+    @property
+    def memory_bytes(self) -> int:
+        arrays = {id(a): a for a in (self.matrix, self.codes, self.scales) if a is not None}
+        resident = sum(int(a.nbytes) for a in arrays.values() if not isinstance(a, np.memmap))
+        return resident + (self.ivf.memory_bytes if self.ivf is not None else 0)
+
+
+def _atomic_save(path: str, matrix: np.ndarray):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def default_nlist(count: int) -> int:
+    """Quy tắc phổ biến: nlist ~ 4 * sqrt(N)."""
+    return max(1, int(4 * np.sqrt(count)))
+
+
+def create_vector_store(backend: str, collection, chunks: ChunkTable,
+                        metadata_index: Optional[MetadataBitmapIndex], cache_dir: str,
+                        vectors: Optional[np.ndarray] = None, nlist: int = 0, nprobe: int = 8,
+                        dtype: str = "float32") -> VectorStore:
+    """Factory theo tên backend ("chroma" | "numpy" | "ivf"). `dtype` chỉ áp dụng cho numpy/ivf."""
+    if backend == "chroma":
+        return ChromaVectorStore(collection, chunks, metadata_index)
+    if backend == "numpy":
+        return NumpyVectorStore.open(cache_dir, collection, chunks, metadata_index, vectors, dtype=dtype)
+    if backend == "ivf":
+        return NumpyVectorStore.open(cache_dir, collection, chunks, metadata_index, vectors,
+                                     nlist=nlist or default_nlist(len(chunks)), nprobe=nprobe, dtype=dtype)
+    raise ValueError(f"Unknown vector backend '{backend}', expected one of {BACKENDS}")
@@ -0,0 +1,100 @@
+"""
+Lenient JSON parser cho output của LLM: thử json.loads trước, lỗi thì sửa các lỗi format hay gặp rồi parse lại.
+
+Sửa được:
+- Code fence ```json ... ``` và chữ thừa trước/sau object.
+- Dấu phẩy thừa trước } / ].
+- Output bị cắt giữa chừng (hết max tokens): đóng string đang mở, bỏ key/value dở dang, đóng ngoặc còn thiếu.
+- Xuống dòng / tab thô bên trong string.
+"""
+
+import json
+import re
+from typing import Any
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+class JSONRepairError(ValueError):
+    """Không thể khôi phục JSON hợp lệ từ text."""
+
+
+def strip_fences(text: str) -> str:
+    return _FENCE.sub("", text.strip()).strip()
+
+
+def _slice_json(text: str) -> str:
+    """Bỏ chữ trước ký tự { / [ đầu tiên (vd: "Đây là kết quả: {...}")."""
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        raise JSONRepairError("No JSON object found")
+    return text[min(starts):]
+
+
+def _close_truncated(text: str) -> str:
+    """
+    Quét 1 lượt theo dõi string/ngoặc: escape ký tự điều khiển trong string,
+    cắt phần dư sau khi object gốc đã đóng, và đóng lại những gì còn mở ở cuối.
+    """
+    out = []
+    stack = []
+    in_string = escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            elif ch == "\t":
+                ch = "\\t"
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                out.append(ch)
+                return "".join(out)  # Object gốc đã đóng -> bỏ phần dư phía sau
+        out.append(ch)
+
+    if not stack:
+        return "".join(out)
+
+    repaired = "".join(out)
+    if escape:
+        repaired = repaired[:-1]
+    if in_string:
+        repaired += '"'
+    # Bỏ phần dở dang cuối cùng: `"key":` thiếu value, `"key"` thiếu dấu :, hoặc dấu phẩy treo
+    repaired = re.sub(r',?\s*"(?:[^"\\]|\\.)*"\s*:\s*$', "", repaired)
+    repaired = re.sub(r',\s*"(?:[^"\\]|\\.)*"\s*$', "", repaired) if stack[-1] == "}" else repaired
+    repaired = re.sub(r"[,:]\s*$", "", repaired)
+    return repaired + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> str:
+    """Trả về chuỗi JSON đã sửa (chưa parse)."""
+    candidate = _slice_json(strip_fences(text))
+    candidate = _close_truncated(candidate)
+    return _TRAILING_COMMA.sub(r"\1", candidate)
+
+
+def loads_lenient(text: str) -> Any:
+    """json.loads với fallback sửa lỗi. Raise JSONRepairError nếu vẫn không parse được."""
+    try:
+        return json.loads(strip_fences(text))
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repair_json(text))
+    except json.JSONDecodeError as e:
+        raise JSONRepairError(f"Could not repair JSON: {e}") from e
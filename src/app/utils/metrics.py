@@ -0,0 +1,117 @@
+"""
+Metrics in-process (thread-safe), xuất ra định dạng Prometheus text ở endpoint /metrics.
+
+    from app.utils.metrics import metrics
+    metrics.inc("singleflight_calls_total", group="retrieve", role="follower")
+    metrics.observe("retrieve_seconds", 0.42, collection="wms_kb")
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+# Bucket (giây) cho histogram latency: từ vài ms (BM25) đến hàng phút (LLM)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Bucket cho histogram kích thước (số item / batch), không phải giây
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Dict[str, object]]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Optional[Sequence[float]] = None, **labels):
+        """Ghi 1 giá trị vào histogram `name`; `buckets` mặc định DEFAULT_BUCKETS (latency giây), cố định theo lần ghi đầu."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                bounds = tuple(buckets or DEFAULT_BUCKETS)
+                hist = series[key] = {"bounds": bounds, "buckets": [0] * len(bounds), "count": 0, "sum": 0.0}
+            hist["count"] += 1
+            hist["sum"] += value
+            for i, bound in enumerate(hist["bounds"]):
+                if value <= bound:
+                    hist["buckets"][i] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Đo thời gian 1 khối code (giây) vào histogram `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Dạng dict (JSON) cho UI: {name: {"label=value,...": value | {count, sum}}}."""
+        def fmt(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key)
+
+        with self._lock:
+            data: Dict[str, Dict[str, object]] = {}
+            for name, series in {**self._counters, **self._gauges}.items():
+                data[name] = {fmt(k): v for k, v in series.items()}
+            for name, series in self._histograms.items():
+                data[name] = {fmt(k): {"count": h["count"], "sum": round(h["sum"], 6)} for k, h in series.items()}
+            return data
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(store.items()):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    for bound, count in zip(hist["bounds"], hist["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', str(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {hist['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+# Registry dùng chung toàn process
+metrics = MetricsRegistry()
@@ -0,0 +1,108 @@
+"""
+Micro-batching: gom các lời gọi model nhỏ đến gần như cùng lúc (vài ms) thành 1 forward pass.
+
+    batcher = MicroBatcher("embed", embedding_fn, max_batch=32, max_wait_ms=5)
+    vector = batcher.submit([query])[0]
+
+Không cần thread nền (giống SingleFlight): caller đầu tiên mở batch làm leader, chờ tối đa `max_wait_ms`
+(hoặc đến khi đủ `max_batch` item) rồi tự chạy `fn(items)` cho cả batch; các caller khác (follower) chỉ
+thêm item vào batch đang mở và chờ kết quả. Trong lúc 1 batch đang chạy, request mới gom vào batch kế tiếp.
+"""
+
+import threading
+import time
+from typing import Any, Callable, List, Optional, Sequence
+
+from app.utils.metrics import SIZE_BUCKETS, metrics
+
+
+class _Batch:
+    __slots__ = ("items", "callers", "done", "results", "error")
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.callers = 0
+        self.done = threading.Event()
+        self.results: Optional[Sequence[Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatcher:
+    """
+    `fn(items) -> results` phải trả về đúng 1 kết quả / item theo thứ tự (list hoặc numpy array).
+    `max_wait_ms <= 0` hoặc `max_batch <= 1` tắt batching: gọi thẳng `fn`.
+    Metrics (label `batcher=name`): microbatch_size, microbatch_latency_seconds, microbatch_run_seconds,
+    microbatch_requests_total, microbatch_items_total, microbatch_batches_total, microbatch_coalesced_total
+    (số caller được gộp vào batch của caller khác).
+    """
+
+    def __init__(self, name: str, fn: Callable[[List[Any]], Sequence[Any]], max_batch: int = 32,
+                 max_wait_ms: float = 5.0):
+        self.name = name
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._cond = threading.Condition()
+        self._open: Optional[_Batch] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1 and self.max_wait > 0
+
+    def submit(self, items: Sequence[Any]) -> Sequence[Any]:
+        """Chạy `fn` trên `items` (gộp với các caller khác), trả về phần kết quả của caller này."""
+        items = list(items)
+        if not items:
+            return []
+        metrics.inc("microbatch_requests_total", batcher=self.name)
+        if not self.enabled:
+            return self._run(items)
+
+        start = time.perf_counter()
+        with self._cond:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            offset = len(batch.items)
+            batch.items.extend(items)
+            batch.callers += 1
+            if len(batch.items) >= self.max_batch:
+                self._open = None  # Đủ batch: đóng lại, báo leader chạy ngay
+                self._cond.notify_all()
+
+        if leader:
+            deadline = start + self.max_wait
+            with self._cond:
+                while self._open is batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._open = None
+                        break
+                    self._cond.wait(remaining)
+            try:
+                batch.results = self._run(batch.items, callers=batch.callers)
+            except BaseException as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        # Latency từ lúc gửi đến lúc nhận kết quả (gồm thời gian chờ gom batch + forward pass)
+        metrics.observe("microbatch_latency_seconds", time.perf_counter() - start, batcher=self.name)
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[offset:offset + len(items)]
+
+    def _run(self, items: List[Any], callers: int = 1) -> Sequence[Any]:
+        start = time.perf_counter()
+        results = self.fn(items)
+        metrics.observe("microbatch_run_seconds", time.perf_counter() - start, batcher=self.name)
+        metrics.observe("microbatch_size", len(items), buckets=SIZE_BUCKETS, batcher=self.name)
+        metrics.inc("microbatch_batches_total", batcher=self.name)
+        metrics.inc("microbatch_items_total", len(items), batcher=self.name)
+        metrics.inc("microbatch_coalesced_total", callers - 1, batcher=self.name)
+        if len(results) != len(items):
+            raise ValueError(f"[{self.name}] fn returned {len(results)} results for {len(items)} items")
+        return results
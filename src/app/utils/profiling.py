@@ -0,0 +1,187 @@
+"""
+Profile từng request (cProfile) để biết request chậm tốn thời gian ở đâu: Chroma, BM25, Cross-Encoder, dựng prompt hay LLM.
+
+    profiler = RequestProfiler("./profiles", sample_every=100)
+    with profiler.maybe_profile("retrieve", requested=flag) as profile_id:
+        ...
+
+- Bật theo request (query `?profile=true` / header `X-Profile: 1`) hoặc lấy mẫu 1/N request (`sample_every`).
+- Mỗi profile lưu `<id>.prof` (pstats, mở bằng snakeviz / `python -m pstats`) + `<id>.json` (metadata).
+- `folded_stacks` chuyển sang định dạng "a;b;c <µs>" của flamegraph.pl / speedscope / inferno.
+
+cProfile chỉ đo thread hiện tại: endpoint `def` chạy trọn trong 1 thread của threadpool nên đủ cho retrieve / generate
+(trừ khi request là follower của single-flight -> profile chỉ thấy thời gian chờ).
+Mỗi process chỉ bật được 1 profiler cùng lúc (Python 3.12+): request tới lượt trong khi đang có profile khác thì bỏ qua.
+"""
+
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+_PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[a-z0-9_-]+-[0-9a-f]{8}$")
+_MIN_STACK_US = 1  # Bỏ stack < 1µs để file folded không phình
+
+
+def _frame_name(func) -> str:
+    filename, line, name = func
+    if filename == "~":  # Built-in (vd: <method 'acquire' of '_thread.lock' objects>)
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def folded_stacks(stats: pstats.Stats) -> List[str]:
+    """
+    pstats -> folded stacks ("root;caller;callee <µs tự thân>").
+    cProfile chỉ giữ cạnh caller -> callee nên thời gian của 1 hàm được chia cho các đường gọi theo tỷ lệ
+    cumulative time của từng cạnh (xấp xỉ, như flameprof / pyprof2calltree).
+    """
+    raw = stats.stats
+    children: Dict[Any, List[Any]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, (_, _, _, _, callers) in raw.items() if not callers]
+
+    totals: Dict[str, float] = {}
+
+    def walk(func, stack: List[str], seen: frozenset, fraction: float):
+        _, _, tt, ct, _ = raw[func]
+        stack = stack + [_frame_name(func)]
+        key = ";".join(stack)
+        totals[key] = totals.get(key, 0.0) + tt * fraction
+        for child, edge_ct in children.get(func, []):
+            child_ct = raw[child][3]
+            if child in seen or child_ct <= 0:
+                continue  # Đệ quy: thời gian đã nằm trong frame ngoài cùng
+            child_fraction = min(1.0, fraction * edge_ct / child_ct)
+            if edge_ct * fraction * 1e6 >= _MIN_STACK_US:
+                walk(child, stack, seen | {child}, child_fraction)
+
+    for root in roots:
+        walk(root, [], frozenset([root]), 1.0)
+    return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in totals.items() if seconds * 1e6 >= _MIN_STACK_US]
+
+
+class RequestProfiler:
+    def __init__(self, directory: str, sample_every: int = 0, keep: int = 200):
+        """`sample_every` = N: profile 1 trong N request (0 = chỉ khi được yêu cầu). Giữ tối đa `keep` profile mới nhất."""
+        self.directory = directory
+        self.sample_every = sample_every
+        self.keep = keep
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _trigger(self, requested: bool) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if requested:
+            return "request"
+        if self.sample_every > 0 and next(self._counter) % self.sample_every == 0:
+            return "sample"
+        return None
+
+    @contextmanager
+    def maybe_profile(self, endpoint: str, requested: bool = False, **info) -> Iterator[Optional[str]]:
+        """Profile khối code nếu được yêu cầu / tới lượt lấy mẫu. Yield id profile (None = không profile)."""
+        trigger = self._trigger(requested)
+        if trigger is None:
+            yield None
+            return
+        if not self._active.acquire(blocking=False):
+            metrics.inc("profiles_skipped_total", endpoint=endpoint, trigger=trigger)
+            logger.warning(f"[Profiling] Another request is being profiled, skipping {endpoint}")
+            yield None
+            return
+
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:8]}"
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError as e:  # Profiler khác (vd: chạy uvicorn dưới cProfile) đang bật
+            self._active.release()
+            logger.warning(f"[Profiling] Cannot profile {endpoint}: {e}")
+            yield None
+            return
+        try:
+            yield profile_id
+        finally:
+            profiler.disable()
+            self._active.release()
+            duration = time.perf_counter() - start
+            try:
+                self._save(profile_id, profiler, {
+                    "id": profile_id, "endpoint": endpoint, "trigger": trigger, "created_at": time.time(),
+                    "duration_s": round(duration, 4), **info,
+                })
+                metrics.inc("profiles_captured_total", endpoint=endpoint, trigger=trigger)
+            except OSError as e:
+                logger.warning(f"[Profiling] Could not save profile {profile_id}: {e}")
+
+    def _save(self, profile_id: str, profiler: cProfile.Profile, meta: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+        with open(os.path.join(self.directory, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, default=str)
+        logger.info(f"[Profiling] Saved {profile_id} ({meta['endpoint']}, {meta['duration_s']}s, {meta['trigger']})")
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            for meta in self.list()[self.keep:]:
+                for ext in (".prof", ".json"):
+                    try:
+                        os.remove(os.path.join(self.directory, meta["id"] + ext))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Metadata các profile, mới nhất trước."""
+        if not os.path.isdir(self.directory):
+            return []
+        items = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                        items.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return sorted(items, key=lambda m: m.get("created_at", 0), reverse=True)
+
+    def path(self, profile_id: str) -> Optional[str]:
+        """Đường dẫn file .prof (None nếu id không hợp lệ / không tồn tại; id được kiểm tra để chặn path traversal)."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.prof")
+        return path if os.path.exists(path) else None
+
+    def folded(self, profile_id: str) -> Optional[str]:
+        path = self.path(profile_id)
+        return "\n".join(folded_stacks(pstats.Stats(path))) + "\n" if path else None
+
+    def summary(self, profile_id: str, limit: int = 40) -> Optional[str]:
+        """Top `limit` hàm theo cumulative time (như `python -m pstats`)."""
+        path = self.path(profile_id)
+        if not path:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,99 @@
+"""
+Single-flight: các lời gọi đồng thời có cùng key chỉ chạy 1 lần, mọi caller nhận chung kết quả.
+
+    flight = SingleFlight("retrieve")
+    result = flight.do(make_key(query, top_k, fusion), lambda: expensive(query))
+
+Chỉ gộp các lời gọi đang *chạy cùng lúc* (không phải cache): gọi xong là key được giải phóng.
+"""
+
+import copy
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, TypeVar
+
+from pydantic import BaseModel
+
+from app.utils.metrics import metrics
+
+T = TypeVar("T")
+
+
+def normalize_text(text: str) -> str:
+    """Gộp khoảng trắng thừa (copy/paste từ UI hay khác nhau ở xuống dòng, space cuối...)."""
+    return " ".join(text.split())
+
+
+def make_key(*parts: Any) -> str:
+    """Key ổn định từ input + tham số (pydantic model được dump, dict được sort key)."""
+    def encode(part):
+        if isinstance(part, BaseModel):
+            return part.model_dump(mode="json")
+        if isinstance(part, str):
+            return normalize_text(part)
+        return part
+
+    canonical = json.dumps([encode(p) for p in parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    `group` dùng làm label cho metrics `singleflight_calls_total{group, role=leader|follower}`.
+    Follower nhận bản deepcopy của kết quả (caller có thể sửa list/dict mà không ảnh hưởng nhau).
+    """
+
+    def __init__(self, group: str):
+        self.group = group
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+
+        if not leader:
+            metrics.inc("singleflight_calls_total", group=self.group, role="follower")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        metrics.inc("singleflight_calls_total", group=self.group, role="leader")
+        try:
+            result = fn()
+        except BaseException as e:
+            self._release(key, call, error=e)
+            raise
+        self._release(key, call, result=result)
+        return result
+
+    def _release(self, key: str, call: _Call, result: Any = None, error: BaseException = None):
+        with self._lock:
+            self._calls.pop(key, None)  # Sau dòng này không còn follower mới
+        if call.followers:
+            # Snapshot trước khi caller của leader kịp sửa kết quả
+            call.result = copy.deepcopy(result)
+            metrics.inc("singleflight_coalesced_total", call.followers, group=self.group)
+        call.error = error
+        call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,69 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class SQLiteKVCache:
+    """
+    Key-Value cache bền vững (SQLite) cho các kết quả tốn kém: text trích từ PDF, điểm đánh giá...
+    Value được lưu dạng JSON. `namespace` nên chứa version để vô hiệu hóa cache khi đổi logic.
+    """
+
+    def __init__(self, db_path: str, namespace: str):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.namespace = namespace
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS kv_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_ts REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM kv_cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        found = {}
+        # SQLite giới hạn số tham số mỗi câu lệnh -> chia lô
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" for _ in batch)
+            with self._connect() as conn:
+                rows = conn.execute(
+                    f"SELECT key, value FROM kv_cache WHERE namespace = ? AND key IN ({placeholders})",
+                    [self.namespace, *batch],
+                ).fetchall()
+            found.update({key: json.loads(value) for key, value in rows})
+        return found
+
+    def set(self, key: str, value: Any):
+        self.set_many({key: value}.items())
+
+    def set_many(self, items: Iterable[tuple]):
+        now = time.time()
+        rows = [(self.namespace, key, json.dumps(value, ensure_ascii=False), now) for key, value in items]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO kv_cache VALUES (?, ?, ?, ?)", rows)
@@ -5,6 +5,9 @@ import pandas as pd
 import altair as alt
 import os
 import re
+import time
+from collections import deque
+from requests.adapters import HTTPAdapter
 from streamlit_mermaid import st_mermaid
 
 # Config
@@ -12,8 +15,215 @@ API_URL = "http://127.0.0.1:8000"
 BENCHMARK_AB_FILE = "benchmark_results.csv"
 BENCHMARK_RETRIEVAL_FILE = "benchmark_retrieval.json"
 
+# HTTP timeouts (seconds)
+HEALTH_TIMEOUT = 2
+REQUEST_TIMEOUT = 60
+EVALUATE_TIMEOUT = 600
+JOB_POLL_WAIT = 20        # Long-poll /jobs/{id}?wait=
+JOB_TIMEOUT = 900
+
+# Performance page
+PERF_REFRESH_SECONDS = 2
+PERF_HISTORY = 150        # Samples kept for the live charts (~5 minutes at 2s)
+STAGE_METRICS = ("retrieval_stage_seconds", "generation_stage_seconds", "evaluator_seconds", "pre_evaluator_seconds",
+                 "model_pool_call_seconds", "microbatch_latency_seconds")
+
 st.set_page_config(page_title="RAG SRS Generator Dashboard", layout="wide", page_icon="📝")
 
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One pooled keep-alive HTTP session per Streamlit server (shared across reruns and browser sessions)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def probe_api() -> bool:
+    """GET /health (no model / DB work on the server). Cached a few seconds so reruns don't hit the API each time."""
+    try:
+        return get_session().get(f"{API_URL}/health", timeout=HEALTH_TIMEOUT).ok
+    except requests.RequestException:
+        return False
+
+
+def file_mtime(path: str):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+# Benchmark artifacts are re-read only when the file changes (mtime is part of the cache key)
+@st.cache_data(show_spinner=False)
+def load_csv(path: str, mtime: float) -> pd.DataFrame:
+    return pd.read_csv(path)
+
+
+@st.cache_data(show_spinner=False)
+def load_json(path: str, mtime: float):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def run_generate_job(payload: dict, status) -> dict:
+    """
+    Submit generation to the API job queue and long-poll it, instead of holding one HTTP request open for the whole
+    LLM call. Identical in-flight jobs are deduplicated by the server.
+    """
+    session = get_session()
+    response = session.post(f"{API_URL}/jobs", json={"kind": "generate", "request": payload}, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    job = response.json()
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while job["status"] in ("queued", "running"):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Job {job['id']} did not finish within {JOB_TIMEOUT}s")
+        status.update(label=f"Job {job['id'][:8]}: {job['status']}...")
+        response = session.get(f"{API_URL}/jobs/{job['id']}", params={"wait": JOB_POLL_WAIT},
+                               timeout=JOB_POLL_WAIT + REQUEST_TIMEOUT)
+        response.raise_for_status()
+        job = response.json()
+    return job
+
+
+def _labels(series_key: str) -> dict:
+    """'group=retrieve,role=leader' (metrics snapshot key) -> dict."""
+    return dict(part.split("=", 1) for part in series_key.split(",") if "=" in part)
+
+
+def _total(snapshot: dict, name: str, **match) -> float:
+    """Sum of a counter (or histogram count) over the series whose labels match."""
+    total = 0.0
+    for key, value in snapshot.get(name, {}).items():
+        labels = _labels(key)
+        if all(labels.get(k) == v for k, v in match.items()):
+            total += value["count"] if isinstance(value, dict) else value
+    return total
+
+
+def stage_latency(snapshot: dict, previous: dict = None) -> pd.DataFrame:
+    """Mean latency (ms) per histogram series: since server start, and over the last refresh interval."""
+    rows = []
+    for name in STAGE_METRICS:
+        for key, hist in snapshot.get(name, {}).items():
+            before = (previous or {}).get(name, {}).get(key, {"count": 0, "sum": 0.0})
+            d_count, d_sum = hist["count"] - before["count"], hist["sum"] - before["sum"]
+            rows.append({
+                "metric": name.replace("_seconds", ""),
+                "series": key or "all",
+                "count": hist["count"],
+                "mean_ms": round(1000 * hist["sum"] / hist["count"], 1) if hist["count"] else None,
+                "interval_mean_ms": round(1000 * d_sum / d_count, 1) if previous is not None and d_count > 0 else None,
+            })
+    return pd.DataFrame(rows)
+
+
+def cache_hit_rates(snapshot: dict) -> pd.DataFrame:
+    """Hit rate of each cache / coalescing layer exposed by the API."""
+    rows = []
+
+    def add(name, hits, lookups):
+        if lookups:
+            rows.append({"cache": name, "hits": int(hits), "lookups": int(lookups), "hit_rate": hits / lookups})
+
+    add("evaluator section cache", _total(snapshot, "evaluator_section_total", cache="hit"),
+        _total(snapshot, "evaluator_section_total"))
+    add("knowledge base registry", _total(snapshot, "kb_registry_lookups_total", result="hit"),
+        _total(snapshot, "kb_registry_lookups_total"))
+    for group in sorted({_labels(k).get("group") for k in snapshot.get("singleflight_calls_total", {})} - {None}):
+        add(f"single-flight: {group}", _total(snapshot, "singleflight_calls_total", group=group, role="follower"),
+            _total(snapshot, "singleflight_calls_total", group=group))
+    for batcher in sorted({_labels(k).get("batcher") for k in snapshot.get("microbatch_requests_total", {})} - {None}):
+        add(f"micro-batch: {batcher}", _total(snapshot, "microbatch_coalesced_total", batcher=batcher),
+            _total(snapshot, "microbatch_requests_total", batcher=batcher))
+    return pd.DataFrame(rows)
+
+
+def render_performance():
+    """Poll /metrics?format=json, keep a short history in session state and chart it."""
+    try:
+        response = get_session().get(f"{API_URL}/metrics", params={"format": "json"}, timeout=HEALTH_TIMEOUT)
+        response.raise_for_status()
+        snapshot = response.json()
+    except requests.RequestException as e:
+        st.error(f"Cannot read metrics: {e}")
+        return
+
+    history = st.session_state.setdefault("perf_history", deque(maxlen=PERF_HISTORY))
+    history.append((time.time(), snapshot))
+    previous = history[-2][1] if len(history) > 1 else None
+
+    # Throughput / latency per refresh interval (counters are cumulative since server start)
+    points = []
+    for (t0, s0), (t1, s1) in zip(list(history)[:-1], list(history)[1:]):
+        d_requests = _total(s1, "http_request_seconds") - _total(s0, "http_request_seconds")
+        d_sum = sum(h["sum"] for h in s1.get("http_request_seconds", {}).values()) \
+            - sum(h["sum"] for h in s0.get("http_request_seconds", {}).values())
+        point = {"time": pd.to_datetime(t1, unit="s"), "requests/s": d_requests / max(t1 - t0, 1e-6),
+                 "http mean ms": 1000 * d_sum / d_requests if d_requests > 0 else None}
+        for stage in ("keyword", "vector", "fusion", "rerank", "expand"):
+            d_count = _total(s1, "retrieval_stage_seconds", stage=stage) - _total(s0, "retrieval_stage_seconds", stage=stage)
+            if d_count > 0:
+                d_stage = s1["retrieval_stage_seconds"][f"stage={stage}"]["sum"] \
+                    - s0.get("retrieval_stage_seconds", {}).get(f"stage={stage}", {"sum": 0.0})["sum"]
+                point[f"{stage} ms"] = 1000 * d_stage / d_count
+        points.append(point)
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Requests (total)", int(_total(snapshot, "http_request_seconds")))
+    c2.metric("Throughput", f"{points[-1]['requests/s']:.2f} req/s" if points else "–")
+    c3.metric("Jobs running", int(_total(snapshot, "job_queue_jobs", status="running")))
+    c4.metric("Jobs queued", int(_total(snapshot, "job_queue_jobs", status="queued")))
+
+    if points:
+        df_points = pd.DataFrame(points).set_index("time")
+        col_a, col_b = st.columns(2)
+        with col_a:
+            st.caption("Throughput (requests/s)")
+            st.line_chart(df_points[["requests/s"]])
+        with col_b:
+            st.caption("Retrieval stage latency per interval (ms)")
+            stage_cols = [c for c in df_points.columns if c.endswith(" ms") and c != "http mean ms"]
+            if stage_cols:
+                st.line_chart(df_points[stage_cols])
+            else:
+                st.info("No retrieval traffic in the current window.")
+
+    st.subheader("Stage latencies")
+    df_stages = stage_latency(snapshot, previous)
+    if df_stages.empty:
+        st.info("No stage timings recorded yet. Send a few /retrieve or /generate-srs requests.")
+    else:
+        chart = alt.Chart(df_stages).mark_bar().encode(
+            x=alt.X("mean_ms", title="Mean latency (ms, since start)"),
+            y=alt.Y("series", sort="-x", title=None),
+            color="metric",
+            tooltip=["metric", "series", "count", "mean_ms", "interval_mean_ms"],
+        )
+        st.altair_chart(chart, use_container_width=True)
+        st.dataframe(df_stages, hide_index=True)
+
+    st.subheader("Cache hit rates")
+    df_cache = cache_hit_rates(snapshot)
+    if df_cache.empty:
+        st.info("No cache lookups recorded yet.")
+    else:
+        chart = alt.Chart(df_cache).mark_bar().encode(
+            x=alt.X("hit_rate", title="Hit rate", axis=alt.Axis(format="%"), scale=alt.Scale(domain=[0, 1])),
+            y=alt.Y("cache", title=None),
+            tooltip=["cache", "hits", "lookups", alt.Tooltip("hit_rate", format=".1%")],
+        )
+        st.altair_chart(chart, use_container_width=True)
+
+    st.subheader("HTTP endpoints")
+    rows = []
+    for key, hist in snapshot.get("http_request_seconds", {}).items():
+        rows.append({**_labels(key), "count": hist["count"],
+                     "mean_ms": round(1000 * hist["sum"] / hist["count"], 1) if hist["count"] else None})
+    if rows:
+        st.dataframe(pd.DataFrame(rows).sort_values("count", ascending=False), hide_index=True)
+
 def render_content_with_mermaid(content):
     """
     Splits markdown content by mermaid blocks and renders them using st_mermaid.
@@ -42,16 +252,10 @@ st.title("🤖 SRS Generator with RAG - Demo & Analytics")
 
 # Sidebar
 st.sidebar.header("Configuration")
-api_status = "Unknown"
-try:
-    # Simple check
-    requests.get(f"{API_URL}/docs")
-    api_status = "Online 🟢"
-except:
-    api_status = "Offline 🔴"
+api_status = "Online 🟢" if probe_api() else "Offline 🔴"
 st.sidebar.write(f"API Status: **{api_status}**")
 
-mode = st.sidebar.radio("Navigation", ["SRS Generator Demo", "Retrieval Debugger", "Analytics & Benchmarks"])
+mode = st.sidebar.radio("Navigation", ["SRS Generator Demo", "Retrieval Debugger", "Analytics & Benchmarks", "Performance"])
 
 if mode == "SRS Generator Demo":
     st.header("📝 SRS Generation Demo")
@@ -68,19 +272,25 @@ if mode == "SRS Generator Demo":
             if api_status == "Offline 🔴":
                 st.error("API is offline. Please start uvicorn backend.")
             else:
-                with st.spinner("Generating SRS... (This may take 30-60s)"):
+                with st.status("Generating SRS... (This may take 30-60s)", expanded=False) as status:
                     try:
                         payload = {"project_description": project_desc, "use_rag": use_rag}
-                        response = requests.post(f"{API_URL}/generate-srs", json=payload)
+                        job = run_generate_job(payload, status)
                         
-                        if response.status_code == 200:
-                            data = response.json()
+                        if job["status"] == "succeeded":
+                            data = job.get("result") or {}
                             # Save to session state
                             st.session_state['last_srs'] = data.get("srs_content")
                             st.session_state['last_context'] = data.get("rag_context")
+                            status.update(label="SRS generated", state="complete")
                         else:
-                            st.error(f"Error: {response.text}")
+                            status.update(label=f"Job {job['status']}", state="error")
+                            st.error(f"Error: {job.get('error')}")
+                    except requests.HTTPError as e:
+                        status.update(label="Request rejected", state="error")
+                        st.error(f"Error: {e.response.text}")
                     except Exception as e:
+                        status.update(label="Connection error", state="error")
                         st.error(f"Connection Error: {e}")
 
         # Persistent Display using Session State
@@ -97,15 +307,24 @@ if mode == "SRS Generator Demo":
     with col2:
         st.write("### AI Evaluation")
         if 'last_srs' in st.session_state:
+            force_eval = st.checkbox("Force AI Judge (skip pre-evaluation gate)", value=False)
             if st.button("Evaluate Last SRS"):
                 with st.spinner("AI Judge is scoring..."):
                     try:
                         payload = {
                             "srs_content": st.session_state['last_srs'], 
-                            "rag_context": st.session_state.get('last_context')
+                            "rag_context": st.session_state.get('last_context'),
+                            "force_evaluation": force_eval,
                         }
-                        eval_resp = requests.post(f"{API_URL}/evaluate-srs", json=payload)
-                        if eval_resp.status_code == 200:
+                        eval_resp = get_session().post(f"{API_URL}/evaluate-srs", json=payload, timeout=EVALUATE_TIMEOUT)
+                        pre = (eval_resp.json().get("pre_evaluation") or {}) if eval_resp.status_code == 200 else {}
+                        if pre:
+                            st.caption(f"Pre-score (heuristic): {pre.get('pre_score')}/10 in {pre.get('elapsed_ms')} ms")
+                        if eval_resp.status_code == 200 and eval_resp.json().get("evaluation_result") is None:
+                            st.warning("Pre-score below gate threshold, AI Judge skipped. "
+                                       f"Missing sections: {pre.get('checks', {}).get('missing_sections')}")
+                            st.json(pre.get("checks", {}))
+                        elif eval_resp.status_code == 200:
                             res = eval_resp.json().get("evaluation_result", {})
                             score = res.get("score", {})
                             
@@ -139,6 +358,10 @@ elif mode == "Retrieval Debugger":
     st.header("🔍 Retrieval Debugger")
     query = st.text_input("Enter Query to search Knowledge Base:", value="quy tắc nhập kho")
     top_k = st.slider("Top K", 1, 10, 5)
+    with st.expander("⚖️ Hybrid Fusion Settings"):
+        fusion_method = st.selectbox("Fusion Method", ["rrf", "score", "convex"])
+        vector_weight = st.slider("Vector Weight", 0.0, 2.0, 1.0, 0.1)
+        keyword_weight = st.slider("Keyword (BM25) Weight", 0.0, 2.0, 1.0, 0.1)
     
     if st.button("Search"):
         if api_status == "Offline 🔴":
@@ -148,7 +371,10 @@ elif mode == "Retrieval Debugger":
                 try:
                     # Call the new /retrieve endpoint
                     # Note: We use query params for simplicity as defined in main.py
-                    response = requests.post(f"{API_URL}/retrieve", params={"query": query, "top_k": top_k})
+                    response = get_session().post(f"{API_URL}/retrieve", params={
+                        "query": query, "top_k": top_k, "fusion_method": fusion_method,
+                        "vector_weight": vector_weight, "keyword_weight": keyword_weight,
+                    }, timeout=REQUEST_TIMEOUT)
                     
                     if response.status_code == 200:
                         results = response.json().get("results", [])
@@ -177,13 +403,13 @@ elif mode == "Analytics & Benchmarks":
     with tab_ab:
         st.subheader("A/B Testing Results")
         if os.path.exists(BENCHMARK_AB_FILE):
-            df = pd.read_csv(BENCHMARK_AB_FILE)
+            df = load_csv(BENCHMARK_AB_FILE, file_mtime(BENCHMARK_AB_FILE))
             st.dataframe(df)
             
             # Compare Scores
             chart = alt.Chart(df).mark_bar().encode(
                 x=alt.X('Mode', axis=None),
-                y='Total Score',
+                y=alt.Y('Total Score', aggregate='mean'),  # Nhiều lần lặp (--repeats) -> trung bình
                 color='Mode',
                 column='Case ID'
             ).properties(title="Total Score Comparison")
@@ -193,7 +419,7 @@ elif mode == "Analytics & Benchmarks":
             # Compare Quality
             chart_q = alt.Chart(df).mark_bar().encode(
                 x=alt.X('Mode', axis=None),
-                y='Quality Score (Shared)',
+                y=alt.Y('Quality Score (Shared)', aggregate='mean'),
                 color='Mode',
                 column='Case ID'
             ).properties(title="Quality Score (Content Only)")
@@ -205,8 +431,7 @@ elif mode == "Analytics & Benchmarks":
     with tab_ret:
         st.subheader("Retrieval Performance (Hit Rate & MRR)")
         if os.path.exists(BENCHMARK_RETRIEVAL_FILE):
-            with open(BENCHMARK_RETRIEVAL_FILE, "r") as f:
-                ret_data = json.load(f)
+            ret_data = load_json(BENCHMARK_RETRIEVAL_FILE, file_mtime(BENCHMARK_RETRIEVAL_FILE))
             
             c1, c2, c3 = st.columns(3)
             c1.metric("Hit Rate", f"{ret_data['hit_rate']:.2%}")
@@ -216,3 +441,14 @@ elif mode == "Analytics & Benchmarks":
             st.json(ret_data)
         else:
             st.warning(f"No retrieval data found at {BENCHMARK_RETRIEVAL_FILE}. Run `benchmark_retrieval.py` first.")
+
+elif mode == "Performance":
+    st.header("⚡ Performance")
+    st.caption("Live view of the API's in-process metrics (`/metrics?format=json`): stage latencies, "
+               "cache hit rates and throughput.")
+    if api_status == "Offline 🔴":
+        st.error("API is offline. Please start uvicorn backend.")
+    else:
+        live = st.toggle("Auto refresh", value=True)
+        # Only the fragment reruns on each tick, not the whole page
+        st.fragment(run_every=PERF_REFRESH_SECONDS if live else None)(render_performance)()
@@ -0,0 +1,37 @@
+from app.services.chunk_table import ChunkTable
+
+IDS = ["wms-001", "wms-002", "gsp-001"]
+DOCUMENTS = ["Quy tắc đặt mã SKU", "Quy trình nhập kho FIFO", ""]
+METADATAS = [{"source": "DATA_Master_Data_Rules.md", "chunk_index": 0}, None, {"source": "GSP.md"}]
+
+
+def test_columns_behave_like_lists(tmp_path):
+    table = ChunkTable.build_or_open(str(tmp_path), "kb", IDS, DOCUMENTS, METADATAS)
+    assert len(table) == 3
+    assert list(table.ids) == IDS
+    assert list(table.texts) == DOCUMENTS
+    assert table.metadatas[0] == METADATAS[0]
+    assert table.metadatas[1] == {}
+    assert table.texts[-2:] == DOCUMENTS[-2:]
+
+
+def test_row_lookup_and_rebuild_on_change(tmp_path):
+    table = ChunkTable.build_or_open(str(tmp_path), "kb", IDS, DOCUMENTS, METADATAS)
+    assert table.row_of("gsp-001") == 2
+    assert table.row_of("missing") is None
+
+    # Cùng nội dung -> mở lại file cũ; nội dung đổi -> file mới, file cũ bị dọn
+    assert ChunkTable.build_or_open(str(tmp_path), "kb", IDS, DOCUMENTS, METADATAS).path == table.path
+    changed = ChunkTable.build_or_open(str(tmp_path), "kb", IDS, ["x", "y", "z"], METADATAS)
+    assert changed.path != table.path
+    assert [p.name for p in tmp_path.iterdir()] == [changed.path.rsplit("/", 1)[-1]]
+
+
+def test_metadata_change_rebuilds_table(tmp_path):
+    table = ChunkTable.build_or_open(str(tmp_path), "kb", IDS, DOCUMENTS, METADATAS)
+    collapsed = [dict(METADATAS[0], duplicate_sources="GSP.md"), None, METADATAS[2]]
+    changed = ChunkTable.build_or_open(str(tmp_path), "kb", IDS, DOCUMENTS, collapsed)
+    assert changed.path != table.path
+    assert changed.metadatas[0]["duplicate_sources"] == "GSP.md"
+    # Cache vector khóa theo digest nội dung -> không phải embed lại khi chỉ đổi metadata
+    assert changed.digest == table.digest
@@ -0,0 +1,34 @@
+from app.services.chunking import chunk_flat, chunk_hierarchical
+
+SAMPLE_MD = (
+    "# WMS\n\nTổng quan hệ thống quản lý kho.\n\n"
+    "## Nhập kho\n\n" + "Quy tắc nhập kho FIFO áp dụng cho mọi SKU. " * 30 + "\n\n"
+    "## Xuất kho\n\nXuất kho theo FEFO."
+)
+
+
+def test_children_map_back_to_parent_offsets():
+    parents, children = chunk_hierarchical(SAMPLE_MD, {"filename": "a.md", "path": "kb/a.md"}, child_size=200, child_overlap=30)
+    assert len(parents) == 3
+    assert len(children) > len(parents)
+
+    by_id = {p["parent_id"]: p for p in parents}
+    for content, metadata in children:
+        parent = by_id[metadata["parent_id"]]
+        assert parent["content"][metadata["parent_start"]:metadata["parent_end"]] == content
+        assert len(content) <= 200
+
+
+def test_hierarchical_ids_are_stable():
+    first = chunk_hierarchical(SAMPLE_MD, {"filename": "a.md", "path": "kb/a.md"})
+    second = chunk_hierarchical(SAMPLE_MD, {"filename": "a.md", "path": "kb/a.md"})
+    assert [m["doc_id"] for _, m in first[1]] == [m["doc_id"] for _, m in second[1]]
+
+
+def test_flat_chunk_ids_are_deterministic():
+    # generate_testset.py dựa vào điều này để ground truth chunk id khớp với id trong index
+    first = chunk_flat(SAMPLE_MD, {"filename": "a.md", "path": "kb/a.md"}, chunk_size=300, chunk_overlap=30)
+    second = chunk_flat(SAMPLE_MD, {"filename": "a.md", "path": "kb/a.md"}, chunk_size=300, chunk_overlap=30)
+    assert len(first) > 3
+    assert [m["doc_id"] for _, m in first] == [m["doc_id"] for _, m in second]
+    assert len({m["doc_id"] for _, m in first}) == len(first)
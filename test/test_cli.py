@@ -0,0 +1,84 @@
+import os
+import threading
+
+import pytest
+
+from app.cli import DaemonError, Workspace, build_parser, cmd_index, connect_daemon, serve_daemon
+
+
+class FakeWorkspace:
+    def __init__(self):
+        self.calls = []
+
+    def query(self, query, **kwargs):
+        self.calls.append(query)
+        return [{"id": "a-0", "content": query, "metadata": {"source": "a.md"}, "rerank_score": 0.9}]
+
+    def index(self, **kwargs):
+        self.calls.append(kwargs)
+        return {"collection": kwargs["collection"] or "kb", "chunks": 0, "seconds": 0.0}
+
+    def stats(self):
+        return {"calls": len(self.calls)}
+
+
+def test_daemon_round_trip_and_shutdown(tmp_path):
+    address = str(tmp_path / "srs-rag.sock")
+    workspace, ready = FakeWorkspace(), threading.Event()
+    server = threading.Thread(target=serve_daemon, args=(workspace, address, ready), daemon=True)
+    server.start()
+    ready.wait(5)
+
+    client = connect_daemon(address)
+    assert client.query(query="nhập kho", top_k=3)[0]["content"] == "nhập kho"
+    assert connect_daemon(address).stats() == {"calls": 1}  # Kết nối khác dùng chung workspace (model warm)
+    with pytest.raises(DaemonError, match="TypeError"):
+        client.query(unknown_arg=1)
+    assert oct(os.stat(address + ".key").st_mode & 0o777) == "0o600"
+
+    client.call("shutdown")
+    server.join(5)
+    assert not server.is_alive()
+    assert not os.path.exists(address) and connect_daemon(address) is None
+
+
+def test_parser_subcommands():
+    parser = build_parser()
+    args = parser.parse_args(["--db-path", "/tmp/db", "query", "quy tắc", "--top-k", "3", "--fusion", "convex"])
+    assert (args.command, args.query, args.top_k, args.fusion, args.db_path) == ("query", "quy tắc", 3, "convex", "/tmp/db")
+    assert parser.parse_args(["index", "kb", "--no-dedup"]).dedup is False
+    assert parser.parse_args(["daemon", "start", "--warm", "wms", "hr"]).warm == ["wms", "hr"]
+
+
+def test_index_sends_absolute_paths_and_rejects_missing_folder(tmp_path, monkeypatch):
+    workspace = FakeWorkspace()
+    monkeypatch.setattr("app.cli._backend", lambda args: workspace)
+    monkeypatch.chdir(tmp_path)
+    cmd_index(build_parser().parse_args(["index", "kb", "--files", "kb/a.md"]))
+    assert workspace.calls[0]["folder"] == str(tmp_path / "kb")
+    assert workspace.calls[0]["files"] == [str(tmp_path / "kb" / "a.md")]
+
+    # Daemon (cwd khác) nhận đường dẫn không tồn tại -> lỗi thay vì index 0 file
+    with pytest.raises(FileNotFoundError, match="folder not found"):
+        Workspace.__new__(Workspace).index(str(tmp_path / "missing"))
+
+
+def test_relative_and_absolute_folder_index_to_same_ids(tmp_path, monkeypatch):
+    pytest.importorskip("chromadb")
+    from test_kb_watcher import HashEmbedding
+    from app.services.chunking import stable_id
+    from app.services.rag_indexer import RAGIndexer
+
+    (tmp_path / "kb" / "rules").mkdir(parents=True)
+    (tmp_path / "kb" / "rules" / "inbound.md").write_text("# Nhập kho\n\nQuy tắc nhập kho FIFO", encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    indexer = RAGIndexer(persist_path=str(tmp_path / "db"), collection_name="cli_kb", embedding_function=HashEmbedding())
+    # Chunk của index cũ: ID khóa theo đường dẫn file -> lần index sau phải thay thế, không nhân bản
+    indexer.collection.upsert(ids=[stable_id("./kb/rules/inbound.md", "chunk", "0")], documents=["Quy tắc nhập kho"],
+                              metadatas=[{"source": "rules/inbound.md"}])
+
+    indexer.build_index("./kb")
+    relative = sorted(indexer.collection.get(include=[])["ids"])
+    indexer.build_index(str(tmp_path / "kb"))
+    assert sorted(indexer.collection.get(include=[])["ids"]) == relative
+    assert len(relative) == 1 and relative[0] == stable_id("rules/inbound.md", "chunk", "0")
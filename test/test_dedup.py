@@ -0,0 +1,80 @@
+import pytest
+
+from app.services.dedup import DuplicateStore, MinHasher, jaccard_estimate
+from app.services.section_eval import context_blocks
+
+GLOSSARY = (
+    "SKU là mã định danh duy nhất của hàng hóa trong kho. Putaway là quá trình đưa hàng từ khu vực nhận "
+    "lên vị trí lưu trữ. FIFO nghĩa là hàng nhập trước xuất trước, áp dụng cho mọi lô hàng có hạn sử dụng. "
+    "Cycle count là kiểm kê luân phiên theo khu vực, không dừng hoạt động kho."
+)
+
+
+def test_minhash_separates_near_duplicates_from_distinct_text():
+    hasher = MinHasher()
+    base = hasher.signature(GLOSSARY)
+    near = hasher.signature(GLOSSARY.replace("duy nhất", "duy nhất,") + " Xem thêm phụ lục A.")
+    other = hasher.signature("Quy trình xuất kho gồm pick, pack và ship; đơn hàng ưu tiên được xử lý trước 10h sáng.")
+    assert jaccard_estimate(base, near) >= 0.8
+    assert jaccard_estimate(base, other) < 0.2
+
+
+def test_store_collapses_and_promotes_on_removal(tmp_path):
+    store = DuplicateStore(str(tmp_path), "kb", threshold=0.8)
+    sig = store.hasher.signature(GLOSSARY)
+    store.add_canonical("a-0", "a.md", sig)
+    assert store.find_canonical("a-0", sig) is None  # Re-index chính nó không bị coi là bản sao
+
+    assert store.find_canonical("b-0", sig) == "a-0"
+    store.add_duplicate("b-0", "a-0", GLOSSARY, {"doc_id": "b-0", "path": "kb/b.md", "source": "b.md"})
+    store.add_duplicate("c-0", "a-0", GLOSSARY, {"doc_id": "c-0", "path": "kb/c.md", "source": "c.md"})
+    assert store.duplicate_sources(["a-0"]) == {"a-0": ["b.md", "c.md"]}
+
+    # LSH được dựng lại từ SQLite (indexer khởi động lại)
+    assert DuplicateStore(str(tmp_path), "kb", threshold=0.8).find_canonical("d-0", sig) == "a-0"
+
+    touched, orphans = store.remove_source("b.md")
+    assert touched == ["a-0"] and orphans == {}
+    touched, orphans = store.remove_source("a.md")
+    assert touched == [] and [cid for cid, _, _ in orphans["a-0"]] == ["c-0"]
+    assert store.find_canonical("d-0", sig) is None and store.count() == 0
+
+
+def test_context_blocks_register_also_in_sources():
+    context = "[DOCUMENT 1]\n- Source: a.md\n- Also in: b.md, c.md\n- Content:\nGlossary"
+    assert set(context_blocks(context)) == {"a.md", "b.md", "c.md"}
+
+
+class _NoReranker:
+    def predict(self, pairs):
+        return [0.0 for _ in pairs]
+
+
+def test_collapsed_duplicate_sources_reach_retrieval(tmp_path):
+    pytest.importorskip("chromadb")
+    pytest.importorskip("torch")
+    pytest.importorskip("sentence_transformers")
+    from test_kb_watcher import HashEmbedding
+    from app.services.rag_indexer import RAGIndexer
+    from app.services.rag_retriever import RAGRetriever
+
+    kb, db = tmp_path / "kb", str(tmp_path / "db")
+    kb.mkdir()
+    (kb / "glossary.md").write_text(GLOSSARY, encoding="utf-8")
+    (kb / "outbound.md").write_text("Quy trình xuất kho gồm pick, pack và ship theo từng đơn hàng.", encoding="utf-8")
+    indexer = RAGIndexer(persist_path=db, collection_name="dedup_kb", embedding_function=HashEmbedding(), dedup=True)
+    indexer.build_index(str(kb))
+
+    def retrieve():
+        retriever = RAGRetriever(persist_path=db, collection_name="dedup_kb", client=indexer.client,
+                                 embedding_fn=HashEmbedding(), reranker=_NoReranker(), vector_backend="numpy")
+        results = retriever.retrieve("Putaway là quá trình đưa hàng", top_k=2, rerank=False)
+        return next(r for r in results if r["metadata"]["source"] == "glossary.md")
+
+    assert not retrieve()["metadata"].get("duplicate_sources")
+
+    # Bản sao y hệt ở file khác: nội dung collection không đổi, chỉ metadata của canonical đổi
+    (kb / "glossary_copy.md").write_text(GLOSSARY, encoding="utf-8")
+    indexer.build_index(str(kb))
+    assert indexer.duplicates_collapsed == 1
+    assert retrieve()["metadata"]["duplicate_sources"] == "glossary_copy.md"
@@ -0,0 +1,55 @@
+from app.models import FusionConfig
+from app.services.fusion import fuse, normalize_scores, keyword_is_sufficient, exact_codes
+
+
+def _docs(prefix_scores, search_type):
+    return [
+        {"id": doc_id, "content": f"content {doc_id}", "metadata": {}, "initial_score": score, "search_type": search_type}
+        for doc_id, score in prefix_scores
+    ]
+
+
+VECTOR = _docs([("a", 0.9), ("b", 0.8), ("c", 0.1)], "vector")
+KEYWORD = _docs([("c", 12.0), ("d", 3.0), ("a", 1.0)], "keyword")
+
+
+def test_rrf_uses_configured_constant_and_weights():
+    fused = fuse(VECTOR, KEYWORD, FusionConfig(rrf_k=10))
+    scores = {d["id"]: d["fusion_score"] for d in fused}
+    assert abs(scores["a"] - (1 / 11 + 1 / 13)) < 1e-9
+
+    keyword_heavy = fuse(VECTOR, KEYWORD, FusionConfig(vector_weight=0.1, keyword_weight=1.0))
+    assert keyword_heavy[0]["id"] == "c"
+
+
+def test_fusion_keeps_per_modality_scores():
+    fused = fuse(VECTOR, KEYWORD, FusionConfig(method="score"))
+    by_id = {d["id"]: d for d in fused}
+    assert by_id["a"]["scores"] == {"vector": 0.9, "keyword": 1.0}
+    assert by_id["a"]["search_type"] == "hybrid"
+    assert by_id["d"]["search_type"] == "keyword"
+
+
+def test_convex_combination_respects_alpha():
+    only_vector = fuse(VECTOR, KEYWORD, FusionConfig(method="convex", vector_weight=1.0, keyword_weight=0.0))
+    assert [d["id"] for d in only_vector] == ["a", "b", "c"]
+
+    fused = fuse(VECTOR, KEYWORD, FusionConfig(method="convex", normalization="zscore"))
+    assert fused[0]["fusion_score"] >= fused[-1]["fusion_score"]
+
+
+def test_normalize_scores():
+    assert normalize_scores([2.0, 4.0, 6.0]) == [0.0, 0.5, 1.0]
+    assert normalize_scores([5.0, 5.0]) == [1.0, 1.0]
+    z = normalize_scores([1.0, 2.0, 3.0], "zscore")
+    assert abs(sum(z)) < 1e-9
+
+
+def test_keyword_short_circuit_on_exact_code():
+    assert exact_codes("Tra cứu SKU-00123 trong kho") == ["SKU-00123"]
+    hits = _docs([("x", 9.0), ("y", 2.0)], "keyword")
+    hits[0]["content"] = "Sản phẩm sku-00123 thuộc nhóm hàng lạnh"
+    config = FusionConfig()
+    assert keyword_is_sufficient("Tra cứu SKU-00123", hits, config)
+    assert not keyword_is_sufficient("quy trình nhập kho", hits, config)
+    assert not keyword_is_sufficient("Tra cứu SKU-00123", hits, FusionConfig(short_circuit=False))
@@ -0,0 +1,52 @@
+import threading
+
+from app.services.job_queue import JobQueue
+
+
+def _queue(tmp_path, handlers, **kwargs):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), handlers, **kwargs)
+
+
+def test_dedup_priority_and_result(tmp_path):
+    gate, order = threading.Event(), []
+
+    def handler(payload):
+        gate.wait(5)
+        order.append(payload["name"])
+        return {"echo": payload["name"]}
+
+    queue = _queue(tmp_path, {"echo": handler}, max_workers=1)
+    low = queue.submit("echo", {"name": "low"}, priority=0)
+    high = queue.submit("echo", {"name": "high"}, priority=5)
+    duplicate = queue.submit("echo", {"name": "low"}, priority=9)
+    assert duplicate["id"] == low["id"] and duplicate["deduplicated"]
+
+    queue.start()
+    gate.set()
+    assert queue.wait(low["id"], timeout=5)["result"] == {"echo": "low"}
+    assert queue.wait(high["id"], timeout=5)["status"] == "succeeded"
+    queue.stop()
+    assert order == ["high", "low"]
+
+    # Job đã xong thì submit lại tạo job mới
+    assert queue.submit("echo", {"name": "low"})["id"] != low["id"]
+
+
+def test_failures_cancel_and_recovery(tmp_path):
+    def boom(payload):
+        raise RuntimeError("LLM quota exceeded")
+
+    queue = _queue(tmp_path, {"boom": boom, "noop": lambda payload: {}}, max_workers=1)
+    failing = queue.submit("boom", {})
+    cancelled = queue.submit("noop", {"n": 1})
+    pending = queue.submit("noop", {"n": 2})
+    assert queue.cancel(cancelled["id"])
+
+    # Server restart: job còn queued được nạp lại từ SQLite
+    restarted = _queue(tmp_path, {"boom": boom, "noop": lambda payload: {"ok": True}}, max_workers=1)
+    restarted.start()
+    assert restarted.wait(failing["id"], timeout=5)["error"] == "LLM quota exceeded"
+    assert restarted.wait(pending["id"], timeout=5)["result"] == {"ok": True}
+    assert restarted.get(cancelled["id"])["status"] == "cancelled"
+    restarted.stop()
+    assert restarted.stats()["jobs"] == {"cancelled": 1, "failed": 1, "succeeded": 1}
@@ -0,0 +1,26 @@
+import pytest
+
+from app.utils.json_repair import JSONRepairError, loads_lenient, repair_json
+
+
+def test_fences_prose_and_trailing_commas():
+    text = 'Kết quả đánh giá:\n```json\n{"a": [1, 2,], "b": {"c": "x",},}\n```\nHết.'
+    assert loads_lenient(text) == {"a": [1, 2], "b": {"c": "x"}}
+
+
+def test_truncated_output_is_closed():
+    # Output bị cắt giữa string / giữa key khi hết max tokens
+    assert loads_lenient('{"summary": "Tốt", "issues": [{"problem": "thiếu mục') == {
+        "summary": "Tốt", "issues": [{"problem": "thiếu mục"}]
+    }
+    assert loads_lenient('{"a": 1, "b": {"c": 2}, "d":') == {"a": 1, "b": {"c": 2}}
+    assert loads_lenient('{"a": 1, "tail') == {"a": 1}
+
+
+def test_raw_newlines_in_strings_and_trailing_text():
+    assert repair_json('{"q": "dòng 1\ndòng 2"} {"ignored": true}') == '{"q": "dòng 1\\ndòng 2"}'
+
+
+def test_unrepairable():
+    with pytest.raises(JSONRepairError):
+        loads_lenient("Xin lỗi, tôi không thể đánh giá.")
@@ -0,0 +1,76 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+
+from app.services.keyword_index import tokenize, update_bm25
+
+CORPUS = [
+    "Quy tắc nhập kho FIFO cho hàng có hạn sử dụng",
+    "Putaway đưa hàng từ khu nhận lên vị trí lưu trữ",
+    "Cycle count kiểm kê luân phiên theo khu vực",
+    "Mã SKU là định danh duy nhất của hàng hóa",
+]
+
+
+def test_update_bm25_matches_full_rebuild():
+    bm25 = BM25Okapi([tokenize(doc) for doc in CORPUS])
+    added = ["Quy tắc xuất kho FEFO ưu tiên lô hết hạn trước", "Kiểm kê cuối năm dừng hoạt động kho"]
+    updated = update_bm25(bm25, [0, 2, 3], [tokenize(doc) for doc in added])
+
+    expected = BM25Okapi([tokenize(doc) for doc in [CORPUS[0], CORPUS[2], CORPUS[3], *added]])
+    for query in ["quy tắc kho", "kiểm kê", "putaway", "sku hàng hóa"]:
+        assert np.allclose(updated.get_scores(tokenize(query)), expected.get_scores(tokenize(query)))
+    assert len(bm25.doc_freqs) == len(CORPUS)  # BM25 cũ không bị sửa
+    assert update_bm25(updated, [], []) is None
+
+
+class HashEmbedding:
+    """Embedding giả (hash từ -> vector) để test indexer mà không cần tải model."""
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = np.zeros(16, dtype=np.float32)
+            for word in tokenize(text):
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 16] += 1
+            vectors.append(vector + 1e-3)
+        return vectors
+
+    @staticmethod
+    def name():
+        return "hash-embedding"
+
+
+def test_watcher_keeps_collection_settings_and_matches_by_source(tmp_path):
+    pytest.importorskip("chromadb")
+    from app.services.kb_watcher import KnowledgeBaseWatcher
+    from app.services.rag_indexer import RAGIndexer
+
+    kb = tmp_path / "kb"
+    (kb / "rules").mkdir(parents=True)
+    (kb / "rules" / "inbound.md").write_text("# Nhập kho\n\n" + CORPUS[0], encoding="utf-8")
+    db = str(tmp_path / "db")
+    RAGIndexer(persist_path=db, collection_name="watch_kb", hierarchical=True,
+               embedding_function=HashEmbedding()).build_index(str(kb))
+
+    # Watcher dựng indexer không truyền hierarchical, thư mục KB viết khác lúc index
+    indexer = RAGIndexer(persist_path=db, collection_name="watch_kb", embedding_function=HashEmbedding())
+    assert indexer.hierarchical
+    changes = []
+    watcher = KnowledgeBaseWatcher(indexer, os.path.relpath(kb), on_change=lambda *c: changes.append(c))
+    watcher._snapshot = watcher.scan()
+
+    (kb / "rules" / "inbound.md").write_text("# Nhập kho\n\n" + CORPUS[1], encoding="utf-8")
+    watcher.apply(watcher.scan())
+    stored = indexer.collection.get(include=["documents", "metadatas"])
+    assert [m["source"] for m in stored["metadatas"]] == ["rules/inbound.md"]
+    assert "Putaway" in stored["documents"][0] and stored["metadatas"][0].get("parent_id")
+    assert changes[-1][0] == stored["ids"]
+
+    os.remove(kb / "rules" / "inbound.md")
+    watcher.apply(watcher.scan())
+    assert indexer.collection.count() == 0 and indexer.parent_store.count() == 0
+    assert changes[-1] == ([], stored["ids"])
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from app.models import RetrievalFilter
+from app.services.metadata_filter import MetadataBitmapIndex, to_chroma_where
+
+METADATAS = [
+    {"source": "DATA_Master_Data_Rules.md", "section": "SKU", "category": "rule", "created_ts": 1_700_000_000.0},
+    {"source": "PROC_Inbound.md", "section": "Receipt", "category": "process", "created_ts": 1_710_000_000.0},
+    {"source": "PROC_Inbound.md", "section": "Putaway", "category": "process", "created_at": "2024-06-01T00:00:00"},
+    {"source": "NFR_Security.md", "section": "General", "category": "nfr"},
+]
+
+
+def test_chroma_where_clause():
+    assert to_chroma_where(None) is None
+    assert to_chroma_where(RetrievalFilter()) is None
+    assert to_chroma_where(RetrievalFilter(source=["a.md"])) == {"source": "a.md"}
+
+    after = datetime(2024, 1, 1)
+    where = to_chroma_where(RetrievalFilter(category=["rule", "process"], created_after=after))
+    assert where == {"$and": [
+        {"category": {"$in": ["rule", "process"]}},
+        {"created_ts": {"$gte": after.timestamp()}},
+    ]}
+    assert to_chroma_where(RetrievalFilter(category=["rule"], created_after=after), dates=False) == {"category": "rule"}
+    assert to_chroma_where(RetrievalFilter(created_after=after), dates=False) is None
+
+
+def test_bitmap_candidates():
+    index = MetadataBitmapIndex(METADATAS)
+    assert index.candidate_ids(None) is None
+    assert index.candidate_ids(RetrievalFilter(source=["PROC_Inbound.md"])).tolist() == [1, 2]
+    assert index.candidate_ids(RetrievalFilter(source=["PROC_Inbound.md"], section=["Putaway"])).tolist() == [2]
+    assert index.candidate_ids(RetrievalFilter(category=["unknown"])).tolist() == []
+
+    recent = RetrievalFilter(created_after=datetime.fromtimestamp(1_705_000_000))
+    assert index.candidate_ids(recent).tolist() == [1, 2]
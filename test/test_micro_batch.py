@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.metrics import metrics
+from app.utils.micro_batch import MicroBatcher
+
+
+def _run_concurrently(batcher, inputs):
+    barrier = threading.Barrier(len(inputs))
+    results = [None] * len(inputs)
+
+    def caller(i):
+        barrier.wait()
+        results[i] = list(batcher.submit(inputs[i]))
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(len(inputs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_calls_share_forward_pass():
+    calls = []
+
+    def square(items):
+        calls.append(len(items))
+        return [x * x for x in items]
+
+    batcher = MicroBatcher("test_share", square, max_batch=100, max_wait_ms=200)
+    inputs = [[i, i + 100] for i in range(6)]
+    results = _run_concurrently(batcher, inputs)
+
+    assert results == [[x * x for x in items] for items in inputs]
+    assert calls == [12]
+    assert metrics.counter_value("microbatch_coalesced_total", batcher="test_share") == 5
+    # Histogram kích thước dùng bucket số item (12 -> le="16"), không dùng bucket giây
+    exported = metrics.render_prometheus()
+    assert 'microbatch_size_bucket{batcher="test_share",le="8"} 0' in exported
+    assert 'microbatch_size_bucket{batcher="test_share",le="16"} 1' in exported
+
+
+def test_full_batch_flushes_without_waiting():
+    calls = []
+    batcher = MicroBatcher("test_full", lambda items: calls.append(len(items)) or items, max_batch=4, max_wait_ms=5000)
+    start = time.perf_counter()
+    results = _run_concurrently(batcher, [[i] for i in range(4)])
+    assert time.perf_counter() - start < 2
+    assert sorted(r[0] for r in results) == [0, 1, 2, 3]
+    assert sum(calls) == 4
+
+
+def test_errors_reach_every_caller_and_disabled_passthrough():
+    def failing(items):
+        raise RuntimeError("CUDA OOM")
+
+    batcher = MicroBatcher("test_error", failing, max_batch=8, max_wait_ms=100)
+    errors = []
+
+    def caller():
+        try:
+            batcher.submit(["q"])
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == ["CUDA OOM"] * 3
+
+    direct = MicroBatcher("test_off", lambda items: [len(x) for x in items], max_wait_ms=0)
+    assert not direct.enabled
+    assert list(direct.submit(["ab", "c"])) == [2, 1]
+    with pytest.raises(ValueError):
+        MicroBatcher("test_bad", lambda items: items[:1], max_wait_ms=0).submit(["a", "b"])
@@ -0,0 +1,78 @@
+import os
+import signal
+import time
+
+import numpy as np
+import pytest
+
+from app.services.model_pool import ModelWorkerError, ModelWorkerPool, core_slices
+
+
+class _FakeReranker:
+    def predict(self, pairs):
+        return [len(passage) for _, passage in pairs]
+
+
+def _fake_embed(texts):
+    return [[float(len(t)), float(os.getpid())] for t in texts]
+
+
+def fake_loader():
+    return _fake_embed, _FakeReranker()
+
+
+def test_core_slices_partition_cores():
+    assert core_slices(2, [0, 1, 2, 3]) == [[0, 1], [2, 3]]
+    assert core_slices(3, [0, 1]) == [[0], [1], [0]]
+
+
+def test_workers_serve_embed_and_rerank_out_of_process():
+    pool = ModelWorkerPool(workers=2, cores=[0], loader=fake_loader).start()
+    try:
+        vectors = pool.embed(["abc", "de"])
+        assert vectors.dtype == np.float32
+        assert vectors[:, 0].tolist() == [3.0, 2.0]
+        assert int(vectors[0, 1]) != os.getpid()
+        assert pool.predict([("q", "xxxx"), ("q", "y")]).tolist() == [4.0, 1.0]
+    finally:
+        pool.close()
+
+
+def failing_restart_loader():
+    if os.environ.get("MODEL_POOL_TEST_FAIL_LOAD"):
+        raise RuntimeError("model files missing")
+    return fake_loader()
+
+
+def _wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_dead_worker_restarts_in_background():
+    pool = ModelWorkerPool(workers=1, cores=[0], loader=fake_loader).start()
+    try:
+        pid = int(pool.embed(["a"])[0, 1])
+        os.kill(pid, signal.SIGKILL)
+        with pytest.raises(ModelWorkerError):
+            pool.embed(["a"])
+        assert _wait_for(lambda: pool._idle.qsize() == 1)
+        assert int(pool.embed(["a"])[0, 1]) != pid
+    finally:
+        pool.close()
+
+
+def test_worker_that_fails_to_restart_is_dropped(monkeypatch):
+    pool = ModelWorkerPool(workers=1, cores=[0], loader=failing_restart_loader).start()
+    try:
+        monkeypatch.setenv("MODEL_POOL_TEST_FAIL_LOAD", "1")  # Process spawn lại kế thừa env này
+        os.kill(int(pool.embed(["a"])[0, 1]), signal.SIGKILL)
+        with pytest.raises(ModelWorkerError):
+            pool.embed(["a"])
+        assert _wait_for(lambda: pool.size == 0)
+        with pytest.raises(ModelWorkerError, match="no model workers"):
+            pool.embed(["a"])
+    finally:
+        pool.close()
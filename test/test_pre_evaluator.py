@@ -0,0 +1,75 @@
+from app.services.pre_evaluator import pre_evaluate, validate_mermaid
+
+CONTEXT = """
+[DOCUMENT 1]
+- Source: DATA_Master_Data_Rules.md
+- Content:
+FIFO
+
+[DOCUMENT 2]
+- Source: INB_Inbound.md
+- Content:
+Nhập kho
+"""
+
+GOOD_SRS = """# SRS - WMS
+## 1. Giới thiệu
+| Hạng mục | Mô tả |
+|---|---|
+| Phạm vi | Kho lạnh |
+## 2. Mô tả tổng quan
+```mermaid
+graph TD
+    A[Người dùng] --> B(API Gateway)
+    subgraph Core
+        B --> C{Kiểm tra}
+    end
+```
+## 3. Khung Workflow Framework
+Approval Engine.
+## 4. Các Module chức năng
+```mermaid
+sequenceDiagram
+    Kho->>WMS: Nhập hàng
+```
+- INB-BR-01: Nhập kho theo FIFO [Source: DATA_Master_Data_Rules.md]
+- INB-BR-02: Kiểm đếm [Source: INB_Inbound.md]
+- INB-BR-03: Dán nhãn
+## 5. Yêu cầu phi chức năng
+Hiệu năng.
+"""
+
+
+def test_complete_srs_passes_gate():
+    result = pre_evaluate(GOOD_SRS, CONTEXT, threshold=6.0)
+    assert result.checks.missing_sections == []
+    assert result.checks.mermaid_blocks == 2 and result.checks.mermaid_errors == []
+    assert result.checks.business_rules == 3
+    assert result.faithfulness == 10.0
+    assert result.passed and result.pre_score >= 9
+
+
+def test_incomplete_srs_is_gated():
+    srs = "# SRS\n## Giới thiệu\nHệ thống quản lý kho [Source: Bia_Dat.md]\n```mermaid\ngraph XY\n"
+    result = pre_evaluate(srs, CONTEXT, threshold=4.0)
+    assert len(result.checks.missing_sections) == 4
+    assert result.checks.unknown_sources == ["bia_dat.md"]
+    assert result.checks.unclosed_code_blocks == 1 and result.checks.mermaid_errors
+    assert not result.passed
+
+
+def test_validate_mermaid():
+    assert validate_mermaid("flowchart LR\n  A --> B") is None
+    assert validate_mermaid('graph TD\n  A["Label (x]"] --> B') is None
+    assert "unknown diagram type" in validate_mermaid("grahp TD\n A --> B")
+    assert "subgraph" in validate_mermaid("graph TD\n subgraph S\n A --> B")
+    assert validate_mermaid("graph TD\n A[Start --> B") is not None
+
+
+def test_validate_mermaid_only_checks_flowchart_node_shapes():
+    assert validate_mermaid("erDiagram\n CUSTOMER ||--o{ ORDER : places") is None
+    assert validate_mermaid("graph TD\n A>Flag] --> B") is None
+    assert validate_mermaid("sequenceDiagram\n A->>B: xin chào (hi") is None
+    assert validate_mermaid("graph TD\n A -->|Có (x| B{Kiểm tra}") is None
+    assert "unclosed" in validate_mermaid("graph TD\n A>Flag --> B(")
+    assert "unbalanced" in validate_mermaid("graph TD\n A(Start] --> B")
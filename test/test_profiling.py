@@ -0,0 +1,50 @@
+import time
+
+from app.utils.profiling import RequestProfiler
+
+
+def _slow_stage():
+    time.sleep(0.02)
+    return sum(i * i for i in range(20000))
+
+
+def _handler():
+    return _slow_stage()
+
+
+def test_profile_on_request_exports_folded_stacks(tmp_path):
+    profiler = RequestProfiler(str(tmp_path))
+    with profiler.maybe_profile("retrieve", requested=False) as profile_id:
+        _handler()
+    assert profile_id is None and profiler.list() == []
+
+    with profiler.maybe_profile("retrieve", requested=True, query="nhập kho") as profile_id:
+        _handler()
+    [meta] = profiler.list()
+    assert meta["id"] == profile_id and meta["trigger"] == "request" and meta["query"] == "nhập kho"
+
+    lines = profiler.folded(profile_id).splitlines()
+    stacks = {line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1]) for line in lines}
+    slow = [s for s in stacks if s.split(";")[-1].startswith("_slow_stage")]
+    assert slow and all("_handler" in s.split(";")[-2] for s in slow)
+    # Thời gian sleep nằm ở frame con của _slow_stage
+    assert sum(v for s, v in stacks.items() if "_slow_stage" in s) >= 15000
+    assert "_slow_stage" in profiler.summary(profile_id)
+
+
+def test_sampling_retention_and_id_validation(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), sample_every=3, keep=2)
+    ids = []
+    for _ in range(9):
+        with profiler.maybe_profile("generate-srs") as profile_id:
+            ids.append(profile_id)
+    captured = [i for i in ids if i]
+    assert len(captured) == 3
+    assert [m["id"] for m in profiler.list()] == captured[:0:-1]  # Chỉ giữ 2 profile mới nhất
+    assert profiler.path("../../etc/passwd") is None and profiler.folded("nope") is None
+
+    # 1 profiler / process: request trùng lúc đang profile thì bỏ qua thay vì lỗi
+    with profiler.maybe_profile("retrieve", requested=True) as outer:
+        with profiler.maybe_profile("retrieve", requested=True) as inner:
+            pass
+    assert outer and inner is None
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from app.models import FusionConfig
+from app.services.fusion import fuse
+from app.services.retrieval_eval import (
+    CandidateSet, check_chunk_targets, collect_candidates, evaluate, first_hit_rank, rank_candidates, sweep,
+    variant_grid,
+)
+
+VECTOR = [("a", 0.9), ("b", 0.8), ("c", 0.1), ("e", 0.05)]
+KEYWORD = [("c", 12.0), ("d", 3.0), ("a", 1.0)]
+RERANK = {"a": 0.2, "b": 0.9, "c": -1.0, "d": 0.5, "e": 0.0}
+
+
+def _docs(pairs, search_type):
+    return [{"id": i, "content": f"content {i}", "metadata": {"source": f"{i}.md"}, "initial_score": s,
+             "search_type": search_type} for i, s in pairs]
+
+
+class FakeRetriever:
+    class reranker:
+        @staticmethod
+        def predict(pairs):
+            return [RERANK[content.split()[-1]] for _, content in pairs]
+
+    def _semantic_search(self, query, k=10):
+        return _docs(VECTOR, "vector")[:k]
+
+    def _keyword_search(self, query, k=10):
+        return _docs(KEYWORD, "keyword")[:k]
+
+
+def _candidates(targets):
+    dataset = [{"question": "q", "ground_truth_source": "x.md", "ground_truth_chunk_ids": targets}]
+    return collect_candidates(FakeRetriever(), dataset, depth=10, level="chunk")
+
+
+def test_replay_matches_fuse_ordering():
+    cands = _candidates(["a"])
+    for config in (FusionConfig(rrf_k=10), FusionConfig(vector_weight=0.1),
+                   FusionConfig(method="score"), FusionConfig(method="convex", normalization="zscore"),
+                   FusionConfig(method="convex", keyword_weight=0.0)):
+        expected = [d["id"] for d in fuse(_docs(VECTOR, "vector"), _docs(KEYWORD, "keyword"), config)]
+        order = rank_candidates(cands, config, top_k=5, pool=5, rerank=False, vector_k=10, keyword_k=10)[0]
+        assert [cands.ids[0, j] for j in order if j >= 0] == expected[:5]
+
+    # Rerank: pool theo fusion rồi sắp lại theo điểm Cross-Encoder
+    order = rank_candidates(cands, FusionConfig(), top_k=3, pool=3, rerank=True, vector_k=10, keyword_k=10)[0]
+    assert [cands.ids[0, j] for j in order] == ["b", "a", "c"]
+
+
+def test_metrics_hand_computed():
+    cands = _candidates(["c", "d"])
+    # rrf (không rerank): a, c, b, d, e -> c ở vị trí 2, d ở vị trí 4
+    metrics = evaluate(cands, FusionConfig(), top_k=5, pool=5, rerank=False, ks=(1, 3, 5), vector_k=10, keyword_k=10)
+    assert metrics["hit@1"] == 0.0 and metrics["hit@3"] == 1.0
+    assert metrics["mrr@5"] == 0.5
+    assert metrics["recall@3"] == 0.5 and metrics["recall@5"] == 1.0
+    ideal = 1 + 1 / np.log2(3)
+    assert abs(metrics["ndcg@5"] - (1 / np.log2(3) + 1 / np.log2(5)) / ideal) < 1e-9
+
+
+def test_save_load_and_sweep(tmp_path):
+    cands = _candidates(["b"])
+    path = str(tmp_path / "cands.npz")
+    cands.save(path)
+    loaded = CandidateSet.load(path)
+    assert loaded.meta["depth"] == 10 and list(loaded.ids[0, :5]) == ["a", "b", "c", "e", "d"]
+
+    variants = variant_grid(methods=["rrf", "score"], vector_weights=[0.0, 1.0], keyword_weights=[0.0, 1.0],
+                            rrf_ks=[10, 60], reranks=[True, False])
+    assert all(v["vector_weight"] or v["keyword_weight"] for v in variants)
+    rows = sweep(loaded, variants, top_k=3, ks=(1, 3))
+    assert len(rows) == len(variants)
+    best = max(rows, key=lambda r: r["mrr@3"])
+    assert best["rerank"] and best["mrr@3"] == 1.0
+
+
+def test_first_hit_rank_matches_candidate_scoring():
+    results = [{"id": "b-0", "metadata": {"source": "rules/b.md", "duplicate_sources": "a.md"}},
+               {"id": "a-3", "metadata": {"source": "rules/a.md"}}]
+    item = {"ground_truth_source": "a.md", "ground_truth_chunk_ids": ["a-3"]}
+    # Giống collect_candidates: chỉ so khớp source (không tính duplicate_sources)
+    assert first_hit_rank(results, item, "source") == 2
+    assert first_hit_rank(results, item, "chunk") == 2
+    assert first_hit_rank(results, {"ground_truth_source": "c.md"}, "chunk") is None
+
+
+def test_check_chunk_targets_fails_when_no_id_is_indexed():
+    dataset = [{"question": "q1", "ground_truth_source": "x.md", "ground_truth_chunk_ids": ["a", "stale"]},
+               {"question": "q2", "ground_truth_source": "x.md"}]
+    rows = {"a": 0, "b": 1}
+    assert check_chunk_targets(dataset, rows.get) == 1
+    assert check_chunk_targets(dataset[1:], rows.get) == 0
+    with pytest.raises(ValueError, match="ground_truth_chunk_ids"):
+        check_chunk_targets(dataset, {"b": 1}.get)
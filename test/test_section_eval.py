@@ -0,0 +1,82 @@
+import threading
+
+from app.models import SectionEvaluation
+from app.services.section_eval import SectionedEvaluation, context_blocks, split_srs_sections
+from app.utils.sqlite_cache import SQLiteKVCache
+
+FILLER = "Nội dung chi tiết của mục. " * 20
+
+SRS = f"""# Tài liệu SRS - WMS
+
+## 1. Giới thiệu
+{FILLER}
+
+## 2. Quy trình nhập kho
+Nhập kho theo FIFO [Source: DATA_Master_Data_Rules.md].
+```mermaid
+# không phải header
+graph TD; A-->B
+```
+{FILLER}
+
+## 3. Phi chức năng
+{FILLER}
+"""
+
+CONTEXT = """
+                        [DOCUMENT 1]
+                        - Source: DATA_Master_Data_Rules.md
+                        - Relevance Score: 0.9100
+                        - Content:
+                        Hàng nhập trước xuất trước (FIFO).
+
+                        [DOCUMENT 2]
+                        - Source: Other.md
+                        - Relevance Score: 0.5000
+                        - Content:
+                        Không liên quan.
+"""
+
+
+def _result(score, faithfulness=None):
+    return SectionEvaluation.model_validate({
+        "scores": {"completeness": score, "consistency": score, "accuracy": score, "format_tone": score,
+                   "faithfulness": faithfulness},
+        "summary": "ok", "strengths": ["Rõ ràng"], "issues": [], "quick_fixes": [],
+    })
+
+
+def test_split_merges_short_sections_and_ignores_code_fences():
+    sections = split_srs_sections(SRS)
+    assert [s.title for s in sections] == ["1. Giới thiệu", "2. Quy trình nhập kho", "3. Phi chức năng"]
+    assert sections[0].content.startswith("# Tài liệu SRS")  # Tiêu đề ngắn được gộp vào mục sau
+    assert sections[1].sources == ["data_master_data_rules.md"]
+    assert set(context_blocks(CONTEXT)) == {"data_master_data_rules.md", "other.md"}
+
+
+def test_map_reduce_uses_cited_context_and_cache(tmp_path):
+    calls, lock = [], threading.Lock()
+
+    def score_fn(section, context):
+        with lock:
+            calls.append((section.title, context))
+        return _result(6.0 if section.title.startswith("2") else 8.0, faithfulness=9.0)
+
+    evaluation = SectionedEvaluation(score_fn, cache=SQLiteKVCache(str(tmp_path / "eval.sqlite3"), "t"))
+    result = evaluation.run(SRS, CONTEXT)
+
+    contexts = dict(calls)
+    assert "FIFO" in contexts["2. Quy trình nhập kho"] and "Không liên quan" not in contexts["2. Quy trình nhập kho"]
+    assert contexts["1. Giới thiệu"] == ""
+    # Faithfulness chỉ tính trên mục có trích dẫn; các tiêu chí khác trung bình theo độ dài mục
+    assert result.score.faithfulness.raw == 9.0
+    assert 6.0 < result.score.completeness.raw < 8.0
+    expected = sum(item.weighted for item in (result.score.completeness, result.score.consistency,
+                                               result.score.accuracy, result.score.format_tone,
+                                               result.score.faithfulness))
+    assert abs(result.score.total_weighted_score - expected) < 0.01
+
+    # Sinh lại 1 mục: chỉ mục đó được chấm lại
+    calls.clear()
+    evaluation.run(SRS.replace("## 3. Phi chức năng", "## 3. Yêu cầu phi chức năng"), CONTEXT)
+    assert [title for title, _ in calls] == ["3. Yêu cầu phi chức năng"]
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from app.models import FusionConfig
+from app.utils.metrics import metrics
+from app.utils.single_flight import SingleFlight, make_key
+
+
+def test_key_normalizes_whitespace_and_models():
+    assert make_key("Hệ thống  WMS\n cho kho", 5, FusionConfig()) == make_key(" Hệ thống WMS cho kho ", 5, FusionConfig())
+    assert make_key("WMS", 5, FusionConfig()) != make_key("WMS", 5, FusionConfig(keyword_weight=0))
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight("test_share")
+    calls, results = [], []
+    barrier = threading.Barrier(5)
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"docs": ["a", "b"]}
+
+    def caller():
+        barrier.wait()
+        results.append(flight.do("same-key", work))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{"docs": ["a", "b"]}] * 5
+    assert len({id(r) for r in results}) == 5  # Mỗi caller có bản riêng
+    assert metrics.counter_value("singleflight_coalesced_total", group="test_share") == 4
+    assert flight.in_flight() == 0
+
+
+def test_errors_propagate_to_followers():
+    flight = SingleFlight("test_error")
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("LLM timeout")
+
+    def follower():
+        started.wait()
+        try:
+            flight.do("k", lambda: "should not run")
+        except ValueError as e:
+            errors.append(str(e))
+
+    t = threading.Thread(target=follower)
+    t.start()
+    with pytest.raises(ValueError):
+        flight.do("k", failing)
+    t.join()
+    assert errors == ["LLM timeout"]
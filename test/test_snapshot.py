@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from app.services.snapshot import SnapshotMismatch, current_metadatas, export_snapshot, load_snapshot
+
+
+class FakeCollection:
+    name = "kb"
+
+    def __init__(self, ids, documents):
+        self.ids, self.documents = ids, documents
+        self.metadatas = [{"source": f"{doc_id}.md"} for doc_id in ids]
+
+    def get(self, limit, offset, include):
+        ids = self.ids[offset:offset + limit]
+        return {"ids": ids, "documents": self.documents[offset:offset + limit],
+                "metadatas": self.metadatas[offset:offset + limit],
+                "embeddings": [np.full(4, i + 1.0) for i in range(offset, offset + len(ids))]}
+
+
+def fake_embedding(texts):
+    return [np.arange(4, dtype=np.float32) + len(t) for t in texts]
+
+
+def test_snapshot_rejects_tampered_or_unsigned_bm25(tmp_path):
+    path = str(tmp_path / "kb.srskb")
+    collection = FakeCollection(["a", "b"], ["quy tắc nhập kho", "quy trình xuất kho"])
+    export_snapshot(collection, path, fake_embedding, key="secret")
+    assert load_snapshot(path, fake_embedding, key="secret").bm25 is not None
+    with pytest.raises(SnapshotMismatch):
+        load_snapshot(path, key="other")
+
+    header = load_snapshot(path, key="").header
+    with open(path, "r+b") as f:  # Sửa 1 byte trong phần pickle
+        f.seek(header["sections"]["bm25"]["offset"] + 10)
+        byte = f.read(1)
+        f.seek(-1, 1)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    with pytest.raises(SnapshotMismatch):
+        load_snapshot(path, key="")
+
+    export_snapshot(collection, path, fake_embedding, key="")
+    with pytest.raises(SnapshotMismatch):
+        load_snapshot(path, key="secret")
+
+
+def test_snapshot_bm25_reused_only_when_contents_match(tmp_path):
+    path = str(tmp_path / "kb.srskb")
+    collection = FakeCollection(["a", "b"], ["quy tắc nhập kho", "quy trình xuất kho"])
+    export_snapshot(collection, path, fake_embedding, key="")
+    snapshot = load_snapshot(path, key="")
+
+    collection.metadatas[0] = {"source": "renamed.md"}
+    assert current_metadatas(snapshot, collection)[0] == {"source": "renamed.md"}
+    collection.documents[1] = "quy trình xuất kho mới"  # Cùng số chunk, nội dung đổi
+    assert current_metadatas(snapshot, collection) is None
@@ -0,0 +1,51 @@
+from app.services.token_chunking import (
+    ChunkingConfig, approx_token_count, chunk_document, chunking_metadata, from_collection_metadata,
+)
+
+META = {"filename": "a.md", "path": "kb/a.md"}
+SAMPLE_MD = (
+    "# WMS\n\nTổng quan hệ thống quản lý kho.\n\n"
+    "## Nhập kho\n\n" + "Quy tắc nhập kho FIFO áp dụng cho mọi SKU. " * 30 + "\n\n"
+    "```mermaid\ngraph TD\n" + "".join(f"  N{i}[Bước {i}] --> N{i + 1}[Bước {i + 1}]\n" for i in range(12)) + "```\n\n"
+    "## Bảng quy tắc\n\n| Mã | Quy tắc |\n|---|---|\n"
+    + "".join(f"| INB-BR-{i:02d} | Kiểm tra chất lượng lô hàng số {i} trước khi putaway |\n" for i in range(40))
+)
+
+
+def _chunks(strategy, **kwargs):
+    config = ChunkingConfig(strategy=strategy, max_tokens=64, overlap_tokens=12, block_max_tokens=256, **kwargs)
+    return chunk_document(SAMPLE_MD, META, config, count=approx_token_count)
+
+
+def test_token_strategies_respect_budget_and_stable_ids():
+    for strategy in ("header", "sentence_window"):
+        chunks = _chunks(strategy)
+        assert all(m["token_count"] <= 64 for _, m in chunks)
+        assert all(m["chunk_strategy"] == strategy for _, m in chunks)
+        ids = [m["doc_id"] for _, m in chunks]
+        assert len(set(ids)) == len(ids)
+        assert ids == [m["doc_id"] for _, m in _chunks(strategy)]
+    # Strategy chars giữ nguyên chunk id của chunk_flat (index cũ không phải re-index)
+    assert _chunks("chars")[0][1]["doc_id"] == chunk_document(SAMPLE_MD, META, ChunkingConfig(strategy="chars"))[0][1]["doc_id"]
+
+
+def test_structured_never_splits_mermaid_and_repeats_table_header():
+    chunks = _chunks("structured")
+    mermaid = [c for c, m in chunks if "```mermaid" in c]
+    assert len(mermaid) == 1 and mermaid[0].rstrip().endswith("```")
+    assert mermaid[0].count("-->") == 12
+
+    tables = [c for c, m in chunks if m.get("block_type") == "table"]
+    assert len(tables) > 1  # Bảng vượt block_max_tokens -> chia theo dòng
+    assert all(t.startswith("| Mã | Quy tắc |\n|---|---|") for t in tables)
+    assert sum(t.count("INB-BR-") for t in tables) == 40
+
+
+def test_collection_metadata_round_trip():
+    config = ChunkingConfig(strategy="structured", max_tokens=100, overlap_tokens=8)
+    restored = from_collection_metadata({"hnsw:space": "cosine", **chunking_metadata(config)})
+    assert (restored.strategy, restored.max_tokens, restored.overlap_tokens) == ("structured", 100, 8)
+    assert from_collection_metadata({"hnsw:space": "cosine"}, chunk_size=500).chunk_size == 500
+
+    chars = from_collection_metadata(chunking_metadata(ChunkingConfig(strategy="chars", chunk_size=600, chunk_overlap=50)))
+    assert (chars.strategy, chars.chunk_size, chars.chunk_overlap) == ("chars", 600, 50)